@@ -0,0 +1,115 @@
+"""
+Crawler throughput against a local stand-in for the news site.
+
+Starts a threaded HTTP server on localhost that serves a front page of links
+and synthetic article pages (with ETags, an artificial per-request latency
+and an optional share of transient 503s), then reports pages/sec for:
+
+- the former serial loop (`requests.get` per link, no session),
+- the crawler on a cold run,
+- a re-run, where the frontier already knows every link and nothing is fetched,
+- a revisit, where every page is re-checked and answers 304 Not Modified.
+
+python benchmark_crawler.py --pages 500 --latency 0.05
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from extract import parse_article_content
+from scrapping_news_article import scrape
+
+
+def make_handler(pages, latency, failure_rate):
+    class StandInHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status, body=b"", headers=None):
+            self.send_response(status)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            time.sleep(latency)
+            if self.path == "/":
+                links = "".join(f'<h2><a href="/article/{n}">Story {n}</a></h2>' for n in range(pages))
+                return self._send(200, f"<html><body>{links}</body></html>".encode())
+            if not self.path.startswith("/article/"):
+                return self._send(404)
+            if random.random() < failure_rate:
+                return self._send(503, headers={"Retry-After": "0"})
+            n = self.path.rsplit("/", 1)[-1]
+            etag = f'"v1-{n}"'
+            if self.headers.get("If-None-Match") == etag:
+                return self._send(304, headers={"ETag": etag})
+            paragraphs = "".join(f"<p>Paragraph {i} of story {n}.</p>" for i in range(20))
+            body = f"<html><body><article>{paragraphs}</article></body></html>".encode()
+            self._send(200, body, {"ETag": etag, "Content-Type": "text/html"})
+
+    return StandInHandler
+
+
+def serial_crawl(url, pages):
+    rows = []
+    for n in range(pages):
+        response = requests.get(f"{url}article/{n}", headers={"User-Agent": "Mozilla/5.0"})
+        if response.status_code == 200:
+            rows.append(parse_article_content(response.content))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds the server waits per request.")
+    parser.add_argument("--failure-rate", type=float, default=0.02, help="Share of article requests answered 503.")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--per-host", type=int, default=16)
+    parser.add_argument("--serial-pages", type=int, default=100, help="Pages fetched by the serial baseline.")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(args.pages, args.latency, args.failure_rate))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/"
+
+    try:
+        if args.serial_pages:
+            started = time.perf_counter()
+            serial_crawl(url, args.serial_pages)
+            seconds = time.perf_counter() - started
+            print(f"{'serial':>8} {args.serial_pages:>6} pages {seconds:>7.2f}s {args.serial_pages / seconds:>8.1f} pages/sec")
+
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, "scraped_news.csv")
+            state = os.path.join(directory, "crawl_frontier.sqlite3")
+            for run, revisit_after in (("cold", None), ("re-run", None), ("revisit", 0)):
+                started = time.perf_counter()
+                stats = scrape(url, output, state, workers=args.workers, per_host=args.per_host,
+                               revisit_after=revisit_after)
+                stats["seconds"] = time.perf_counter() - started
+                rate = args.pages / stats["seconds"]
+                print(
+                    f"{run:>8} {args.pages:>6} links {stats['seconds']:>7.2f}s {rate:>8.1f} pages/sec "
+                    f"({stats['fetched']} fetched, {stats['not_modified']} unchanged, {stats['retries']} retries)"
+                )
+            with open(output, encoding="utf-8") as f:
+                print(f"{sum(1 for _ in f) - 1} rows written to the CSV")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
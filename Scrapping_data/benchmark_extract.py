@@ -0,0 +1,179 @@
+"""
+Speed and output parity of the streaming extractors (extract.py) against the
+former BeautifulSoup functions, over a corpus of saved HTML pages.
+
+Pages are read from --corpus (front pages are files whose name starts with
+"front", everything else is treated as an article page). Without a corpus, or
+with --generate, synthetic pages shaped like news pages (navigation, scripts,
+nested markup, entities, unclosed tags) are written there first. A quarter of
+the article pages are longer than extract.FEED_SIZE, so their text crosses
+the boundaries of the pieces they are parsed in.
+
+python benchmark_extract.py --corpus html_corpus --generate 300
+"""
+
+import argparse
+import os
+import random
+import time
+
+import requests
+from bs4 import BeautifulSoup
+
+from extract import FEED_SIZE, extract_many, parse_article_content, parse_headlines_and_links
+
+
+def soup_headlines_and_links(html, url):
+    soup = BeautifulSoup(html, "html.parser")
+    headlines = []
+    for h2 in soup.find_all("h2"):
+        headline_text = h2.get_text(strip=True)
+        link = h2.find("a")
+        if link and "href" in link.attrs:
+            link = link["href"]
+            if not link.startswith("http"):
+                link = requests.compat.urljoin(url, link)
+            headlines.append({"headline": headline_text, "link": link})
+    return headlines
+
+
+def soup_article_content(html):
+    soup = BeautifulSoup(html, "html.parser")
+    article_body = soup.find("article") or soup.find("div", class_="main-content")
+    if article_body:
+        para = article_body.find_all("p")
+        content = " ".join([p.get_text(strip=True) for p in para])
+        return content.strip()
+    return None
+
+
+WORDS = ("the president said on tuesday that officials would review market rates after "
+         "storm season election campaign court ruling health policy report city council").split()
+
+
+def sentence(rng, n=18):
+    words = [rng.choice(WORDS) for _ in range(n)]
+    # Inline markup, entities and odd whitespace, as in real article bodies.
+    position = rng.randrange(n)
+    words[position] = rng.choice([
+        f'<a href="/topic/{words[position]}">{words[position]}</a>',
+        f"<em>{words[position]}</em>",
+        f"<strong>\n  {words[position]} </strong>",
+        f"{words[position]} &amp; co&rsquo;s",
+        f"{words[position]}<br>",
+    ])
+    return " ".join(words).capitalize() + "."
+
+
+def boilerplate(rng):
+    nav = "".join(f'<li><a href="/section/{w}">{w}</a></li>' for w in rng.sample(WORDS, 12))
+    scripts = "".join(
+        f'<script type="application/json">{{"id": {rng.randrange(10 ** 6)}, "tags": ["a<b", "c"]}}</script>'
+        for _ in range(8)
+    )
+    style = "<style>p > a { color: red; } .x::after { content: '<p>'; }</style>"
+    return (f'<head><meta charset="utf-8"><title>News</title>{style}{scripts}</head>'
+            f'<body><header><nav><ul>{nav}</ul></nav></header><!-- <article>ad</article> -->')
+
+
+def article_page(rng):
+    paragraphs = "".join(
+        rng.choice(["<p>{}</p>", "<p class='body'>{}</p>", "<p>{}", "<p><span>{}</span></p>"]).format(
+            " ".join(sentence(rng) for _ in range(rng.randint(1, 4)))
+        )
+        for _ in range(rng.randint(8, 40))
+    )
+    related = "".join(f"<h2><a href='/story/{n}'>{sentence(rng, 6)}</a></h2><p>{sentence(rng)}</p>"
+                      for n in range(rng.randint(3, 10)))
+    if rng.random() < 0.9:
+        body = f"<main><article><h1>{sentence(rng, 8)}</h1><div>{paragraphs}</div></article></main>"
+    else:
+        body = f'<div class="layout main-content">{paragraphs}</div>'
+    footer = "".join(f"<p>{sentence(rng)}</p>" for _ in range(5))
+    return f"<!DOCTYPE html><html>{boilerplate(rng)}{body}<aside>{related}</aside><footer>{footer}</footer></body></html>"
+
+
+def long_article_page(rng):
+    # A large inline script (analytics, page state), then an article longer
+    # than one FEED_SIZE piece.
+    script = f'<script>window.__STATE__ = "{"x" * rng.randint(FEED_SIZE // 2, 2 * FEED_SIZE)}";</script>'
+    paragraphs = "".join(f"<p>{' '.join(sentence(rng) for _ in range(3))}</p>" for _ in range(60))
+    return (f"<!DOCTYPE html><html>{boilerplate(rng)}{script}"
+            f"<main><article>{paragraphs}</article></main></body></html>")
+
+
+def front_page(rng):
+    items = []
+    for n in range(rng.randint(80, 200)):
+        headline = sentence(rng, 8)
+        items.append(rng.choice([
+            f'<h2><a href="/story/{n}">{headline}</a></h2>',
+            f'<h2 class="tease"><span>Live</span> <a href="https://example.com/story/{n}">{headline}</a></h2>',
+            f"<h2>{headline}</h2>",
+            f'<h2><a name="anchor{n}">{headline}</a><a href="/story/{n}">more</a></h2>',
+            f'<div class="card"><h2><a href="story/{n}?ref=home&amp;x=1">{headline}</a></h2><p>{sentence(rng)}</p></div>',
+        ]))
+    return f"<!DOCTYPE html><html>{boilerplate(rng)}<main>{''.join(items)}</main></body></html>"
+
+
+def generate(corpus, count, seed):
+    rng = random.Random(seed)
+    os.makedirs(corpus, exist_ok=True)
+    for n in range(max(1, count // 20)):
+        with open(os.path.join(corpus, f"front-{n}.html"), "w", encoding="utf-8") as f:
+            f.write(front_page(rng))
+    for n in range(count):
+        with open(os.path.join(corpus, f"article-{n}.html"), "w", encoding="utf-8") as f:
+            f.write(long_article_page(rng) if n % 4 == 3 else article_page(rng))
+
+
+def timed(function, pages):
+    started = time.perf_counter()
+    results = [function(page) for page in pages]
+    return results, time.perf_counter() - started
+
+
+def report(name, pages, seconds, baseline=None):
+    rate = len(pages) / seconds
+    speedup = f" ({baseline / seconds:.1f}x)" if baseline else ""
+    megabytes = sum(len(page) for page in pages) / 2 ** 20
+    print(f"{name:>28} {len(pages):>6} pages {seconds:>7.2f}s {rate:>8.1f} pages/sec "
+          f"{megabytes / seconds:>6.1f} MiB/s{speedup}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default="html_corpus")
+    parser.add_argument("--generate", type=int, default=0, help="Write this many synthetic article pages first.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.generate or not os.path.isdir(args.corpus):
+        generate(args.corpus, args.generate or 300, args.seed)
+    fronts, articles = [], []
+    for name in sorted(os.listdir(args.corpus)):
+        with open(os.path.join(args.corpus, name), "rb") as f:
+            (fronts if name.startswith("front") else articles).append(f.read())
+
+    url = "https://www.example.com/"
+    old, old_seconds = timed(lambda page: soup_headlines_and_links(page, url), fronts)
+    new, new_seconds = timed(lambda page: parse_headlines_and_links(page, url), fronts)
+    report("front pages, BeautifulSoup", fronts, old_seconds)
+    report("front pages, streaming", fronts, new_seconds, old_seconds)
+    mismatched = sum(a != b for a, b in zip(old, new))
+    print(f"{mismatched} of {len(fronts)} front pages differ ({sum(map(len, new))} headlines)")
+
+    old, old_seconds = timed(soup_article_content, articles)
+    new, new_seconds = timed(parse_article_content, articles)
+    report("articles, BeautifulSoup", articles, old_seconds)
+    report("articles, streaming", articles, new_seconds, old_seconds)
+    started = time.perf_counter()
+    pooled = extract_many(articles, args.workers)
+    report(f"articles, {args.workers} processes", articles, time.perf_counter() - started, old_seconds)
+    mismatched = sum(a != b for a, b in zip(old, new)) + sum(a != b for a, b in zip(old, pooled))
+    print(f"{mismatched} of {len(articles)} article pages differ")
+
+
+if __name__ == "__main__":
+    main()
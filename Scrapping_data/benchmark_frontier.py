@@ -0,0 +1,55 @@
+"""
+Crawl frontier lookup throughput at scale.
+
+Seeds a frontier with N fetched URLs, then times `unseen()` on batches of
+front-page-sized link lists where half the links are already known.
+
+python benchmark_frontier.py --urls 1000000
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from frontier import Frontier
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--urls", type=int, default=1000000)
+    parser.add_argument("--batch", type=int, default=200, help="Links per unseen() call (one front page).")
+    parser.add_argument("--batches", type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        frontier = Frontier(os.path.join(directory, "crawl_frontier.sqlite3"))
+
+        started = time.perf_counter()
+        frontier.add_many(f"https://www.example.com/news/story-{n}" for n in range(args.urls))
+        seconds = time.perf_counter() - started
+        print(f"seeded {len(frontier):,} urls in {seconds:.2f}s ({args.urls / seconds:,.0f} urls/sec)")
+        print(f"frontier file {os.path.getsize(frontier.path) / 2 ** 20:.1f} MiB")
+
+        rng = random.Random(0)
+        new = 0
+        started = time.perf_counter()
+        for batch in range(args.batches):
+            links = [
+                f"https://www.example.com/news/story-{rng.randrange(args.urls)}" if i % 2
+                else f"https://www.example.com/news/new-{batch}-{i}"
+                for i in range(args.batch)
+            ]
+            new += len(frontier.unseen(links))
+        seconds = time.perf_counter() - started
+        looked_up = args.batch * args.batches
+        print(
+            f"looked up {looked_up:,} links in {seconds:.2f}s ({looked_up / seconds:,.0f} links/sec, "
+            f"{seconds / args.batches * 1000:.2f} ms per {args.batch}-link page), {new:,} new"
+        )
+        frontier.close()
+
+
+if __name__ == "__main__":
+    main()
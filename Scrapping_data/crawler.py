@@ -0,0 +1,227 @@
+"""
+Concurrent, polite HTTP crawler for the news scraper.
+
+Pages are fetched by a bounded thread pool over one pooled `requests.Session`
+(keep-alive connections are reused across requests). Each host gets its own
+concurrency limit and minimum delay between requests, failed requests are
+retried with exponential backoff (honouring `Retry-After`), and ETag /
+Last-Modified validators are replayed as conditional requests so pages that
+have not changed come back as `304 Not Modified` and are skipped.
+
+Results are handed to a callback as soon as each page arrives; `CsvSink`
+appends and flushes every row, and a page is recorded in the frontier
+(frontier.py) only after its row is written, so a crash loses nothing and a
+re-run resumes where it stopped.
+
+The fetch layer is pluggable: anything with `fetch(url, headers)` returning a
+`FetchResult` can replace `RequestsFetcher`, e.g. to run against a local
+stand-in server (see benchmark_crawler.py).
+"""
+import csv
+import os
+import random
+import threading
+import time
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+USER_AGENT = "Mozilla/5.0"
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+FetchResult = namedtuple('FetchResult', ['url', 'status', 'headers', 'content'])
+
+
+class RequestsFetcher:
+    """Fetch pages with one pooled, keep-alive `requests.Session`."""
+
+    def __init__(self, pool_size=32, timeout=(5, 20), user_agent=USER_AGENT):
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers['User-Agent'] = user_agent
+
+    def fetch(self, url, headers=None):
+        response = self.session.get(url, headers=headers, timeout=self.timeout)
+        return FetchResult(response.url, response.status_code, response.headers, response.content)
+
+    def close(self):
+        self.session.close()
+
+
+class HostLimiter:
+    """At most `per_host` requests in flight per host, started at least `delay` seconds apart."""
+
+    def __init__(self, per_host=2, delay=0.0):
+        self.delay = delay
+        self._slots = defaultdict(lambda: threading.BoundedSemaphore(per_host))
+        self._next_start = defaultdict(float)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def slot(self, host):
+        with self._lock:
+            semaphore = self._slots[host]
+        with semaphore:
+            if self.delay:
+                with self._lock:
+                    start = max(time.monotonic(), self._next_start[host])
+                    self._next_start[host] = start + self.delay
+                time.sleep(max(0.0, start - time.monotonic()))
+            yield
+
+
+class CsvSink:
+    """Append rows to a CSV file as they arrive, skipping rows already written."""
+
+    def __init__(self, path, fieldnames, key_fields=None):
+        self.key_fields = key_fields or fieldnames
+        self._lock = threading.Lock()
+        self._seen = set()
+        exists = os.path.exists(path) and os.path.getsize(path) > 0
+        if exists:
+            with open(path, newline='', encoding='utf-8') as existing:
+                reader = csv.DictReader(existing)
+                fieldnames = reader.fieldnames
+                self._seen = {self._key(row) for row in reader}
+        self._file = open(path, 'a', newline='', encoding='utf-8')
+        self._writer = csv.DictWriter(self._file, fieldnames=fieldnames, extrasaction='ignore')
+        if not exists:
+            self._writer.writeheader()
+            self._file.flush()
+
+    def _key(self, row):
+        return tuple(row.get(field) for field in self.key_fields)
+
+    def write(self, row):
+        """Write and flush `row`; returns False if an identical row was already written."""
+        key = self._key(row)
+        with self._lock:
+            if key in self._seen:
+                return False
+            self._seen.add(key)
+            self._writer.writerow(row)
+            self._file.flush()
+        return True
+
+    def close(self):
+        self._file.close()
+
+
+def retry_after(headers, default):
+    value = headers.get('Retry-After')
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
+
+
+class Crawler:
+    """
+    Fetch many URLs concurrently and politely.
+
+    Args:
+        fetcher: Object with `fetch(url, headers) -> FetchResult`; defaults to
+            a `RequestsFetcher`.
+        workers (int): Threads fetching in parallel across all hosts.
+        per_host (int): Requests in flight per host.
+        delay (float): Minimum seconds between request starts on one host.
+        retries (int): Extra attempts after a network error or a 429/5xx.
+        backoff (float): Base of the exponential backoff, in seconds.
+        frontier (frontier.Frontier): Validators for conditional requests, and
+            where fetched pages are recorded; None disables both.
+    """
+
+    def __init__(self, fetcher=None, workers=8, per_host=2, delay=0.0, retries=3, backoff=0.5,
+                 frontier=None):
+        self.fetcher = fetcher or RequestsFetcher(pool_size=workers)
+        self.workers = workers
+        self.limiter = HostLimiter(per_host, delay)
+        self.retries = retries
+        self.backoff = backoff
+        self.frontier = frontier
+        self.stats = dict.fromkeys(
+            ['fetched', 'not_modified', 'errors', 'retries', 'retried_status', 'handle_errors'], 0
+        )
+        self._stats_lock = threading.Lock()
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def fetch(self, url, conditional=True):
+        """Fetch one URL with retries; returns a `FetchResult`, or None if every attempt failed."""
+        headers = self.frontier.conditional_headers(url) if conditional and self.frontier is not None else {}
+        host = urlsplit(url).netloc
+        for attempt in range(self.retries + 1):
+            wait = self.backoff * (2 ** attempt) * (0.5 + random.random())
+            try:
+                with self.limiter.slot(host):
+                    result = self.fetcher.fetch(url, headers)
+            except requests.RequestException as e:
+                self._count('errors')
+                if attempt == self.retries:
+                    print(f"error while fetching {url} : {e}")
+                    return None
+            else:
+                if result.status not in RETRY_STATUSES:
+                    self._count('not_modified' if result.status == 304 else 'fetched')
+                    return result
+                self._count('retried_status')
+                if attempt == self.retries:
+                    return result
+                wait = retry_after(result.headers, wait)
+            self._count('retries')
+            time.sleep(wait)
+
+    def _visit(self, url, handle):
+        result = self.fetch(url)
+        if result is None or result.status not in (200, 304):
+            return result
+        if result.status == 200:
+            try:
+                handle(url, result)
+            except Exception as e:
+                self._count('handle_errors')
+                print(f"error while handling {url} : {e}")
+                return result
+        # Only record the page once it has been handled, so a crash before the
+        # row is written refetches it next time.
+        if self.frontier is not None:
+            self.frontier.record(url, result)
+        return result
+
+    def crawl(self, urls, handle):
+        """
+        Fetch `urls` concurrently and call `handle(url, result)` for every
+        changed `200` response (in the fetching thread). Returns the stats dict.
+        """
+        started = time.perf_counter()
+        urls = list(dict.fromkeys(urls))
+        with ThreadPoolExecutor(self.workers) as executor:
+            futures = [executor.submit(self._visit, url, handle) for url in urls]
+            for future in as_completed(futures):
+                future.result()
+        self.stats['seconds'] = time.perf_counter() - started
+        self.stats['pages'] = len(urls)
+        return dict(self.stats)
+
+    def close(self):
+        if hasattr(self.fetcher, 'close'):
+            self.fetcher.close()
+        if self.frontier is not None:
+            self.frontier.close()
@@ -0,0 +1,269 @@
+"""
+Streaming extraction of headlines and article text.
+
+Instead of building a full BeautifulSoup tree of every page, these parsers
+subclass the standard library's `html.parser.HTMLParser` and only keep what
+the scraper writes out: the text and first link of each `<h2>` on the front
+page, and the `<p>` text inside an article page's `<article>` (or, failing
+that, its `<div class="main-content">`). Open tags are tracked on a stack
+that closes elements the way BeautifulSoup's `html.parser` builder does, so
+the output matches the tree-based functions, and article pages stop being
+parsed as soon as the `<article>` element ends.
+
+Parsing is CPU-bound; `extract_many` spreads a batch of pages over a process
+pool, and `ParserPool` lets the crawler's fetch threads hand pages to one.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+
+from bs4.dammit import UnicodeDammit
+
+# Elements that never have children or an end tag.
+VOID_ELEMENTS = frozenset({
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param", "source",
+    "track", "wbr", "basefont", "bgsound", "command", "frame", "image", "isindex", "keygen",
+    "menuitem", "nextid", "spacer",
+})
+
+# Their text is not part of BeautifulSoup's get_text().
+HIDDEN_TEXT_ELEMENTS = frozenset({"script", "style", "template"})
+
+# Article pages are fed in pieces of this many characters, so parsing can stop
+# once the article has been read.
+FEED_SIZE = 16384
+
+
+def decode(html):
+    """`html` as text, detecting the encoding of bytes like BeautifulSoup does."""
+    if isinstance(html, str):
+        return html
+    return UnicodeDammit(html, is_html=True).unicode_markup or ""
+
+
+class _ElementParser(HTMLParser):
+    """HTMLParser that keeps a stack of open elements, closed like BeautifulSoup's builder."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.stack = []
+        self._hidden = 0
+        # Pieces of the current text node: HTMLParser splits text at the end of
+        # every fed chunk, BeautifulSoup joins it back into one string.
+        self._text = []
+
+    def _flush_text(self):
+        if self._text:
+            data = "".join(self._text)
+            self._text = []
+            self.handle_text(data)
+
+    def handle_starttag(self, tag, attrs):
+        self._flush_text()
+        element = self.open_element(tag, dict((name, value or "") for name, value in attrs))
+        if tag in VOID_ELEMENTS:
+            self.close_element(tag, element)
+        else:
+            self.stack.append((tag, element))
+            self._hidden += tag in HIDDEN_TEXT_ELEMENTS
+
+    def handle_startendtag(self, tag, attrs):
+        self._flush_text()
+        element = self.open_element(tag, dict((name, value or "") for name, value in attrs))
+        self.close_element(tag, element)
+
+    def handle_endtag(self, tag):
+        self._flush_text()
+        # An end tag closes the innermost open element of that name and every
+        # element opened inside it; stray end tags are ignored.
+        for position in range(len(self.stack) - 1, -1, -1):
+            if self.stack[position][0] == tag:
+                break
+        else:
+            return
+        self._pop_to(position)
+
+    def _pop_to(self, position):
+        while len(self.stack) > position:
+            name, element = self.stack.pop()
+            self._hidden -= name in HIDDEN_TEXT_ELEMENTS
+            self.close_element(name, element)
+
+    def handle_data(self, data):
+        if not self._hidden:
+            self._text.append(data)
+
+    def handle_comment(self, data):
+        self._flush_text()
+
+    def handle_decl(self, decl):
+        self._flush_text()
+
+    def handle_pi(self, data):
+        self._flush_text()
+
+    def unknown_decl(self, data):
+        # A CDATA section is a string of its own.
+        self._flush_text()
+        if data.startswith("CDATA[") and not self._hidden:
+            self.handle_text(data[len("CDATA["):])
+
+    def close(self):
+        super().close()
+        self._flush_text()
+        # Elements still open at the end of the document end there.
+        self._pop_to(0)
+
+    def handle_text(self, data):
+        pass
+
+    def open_element(self, tag, attrs):
+        return None
+
+    def close_element(self, tag, element):
+        pass
+
+
+class HeadlineParser(_ElementParser):
+    """Collects `{"headline", "link"}` for every `<h2>` containing an `<a href>`."""
+
+    def __init__(self, base_url):
+        super().__init__()
+        self.base_url = base_url
+        self.headlines = []
+        self._open = []
+
+    def open_element(self, tag, attrs):
+        if tag == "h2":
+            entry = {"text": [], "link": None, "seen_link": False, "order": len(self.headlines)}
+            # Reserve the slot now so nested headlines keep document order.
+            self.headlines.append(None)
+            self._open.append(entry)
+            return entry
+        if tag == "a":
+            for entry in self._open:
+                if not entry["seen_link"]:
+                    entry["seen_link"] = True
+                    entry["link"] = attrs.get("href")
+        return None
+
+    def close_element(self, tag, element):
+        if element is None:
+            return
+        self._open.remove(element)
+        link = element["link"]
+        if link is not None:
+            if not link.startswith("http"):
+                link = urljoin(self.base_url, link)
+            self.headlines[element["order"]] = {"headline": "".join(element["text"]), "link": link}
+
+    def handle_text(self, data):
+        if self._open:
+            data = data.strip()
+            if data:
+                for entry in self._open:
+                    entry["text"].append(data)
+
+
+class ArticleParser(_ElementParser):
+    """Collects the `<p>` texts of the first `<article>`, else of the first `div.main-content`."""
+
+    def __init__(self):
+        super().__init__()
+        self.article = None
+        self.main_content = None
+        self.done = False
+        self._containers = []
+        self._paragraphs = []
+
+    def open_element(self, tag, attrs):
+        if tag == "article" and self.article is None:
+            self.article = {"paragraphs": []}
+            self._containers.append(self.article)
+            return self.article
+        if (tag == "div" and self.main_content is None and self.article is None
+                and "main-content" in attrs.get("class", "").split()):
+            self.main_content = {"paragraphs": []}
+            self._containers.append(self.main_content)
+            return self.main_content
+        if tag == "p" and self._containers:
+            paragraph = []
+            for container in self._containers:
+                container["paragraphs"].append(paragraph)
+            self._paragraphs.append(paragraph)
+            return paragraph
+        return None
+
+    def close_element(self, tag, element):
+        if element is None:
+            return
+        if tag == "p":
+            self._paragraphs.remove(element)
+        else:
+            self._containers.remove(element)
+            if element is self.article:
+                self.done = True
+
+    def handle_text(self, data):
+        if self._paragraphs:
+            data = data.strip()
+            if data:
+                for paragraph in self._paragraphs:
+                    paragraph.append(data)
+
+    def content(self):
+        body = self.article or self.main_content
+        if body is None:
+            return None
+        return " ".join("".join(paragraph) for paragraph in body["paragraphs"]).strip()
+
+
+def parse_headlines_and_links(html, url):
+    """`[{"headline", "link"}]` for each `<h2>` on the page that contains a link."""
+    parser = HeadlineParser(url)
+    parser.feed(decode(html))
+    parser.close()
+    return [headline for headline in parser.headlines if headline is not None]
+
+
+def parse_article_content(html):
+    """Text of the article's paragraphs, or None if the page has no article body."""
+    html = decode(html)
+    parser = ArticleParser()
+    for start in range(0, len(html), FEED_SIZE):
+        parser.feed(html[start:start + FEED_SIZE])
+        if parser.done:
+            break
+    else:
+        parser.close()
+    return parser.content()
+
+
+def extract_many(pages, workers=None, chunksize=16):
+    """`parse_article_content` of every page in `pages`, on `workers` processes (0 = in-process)."""
+    if workers == 0:
+        return [parse_article_content(page) for page in pages]
+    with ProcessPoolExecutor(workers) as executor:
+        return list(executor.map(parse_article_content, pages, chunksize=chunksize))
+
+
+class ParserPool:
+    """
+    Process pool for parsing pages handed over by fetch threads.
+
+    `parse_article_content` blocks the calling thread (not the GIL) until a
+    worker process returns, so the crawler's threads keep fetching while
+    pages are parsed in parallel. With `workers=0` pages are parsed inline.
+    """
+
+    def __init__(self, workers=None):
+        self.executor = ProcessPoolExecutor(workers) if workers != 0 else None
+
+    def parse_article_content(self, html):
+        if self.executor is None:
+            return parse_article_content(html)
+        return self.executor.submit(parse_article_content, html).result()
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
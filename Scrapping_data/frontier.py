@@ -0,0 +1,121 @@
+"""
+Persistent crawl frontier: every URL the scraper has fetched, when, and what it got.
+
+Rows live in a local sqlite file keyed by a 64-bit BLAKE2b hash of the URL (an
+INTEGER PRIMARY KEY, so lookups are a rowid B-tree probe). For each URL the
+frontier keeps when it was first seen and last fetched, a SHA-1 fingerprint of
+the body and the ETag / Last-Modified validators. Re-crawls ask `unseen()`
+which links are new (or due for a revisit) and fetch only those; revisits send
+conditional requests built from the stored validators.
+
+`Frontier` implements the `conditional_headers` / `record` interface that
+`crawler.Crawler` expects from its `frontier` argument.
+"""
+import hashlib
+import sqlite3
+import threading
+import time
+
+# sqlite caps the number of bound parameters per statement.
+LOOKUP_CHUNK = 500
+
+
+def url_key(url):
+    return int.from_bytes(hashlib.blake2b(url.encode("utf-8"), digest_size=8).digest(), "big", signed=True)
+
+
+class Frontier:
+    """URL -> last fetch, body fingerprint and validators, with one sqlite connection per thread."""
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS urls ("
+                "key INTEGER PRIMARY KEY, url TEXT NOT NULL, first_seen REAL NOT NULL, "
+                "last_fetched REAL NOT NULL, fingerprint TEXT, etag TEXT, last_modified TEXT)"
+            )
+            self._local.connection = connection
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM urls").fetchone()[0]
+
+    def unseen(self, urls, revisit_after=None):
+        """
+        The URLs in `urls` never fetched before, plus those last fetched more
+        than `revisit_after` seconds ago, in input order.
+        """
+        urls = list(dict.fromkeys(urls))
+        keys = [url_key(url) for url in urls]
+        cutoff = time.time() - revisit_after if revisit_after is not None else None
+        fresh = set()
+        connection = self._connection()
+        for start in range(0, len(keys), LOOKUP_CHUNK):
+            chunk = keys[start:start + LOOKUP_CHUNK]
+            placeholders = ",".join("?" * len(chunk))
+            query = f"SELECT key FROM urls WHERE key IN ({placeholders})"
+            params = list(chunk)
+            if cutoff is not None:
+                query += " AND last_fetched >= ?"
+                params.append(cutoff)
+            fresh.update(key for (key,) in connection.execute(query, params))
+        return [url for url, key in zip(urls, keys) if key not in fresh]
+
+    def conditional_headers(self, url):
+        row = self._connection().execute(
+            "SELECT etag, last_modified FROM urls WHERE key = ?", (url_key(url),)
+        ).fetchone()
+        if row is None:
+            return {}
+        headers = {}
+        if row[0]:
+            headers["If-None-Match"] = row[0]
+        if row[1]:
+            headers["If-Modified-Since"] = row[1]
+        return headers
+
+    def record(self, url, result):
+        """Remember that `url` was fetched now; `result` is the crawler's FetchResult (200 or 304)."""
+        now = time.time()
+        connection = self._connection()
+        if result.status == 304:
+            connection.execute("UPDATE urls SET last_fetched = ? WHERE key = ?", (now, url_key(url)))
+            return
+        connection.execute(
+            "INSERT INTO urls (key, url, first_seen, last_fetched, fingerprint, etag, last_modified) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET last_fetched = excluded.last_fetched, "
+            "fingerprint = excluded.fingerprint, etag = excluded.etag, last_modified = excluded.last_modified",
+            (url_key(url), url, now, now, hashlib.sha1(result.content).hexdigest(),
+             result.headers.get("ETag"), result.headers.get("Last-Modified")),
+        )
+
+    def add_many(self, urls, fetched_at=None):
+        """Mark many URLs as fetched in one transaction (e.g. to seed the frontier)."""
+        fetched_at = fetched_at or time.time()
+        connection = self._connection()
+        connection.execute("BEGIN")
+        connection.executemany(
+            "INSERT OR IGNORE INTO urls (key, url, first_seen, last_fetched) VALUES (?, ?, ?, ?)",
+            ((url_key(url), url, fetched_at, fetched_at) for url in urls),
+        )
+        connection.execute("COMMIT")
+
+    def close(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            connection.close()
+        self._local = threading.local()
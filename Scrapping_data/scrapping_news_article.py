@@ -1,70 +1,77 @@
 """
 pip install beautifulsoup4
 pip install requests
-pip install pandas
 
-By using requests to fetch webpage and beautifulsoup to parse HTML.
-Scrapping from nbc news
+By using requests to fetch webpage and a streaming HTML parser (extract.py)
+to pull headlines and article text. Scrapping from nbc news
+
+Article pages are fetched concurrently by crawler.Crawler (pooled session,
+per-host limits, retries, conditional requests) and every article is appended
+to scraped_news.csv as soon as it is parsed. Fetched links are remembered in
+crawl_frontier.sqlite3, so a re-run only fetches links it has not seen; with
+--revisit-after, older links are re-checked with conditional requests.
+Article pages are parsed on a pool of --parse-workers processes.
 """
 
-import requests
-from bs4 import BeautifulSoup
-import pandas as pd
+import argparse
 import os
 
-
-def scrape_headlines_and_link(url):
-    try:
-        response = requests.get(url, headers={"User-Agent": "Mozilla/5.0"})
-        print(f"The response code is {response.status_code}")
-        soup = BeautifulSoup(response.content, "html.parser")
-        headlines = []
-        for h2 in soup.find_all("h2"):
-            headline_text = h2.get_text(strip=True)
-            link = h2.find("a")
-            if link and "href" in link.attrs:
-                link = link["href"]
-                if not link.startswith("http"):
-                    link = requests.compat.urljoin(url, link)
-                headlines.append({"headline": headline_text, "link": link})
-        return headlines
-    except Exception as e:
-        print(f"error while scrapping {url} : {e}")
-        return []
+from crawler import Crawler, CsvSink
+from extract import ParserPool, parse_headlines_and_links
+from frontier import Frontier
 
 
-def scrape_article_content(article_url):
+def scrape(url, output, state, workers=8, per_host=4, delay=0.0, revisit_after=None, fetcher=None,
+           parse_workers=0):
+    frontier = Frontier(state)
+    parsers = ParserPool(parse_workers)
+    crawler = Crawler(fetcher=fetcher, workers=workers, per_host=per_host, delay=delay, frontier=frontier)
+    sink = CsvSink(output, ["headline", "content"])
     try:
-        response = requests.get(article_url, headers={"User-Agent": "Mozilla/5.0"})
-        soup = BeautifulSoup(response.content, "html.parser")
-        article_body = soup.find("article") or soup.find("div", class_="main-content")
-        if article_body:
-            para = article_body.find_all("p")
-            content = " ".join([p.get_text(strip=True) for p in para])
-            return content.strip()
-        return None
-    except Exception as e:
-        print(f"Error scraping article {article_url}: {e}")
-        return None
+        print(f"Scraping headlines from: {url}")
+        front_page = crawler.fetch(url, conditional=False)
+        if front_page is None or front_page.status != 200:
+            print(f"could not fetch {url}")
+            return {}
+        print(f"The response code is {front_page.status}")
+
+        headline_by_link = {}
+        for item in parse_headlines_and_links(front_page.content, url):
+            headline_by_link.setdefault(item["link"], item["headline"])
 
+        def save_article(link, result):
+            content = parsers.parse_article_content(result.content)
+            if content:
+                sink.write({"headline": headline_by_link[link], "content": content})
 
-url = "https://www.nbcnews.com/"
-data = []
-processed_items = set()
+        links = frontier.unseen(headline_by_link, revisit_after)
+        print(f"{len(links)} of {len(headline_by_link)} links are new or due for a revisit")
+        stats = crawler.crawl(links, save_article)
+    finally:
+        sink.close()
+        crawler.close()
+        parsers.close()
+    return stats
 
-print(f"Scraping headlines from: {url}")
-h_l = scrape_headlines_and_link(url)
-for item in h_l:
-    identifier = (item["headline"], item["link"])
-    if identifier not in processed_items:
-        processed_items.add(identifier)
-        print(f"Scraping article: {item['link']}")
-        content = scrape_article_content(item["link"])
-        if content:
-            data.append({"headline": item["headline"], "content": content})
 
-df = pd.DataFrame(data)
-df.drop_duplicates(subset=["headline", "content"], inplace=True)
-df.to_csv("scraped_news.csv", index=False)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrape NBC News headlines and articles.")
+    parser.add_argument("--url", default="https://www.nbcnews.com/")
+    parser.add_argument("--output", default="scraped_news.csv")
+    parser.add_argument("--state", default="crawl_frontier.sqlite3")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--per-host", type=int, default=4)
+    parser.add_argument("--delay", type=float, default=0.0,
+                        help="Minimum seconds between requests to the same host.")
+    parser.add_argument("--revisit-after", type=float, default=None,
+                        help="Re-check links last fetched more than this many seconds ago.")
+    parser.add_argument("--parse-workers", type=int, default=os.cpu_count(),
+                        help="Processes parsing article pages; 0 parses in the fetching threads.")
+    args = parser.parse_args()
 
-print(f"Data saved to {os.path.join(os.getcwd(), 'scraped_news.csv')}")
+    stats = scrape(args.url, args.output, args.state, args.workers, args.per_host, args.delay,
+                   args.revisit_after, parse_workers=args.parse_workers)
+    if stats:
+        print(f"{stats['fetched']} fetched, {stats['not_modified']} unchanged, "
+              f"{stats['errors']} errors in {stats['seconds']:.1f}s")
+    print(f"Data saved to {os.path.join(os.getcwd(), args.output)}")
@@ -0,0 +1,41 @@
+"""
+Output parity of the streaming extractors with the BeautifulSoup functions
+they replaced.
+
+python -m unittest test_extract
+"""
+
+import random
+import unittest
+
+from benchmark_extract import article_page, long_article_page, soup_article_content
+from extract import FEED_SIZE, parse_article_content
+
+
+class ArticleContentTests(unittest.TestCase):
+
+    def test_text_across_feed_boundary(self):
+        # The page is fed in FEED_SIZE pieces; this text node spans the first boundary.
+        prefix = "<html><body><article><p>"
+        text = "word " * (FEED_SIZE // 5 + 100)
+        html = f"{prefix}{text}</p><p>last</p></article></body></html>"
+        self.assertGreater(len(html), FEED_SIZE)
+        self.assertEqual(parse_article_content(html), soup_article_content(html))
+        self.assertEqual(parse_article_content(html), f"{text.strip()} last")
+
+    def test_long_pages_match_beautifulsoup(self):
+        rng = random.Random(0)
+        for _ in range(50):
+            html = long_article_page(rng)
+            self.assertGreater(len(html), FEED_SIZE)
+            self.assertEqual(parse_article_content(html), soup_article_content(html))
+
+    def test_pages_match_beautifulsoup(self):
+        rng = random.Random(1)
+        for _ in range(50):
+            html = article_page(rng)
+            self.assertEqual(parse_article_content(html), soup_article_content(html))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,39 +1,202 @@
+"""
+Bulk import of scraped articles from CSV.
+
+Rows are streamed in chunks: each chunk is deduplicated against existing
+titles with one `title__in` query and against near-duplicate texts with the
+SimHash index (`dedup.py`), vectorized in batches (optionally on a process
+pool) and written with one `bulk_create`, so importing N rows costs about
+N / chunk_size round-trips instead of N queries plus N model calls, and
+syndicated copies of a story are never embedded.
+"""
 import csv
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 
-from django.core.exceptions import ObjectDoesNotExist
+import django
+from django.db import transaction
 
+from .caching import bump_content_version
+from .dedup import SimHashIndex, dedup_settings, duplicate_index, simhash, to_signed
+from .index import article_index
+from .labels import label_index, link_labels
 from .models import Article
+from .related import related_refresher
+from .search import search_index
+from .tfidf import analyze, get_vocabulary, tfidf_index
+from .vectorizations import embed_texts, embedding_settings
 
+# Scraped dumps use headline/content; hand-written ones may use the model's names.
+TITLE_COLUMNS = ('title', 'headline')
+TEXT_COLUMNS = ('text', 'content')
 
-def transfer_data_to_article(csv_file_path):
-  """
-  Transfers data from a CSV file to the Article model.
-
-  Args:
-      csv_file_path (str): Path to the CSV file.
-  """
-  with open(csv_file_path, 'r', newline='') as csvfile:
-    reader = csv.DictReader(csvfile)
-    for row in reader:
-      title = row['title']
-      content = row['content']
-      labels = row.get('labels', '')  # Get labels if present, otherwise empty string
-
-      # Check if article already exists by title
-      try:
-        existing_article = Article.objects.get(title=title)
-        print(f"Article '{title}' already exists, skipping.")
-      except ObjectDoesNotExist:
-        # Create new Article object
-        article = Article(
-          title=title,
-          content=content,
-          labels=labels,
+
+def read_csv_rows(csv_file_path):
+    """
+    Stream `(title, text, labels)` tuples from a CSV file.
+
+    Accepts `title` or `headline` and `text` or `content` columns; `labels`
+    is optional. Rows without a title or text are skipped.
+    """
+    with open(csv_file_path, 'r', newline='', encoding='utf-8') as csvfile:
+        reader = csv.DictReader(csvfile)
+        for row in reader:
+            title = next((row[c] for c in TITLE_COLUMNS if row.get(c)), '').strip()
+            text = next((row[c] for c in TEXT_COLUMNS if row.get(c)), '').strip()
+            if title and text:
+                yield title, text, (row.get('labels') or '').strip()
+
+
+def _init_worker():
+    django.setup()
+
+
+def _vectorize_batch(texts, batch_size, use_cache):
+    """Embeddings and TF-IDF term frequencies of `texts`; runs in pool workers."""
+    return embed_texts(texts, batch_size, use_cache=use_cache), [analyze(text) for text in texts]
+
+
+def _vectorize(texts, batch_size, executor, use_cache):
+    if executor is None:
+        return _vectorize_batch(texts, batch_size, use_cache)
+    batches = [texts[start:start + batch_size] for start in range(0, len(texts), batch_size)]
+    embeddings, analyses = [], []
+    for batch_embeddings, batch_analyses in executor.map(
+        _vectorize_batch, batches, [batch_size] * len(batches), [use_cache] * len(batches)
+    ):
+        embeddings.extend(batch_embeddings)
+        analyses.extend(batch_analyses)
+    return embeddings, analyses
+
+
+def import_articles(rows, chunk_size=1000, batch_size=None, workers=0, vocabulary=None, use_cache=True,
+                    near_duplicates=None, progress=None):
+    """
+    Create articles from `(title, text, labels)` rows, skipping existing titles
+    and texts that are near-duplicates of a stored or earlier imported article.
+
+    Args:
+        rows: Iterable of `(title, text, labels)` tuples, consumed lazily.
+        chunk_size (int): Rows deduplicated and inserted per transaction.
+        batch_size (int): Texts per embedding call (defaults to EMBEDDINGS['BATCH_SIZE']).
+        workers (int): Vectorize on this many processes; 0 vectorizes in-process.
+        vocabulary (TfidfVocabulary): Vocabulary to fold the new documents
+            into; defaults to the persisted one, saved once at the end.
+        use_cache (bool): Look up and store embeddings in the vector cache.
+        near_duplicates (bool): Reject SimHash near-duplicates before they are
+            vectorized; defaults to NEAR_DUPLICATES['ENABLED'].
+        progress (callable): Called with the running stats dict after each chunk.
+
+    Returns:
+        dict: `read`, `created`, `skipped` (existing title) and
+        `near_duplicates` row counts and `seconds` elapsed.
+    """
+    batch_size = batch_size or embedding_settings()['BATCH_SIZE']
+    vocabulary = vocabulary or get_vocabulary()
+    max_title = Article._meta.get_field('title').max_length
+    if near_duplicates is None:
+        near_duplicates = dedup_settings()['ENABLED']
+    seen_titles = set()
+    stats = {'read': 0, 'created': 0, 'skipped': 0, 'near_duplicates': 0, 'seconds': 0.0}
+    started = time.perf_counter()
+
+    executor = ProcessPoolExecutor(workers, initializer=_init_worker) if workers else None
+    try:
+        with vocabulary.batch():
+            rows = iter(rows)
+            while True:
+                chunk = list(islice(rows, chunk_size))
+                if not chunk:
+                    break
+                stats['read'] += len(chunk)
+                chunk = [(title[:max_title], text, labels) for title, text, labels in chunk]
+                new_rows = _new_titles(chunk, seen_titles)
+                stats['skipped'] += len(chunk) - len(new_rows)
+                if near_duplicates:
+                    unique_rows = _drop_near_duplicates(new_rows)
+                    stats['near_duplicates'] += len(new_rows) - len(unique_rows)
+                    new_rows = unique_rows
+                else:
+                    new_rows = [(*row, to_signed(simhash(row[1]))) for row in new_rows]
+                if new_rows:
+                    stats['created'] += _create_chunk(new_rows, vocabulary, batch_size, executor, use_cache)
+                stats['seconds'] = time.perf_counter() - started
+                if progress:
+                    progress(stats)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    stats['seconds'] = time.perf_counter() - started
+    return stats
+
+
+def _new_titles(chunk, seen_titles):
+    """Rows whose title is neither stored nor already taken earlier in this import."""
+    existing = set(
+        Article.objects.filter(title__in={title for title, _, _ in chunk})
+        .values_list('title', flat=True)
+    )
+    new_rows = []
+    for title, text, labels in chunk:
+        if title in existing or title in seen_titles:
+            continue
+        seen_titles.add(title)
+        new_rows.append((title, text, labels))
+    return new_rows
+
+
+def _drop_near_duplicates(rows):
+    """
+    Rows whose text is not a near-duplicate of a stored article or of an
+    earlier row, each extended with its stored SimHash value.
+    """
+    unique_rows = []
+    chunk_index = SimHashIndex(duplicate_index.max_distance)
+    for title, text, labels in rows:
+        fingerprint = simhash(text)
+        if fingerprint is not None:
+            if duplicate_index.find_duplicate(fingerprint) is not None or chunk_index.nearest(fingerprint) is not None:
+                continue
+            chunk_index.add(len(unique_rows), fingerprint)
+        unique_rows.append((title, text, labels, to_signed(fingerprint)))
+    return unique_rows
+
+
+def _create_chunk(rows, vocabulary, batch_size, executor, use_cache):
+    embeddings, analyses = _vectorize([row[1] for row in rows], batch_size, executor, use_cache)
+    articles = [
+        Article(
+            title=title,
+            text=text,
+            labels=', '.join(label.strip() for label in labels.split(',')) if labels else '',
+            vector_embedding=embedding,
+            tfidf_vector=vocabulary.add(vector, terms),
+            simhash=fingerprint,
         )
-        article.save()
-        print(f"Article '{title}' created successfully.")
+        for (title, text, labels, fingerprint), embedding, (vector, terms) in zip(rows, embeddings, analyses)
+    ]
+    with transaction.atomic():
+        # bulk_create skips Article.save and post_save, so vectors are set above
+        # and the search and in-memory indexes are updated here.
+        created = Article.objects.bulk_create(articles, batch_size=500)
+        link_labels(created)
+        search_index.update(created)
+    for article in created:
+        if article.pk is not None:
+            article_index.add(article.pk, article.vector_embedding, article.date_added)
+            duplicate_index.add(article.pk, article.simhash)
+            label_index.add(article.pk, article.labels, article.date_added)
+    tfidf_index.mark_dirty()
+    related_refresher.articles_changed([article.pk for article in created if article.pk is not None])
+    bump_content_version()
+    return len(created)
 
 
-# Example usage
-csv_file_path = "path/to/your/data.csv"
-transfer_data_to_article(csv_file_path)
\ No newline at end of file
+def transfer_data_to_article(csv_file_path):
+    """
+    Transfers data from a CSV file to the Article model.
+
+    Args:
+        csv_file_path (str): Path to the CSV file.
+    """
+    return import_articles(read_csv_rows(csv_file_path))
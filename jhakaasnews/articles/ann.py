@@ -0,0 +1,194 @@
+"""
+Approximate nearest neighbour backends for the article vector index.
+
+Every backend is built from a snapshot of `(article_ids, unit-length matrix)` and
+answers batched inner-product queries with `(ids, scores)` pairs. `ExactBackend`
+is a brute-force scan; `IVFFlatBackend` clusters the matrix with spherical
+k-means and only scans the `nprobe` closest clusters; `HNSWBackend` wraps the
+optional `hnswlib` package. Which one is used, and its recall/latency knobs, come
+from `settings.ARTICLE_ANN`; set SYNC there to build backends in the ranking
+thread instead of a background one (e.g. in tests).
+"""
+import numpy as np
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from .ranking import normalize_rows, top_k_indices
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+
+DEFAULTS = {
+    'BACKEND': 'exact',
+    'MIN_SIZE': 10000,
+    'REBUILD_FRACTION': 0.1,
+    'REFRESH_INTERVAL': 300,
+    'IVF_NLIST': None,
+    'IVF_NPROBE': 8,
+    'IVF_ITERATIONS': 10,
+    'IVF_TRAINING_SAMPLE': 50000,
+    'HNSW_M': 16,
+    'HNSW_EF_CONSTRUCTION': 200,
+    'HNSW_EF_SEARCH': 64,
+    'SYNC': False,
+}
+
+
+def ann_settings():
+    return {**DEFAULTS, **getattr(settings, 'ARTICLE_ANN', {})}
+
+
+class ExactBackend:
+    """Brute-force inner-product scan over the whole snapshot."""
+
+    def build(self, ids, matrix):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        return self
+
+    def __len__(self):
+        return self.ids.shape[0]
+
+    def search(self, queries, k):
+        queries = normalize_rows(queries)
+        scores = queries @ self.matrix.T
+        return [
+            (self.ids[rows], row_scores[rows])
+            for rows, row_scores in zip(top_k_indices(scores, k), scores)
+        ]
+
+
+class IVFFlatBackend:
+    """
+    Inverted-file index with uncompressed vectors.
+
+    Rows are grouped by their nearest centroid and stored contiguously, so a
+    query scores `nlist` centroids and then `nprobe` contiguous slices.
+    """
+
+    def __init__(self, nlist=None, nprobe=8, iterations=10, training_sample=50000, seed=0):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.iterations = iterations
+        self.training_sample = training_sample
+        self.seed = seed
+
+    def __len__(self):
+        return self.ids.shape[0]
+
+    @staticmethod
+    def _assign(matrix, centroids, chunk_size=8192):
+        labels = np.empty(matrix.shape[0], dtype=np.int64)
+        for start in range(0, matrix.shape[0], chunk_size):
+            labels[start:start + chunk_size] = np.argmax(
+                matrix[start:start + chunk_size] @ centroids.T, axis=1
+            )
+        return labels
+
+    def _train(self, matrix, nlist):
+        rng = np.random.default_rng(self.seed)
+        sample = matrix
+        if matrix.shape[0] > self.training_sample:
+            sample = matrix[rng.choice(matrix.shape[0], self.training_sample, replace=False)]
+        centroids = sample[rng.choice(sample.shape[0], nlist, replace=False)].copy()
+        for _ in range(self.iterations):
+            labels = self._assign(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            empty = ~sums.any(axis=1)
+            sums[empty] = sample[rng.choice(sample.shape[0], int(empty.sum()))]
+            centroids = normalize_rows(sums)
+        return centroids
+
+    def build(self, ids, matrix):
+        ids = np.asarray(ids, dtype=np.int64)
+        matrix = np.asarray(matrix, dtype=np.float32)
+        nlist = self.nlist or max(1, int(np.sqrt(matrix.shape[0])))
+        nlist = min(nlist, matrix.shape[0]) or 1
+        if matrix.shape[0] == 0:
+            self.centroids = np.zeros((0, matrix.shape[1]), dtype=np.float32)
+            self.offsets = np.zeros(1, dtype=np.int64)
+            self.ids, self.matrix = ids, matrix
+            return self
+        self.centroids = self._train(matrix, nlist)
+        labels = self._assign(matrix, self.centroids)
+        order = np.argsort(labels, kind='stable')
+        self.ids = ids[order]
+        self.matrix = np.ascontiguousarray(matrix[order])
+        self.offsets = np.zeros(nlist + 1, dtype=np.int64)
+        np.cumsum(np.bincount(labels, minlength=nlist), out=self.offsets[1:])
+        return self
+
+    def search(self, queries, k):
+        queries = normalize_rows(queries)
+        if self.centroids.shape[0] == 0:
+            return [(self.ids[:0], np.empty(0, dtype=np.float32)) for _ in queries]
+        nprobe = min(self.nprobe, self.centroids.shape[0])
+        probes = top_k_indices(queries @ self.centroids.T, nprobe)
+        results = []
+        for query, lists in zip(queries, probes):
+            rows = np.concatenate([
+                np.arange(self.offsets[c], self.offsets[c + 1]) for c in lists
+            ])
+            scores = self.matrix[rows] @ query
+            best = top_k_indices(scores, k)
+            results.append((self.ids[rows[best]], scores[best]))
+        return results
+
+
+class HNSWBackend:
+    """Hierarchical navigable small world graph built with `hnswlib`."""
+
+    def __init__(self, m=16, ef_construction=200, ef_search=64):
+        if hnswlib is None:
+            raise ImproperlyConfigured("ARTICLE_ANN['BACKEND'] = 'hnsw' requires the hnswlib package.")
+        self.m = m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+
+    def __len__(self):
+        return self.size
+
+    def build(self, ids, matrix):
+        matrix = np.asarray(matrix, dtype=np.float32)
+        self.size = matrix.shape[0]
+        self.graph = hnswlib.Index(space='ip', dim=matrix.shape[1])
+        self.graph.init_index(max_elements=max(1, self.size), M=self.m, ef_construction=self.ef_construction)
+        if self.size:
+            self.graph.add_items(matrix, np.asarray(ids, dtype=np.int64))
+        self.graph.set_ef(self.ef_search)
+        return self
+
+    def search(self, queries, k):
+        queries = normalize_rows(queries)
+        k = min(k, self.size)
+        if k == 0:
+            return [(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)) for _ in queries]
+        self.graph.set_ef(max(self.ef_search, k))
+        labels, distances = self.graph.knn_query(queries, k=k)
+        return [(row_ids.astype(np.int64), 1 - row_distances) for row_ids, row_distances in zip(labels, distances)]
+
+
+def make_backend(config=None):
+    """Instantiate the backend selected in `settings.ARTICLE_ANN`."""
+    config = config or ann_settings()
+    name = config['BACKEND']
+    if name == 'exact':
+        return ExactBackend()
+    if name == 'ivf':
+        return IVFFlatBackend(
+            nlist=config['IVF_NLIST'],
+            nprobe=config['IVF_NPROBE'],
+            iterations=config['IVF_ITERATIONS'],
+            training_sample=config['IVF_TRAINING_SAMPLE'],
+        )
+    if name == 'hnsw':
+        return HNSWBackend(
+            m=config['HNSW_M'],
+            ef_construction=config['HNSW_EF_CONSTRUCTION'],
+            ef_search=config['HNSW_EF_SEARCH'],
+        )
+    raise ImproperlyConfigured(f"Unknown ARTICLE_ANN backend {name!r}; use 'exact', 'ivf' or 'hnsw'.")
@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class ArticlesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'articles'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .instrumentation import record, registry, related_refresher_gauges
+        from .pipeline import recommendation_pipeline
+
+        recommendation_pipeline.add_hook(lambda stage, seconds: record(f'pipeline.{stage}', seconds))
+        registry.add_collector(related_refresher_gauges)
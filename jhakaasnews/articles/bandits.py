@@ -0,0 +1,324 @@
+"""
+Multi-armed bandit exploration for the home feed.
+
+`home` shows new users the popular list and known users their personalized
+ranking, so an article nobody has read yet is never shown on it. Now the
+last EXPLORE_SLOTS places of a signed-in user's feed are filled by a bandit
+over the active articles.
+
+Arms are active articles. Each arm keeps impressions and clicks in NumPy
+arrays indexed by row, and each label keeps the same pair. An article's
+estimate starts from the mean click rate of its labels, worth
+PRIOR_STRENGTH impressions. A new article borrows what is known about its
+labels until it has impressions of its own.
+
+Policies (POLICY) score every arm for a batch of requests at once, as a
+`(requests, arms)` matrix, and the best slots of each row are picked with
+`argpartition`:
+
+- 'epsilon_greedy': a random order for EPSILON of the requests, the best
+  estimated click rate for the rest;
+- 'thompson': a draw from each arm's Beta posterior;
+- 'ucb': UCB1, the estimate plus UCB_C * sqrt(2 ln N / n).
+
+`home` records an impression for each article the bandit shows. A click is
+a read marked final by `update_interaction` (see ingestion.py) of an article
+the same user was shown. The last MAX_TRACKED shown (user, article) pairs
+are remembered for this. Each update is O(1).
+
+State is per process and starts empty. Anonymous pages are cached and cannot
+report reads, so they do not explore. `replay` evaluates a policy offline on
+logged interactions (see the replay_bandits command).
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+from scipy import sparse
+
+from .instrumentation import span
+from .labels import parse_labels
+
+DEFAULTS = {
+    'ENABLED': True,
+    'POLICY': 'thompson',
+    'EXPLORE_SLOTS': 2,
+    'EPSILON': 0.1,
+    'UCB_C': 1.0,
+    'PRIOR_STRENGTH': 10.0,
+    'MAX_TRACKED': 100000,
+    'REFRESH_INTERVAL': 300,
+}
+
+
+def bandit_settings():
+    config = {**DEFAULTS, **getattr(settings, 'HOME_BANDIT', {})}
+    if not config['PRIOR_STRENGTH'] > 0:
+        # A zero prior leaves unseen arms with Beta(0, 0), which rng.beta rejects.
+        raise ImproperlyConfigured("HOME_BANDIT['PRIOR_STRENGTH'] must be greater than 0.")
+    return config
+
+
+class ArmStats:
+    """Impressions and clicks per key in growable NumPy arrays, updated in O(1) by row."""
+
+    def __init__(self, keys=()):
+        self.rows = {}
+        self.keys = []
+        self._impressions = np.zeros(64)
+        self._clicks = np.zeros(64)
+        for key in keys:
+            self.row(key)
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def impressions(self):
+        return self._impressions[:len(self.keys)]
+
+    @property
+    def clicks(self):
+        return self._clicks[:len(self.keys)]
+
+    def row(self, key):
+        """Row of `key`, added with zero counts if it is new."""
+        row = self.rows.get(key)
+        if row is None:
+            row = self.rows[key] = len(self.keys)
+            self.keys.append(key)
+            if row == len(self._impressions):
+                self._impressions = np.concatenate([self._impressions, np.zeros(row)])
+                self._clicks = np.concatenate([self._clicks, np.zeros(row)])
+        return row
+
+    def add(self, row, impressions=0, clicks=0):
+        self._impressions[row] += impressions
+        self._clicks[row] += clicks
+
+    def counts(self, key):
+        """`(impressions, clicks)` of `key`; zeros if unknown."""
+        row = self.rows.get(key)
+        if row is None:
+            return 0.0, 0.0
+        return float(self._impressions[row]), float(self._clicks[row])
+
+
+class EpsilonGreedy:
+    def __init__(self, epsilon=0.1):
+        self.epsilon = epsilon
+
+    def scores(self, successes, failures, total, rng, batch):
+        means = successes / (successes + failures)
+        scores = np.repeat(means[np.newaxis, :], batch, axis=0)
+        explore = rng.random(batch) < self.epsilon
+        scores[explore] = rng.random((int(explore.sum()), len(means)))
+        return scores
+
+
+class ThompsonSampling:
+    def scores(self, successes, failures, total, rng, batch):
+        return rng.beta(successes, failures, size=(batch, len(successes)))
+
+
+class UCB:
+    def __init__(self, c=1.0):
+        self.c = c
+
+    def scores(self, successes, failures, total, rng, batch):
+        pulls = successes + failures
+        bounds = successes / pulls + self.c * np.sqrt(2 * np.log(max(total, 2.0)) / pulls)
+        # Deterministic, so equal bounds are broken at random per request.
+        return bounds[np.newaxis, :] + rng.random((batch, len(bounds))) * 1e-9
+
+
+def make_policy(name=None, config=None):
+    """Policy instance for `name` ('epsilon_greedy', 'thompson' or 'ucb'), configured from settings."""
+    config = config or bandit_settings()
+    name = name or config['POLICY']
+    if name == 'epsilon_greedy':
+        return EpsilonGreedy(config['EPSILON'])
+    if name == 'thompson':
+        return ThompsonSampling()
+    if name == 'ucb':
+        return UCB(config['UCB_C'])
+    raise ValueError(f"Unknown bandit policy {name!r}")
+
+
+class BanditEngine:
+    """Article and label arm state plus the served pairs awaiting clicks; see the module docstring."""
+
+    def __init__(self, policy=None, seed=None):
+        self.policy = policy
+        self._lock = threading.RLock()
+        self._rng = np.random.default_rng(seed)
+        self._labels = ArmStats()
+        self._served = OrderedDict()
+        self._loaded_at = None
+        self.set_arms({})
+
+    def __len__(self):
+        return len(self._articles)
+
+    def set_arms(self, arms):
+        """
+        Replace the arms with `{article_id: labels}` (lists or comma-separated
+        strings), keeping the counts of articles that stay. Label counts are kept.
+        """
+        with self._lock:
+            previous = getattr(self, '_articles', None)
+            self._articles = ArmStats(arms)
+            self._ids = np.fromiter(arms, dtype=np.int64, count=len(arms))
+            self._label_rows = {}
+            rows, columns, weights = [], [], []
+            for article_id, labels in arms.items():
+                if isinstance(labels, str):
+                    labels = parse_labels(labels)
+                row = self._articles.rows[article_id]
+                label_rows = self._label_rows[article_id] = tuple(self._labels.row(label) for label in labels)
+                rows += [row] * len(label_rows)
+                columns += label_rows
+                weights += [1 / len(label_rows) for _ in label_rows]
+                if previous is not None:
+                    impressions, clicks = previous.counts(article_id)
+                    self._articles.add(row, impressions, clicks)
+            # Row-normalized (articles x labels): an article's label prior is the mean of its labels' rates.
+            self._membership = sparse.csr_matrix(
+                (weights, (rows, columns)), shape=(len(self._articles), len(self._labels))
+            )
+            self._covered = np.asarray(self._membership.sum(axis=1)).ravel()
+
+    @span('bandit.sync')
+    def sync(self):
+        """Make the active articles the arms."""
+        from .models import ActiveArticles
+
+        self.set_arms(dict(ActiveArticles.objects.values_list('id', 'labels').iterator()))
+        self._loaded_at = timezone.now().timestamp()
+
+    def ensure_fresh(self):
+        """Sync on first use and every REFRESH_INTERVAL seconds."""
+        now = timezone.now().timestamp()
+        if self._loaded_at is None or now - self._loaded_at >= bandit_settings()['REFRESH_INTERVAL']:
+            self.sync()
+
+    def _posterior(self, strength):
+        """Per-arm Beta `(successes, failures)` with the label prior folded in."""
+        overall = (self._articles.clicks.sum() + 1) / (self._articles.impressions.sum() + 2)
+        label_rates = (self._labels.clicks + 1) / (self._labels.impressions + 2)
+        prior = self._membership @ label_rates + (1 - self._covered) * overall
+        successes = self._articles.clicks + strength * prior
+        failures = self._articles.impressions - self._articles.clicks + strength * (1 - prior)
+        return successes, failures
+
+    def select(self, exclude_ids, k):
+        """
+        Pick up to `k` articles for each of a batch of requests at once.
+
+        Args:
+            exclude_ids (list): One collection per request of the ids it must not
+                get (e.g. articles already on its page).
+            k (int): Articles per request.
+
+        Returns:
+            list: One list of article ids per request, best first.
+        """
+        config = bandit_settings()
+        policy = self.policy or make_policy(config=config)
+        with self._lock:
+            batch, arms = len(exclude_ids), len(self._articles)
+            k = min(k, arms)
+            if not batch or k <= 0:
+                return [[] for _ in exclude_ids]
+            successes, failures = self._posterior(config['PRIOR_STRENGTH'])
+            scores = policy.scores(
+                successes, failures, self._articles.impressions.sum(), self._rng, batch
+            )
+            for request, excluded in enumerate(exclude_ids):
+                rows = [self._articles.rows[i] for i in excluded if i in self._articles.rows]
+                scores[request, rows] = -np.inf
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            top_scores = np.take_along_axis(scores, top, axis=1)
+            order = np.argsort(-top_scores, axis=1, kind='stable')
+            picked = np.take_along_axis(top, order, axis=1)
+            finite = np.isfinite(np.take_along_axis(top_scores, order, axis=1))
+            ids = self._ids[picked]
+            return [row[keep].tolist() for row, keep in zip(ids, finite)]
+
+    def update(self, article_id, impressions=0, clicks=0):
+        """Add impressions and clicks to an article and its labels; unknown articles are ignored."""
+        with self._lock:
+            row = self._articles.rows.get(article_id)
+            if row is None:
+                return
+            self._articles.add(row, impressions, clicks)
+            for label_row in self._label_rows[article_id]:
+                self._labels.add(label_row, impressions, clicks)
+
+    def record_impressions(self, user_id, article_ids):
+        """Count that `user_id` was shown `article_ids` by the bandit."""
+        max_tracked = bandit_settings()['MAX_TRACKED']
+        with self._lock:
+            for article_id in article_ids:
+                self.update(article_id, impressions=1)
+                self._served[(user_id, article_id)] = None
+                self._served.move_to_end((user_id, article_id))
+            while len(self._served) > max_tracked:
+                self._served.popitem(last=False)
+
+    def record_clicks(self, pairs):
+        """Count a click for each `(user_id, article_id)` the bandit showed; other reads are ignored."""
+        with self._lock:
+            for pair in pairs:
+                if pair in self._served:
+                    del self._served[pair]
+                    self.update(pair[1], clicks=1)
+
+    def explore(self, user_id, exclude_ids, slots):
+        """Up to `slots` article ids for one feed, recorded as shown to `user_id`."""
+        self.ensure_fresh()
+        article_ids = self.select([exclude_ids], slots)[0]
+        self.record_impressions(user_id, article_ids)
+        return article_ids
+
+
+def replay(engine, events, slots=1, batch_size=256):
+    """
+    Offline replay evaluation on logged `(user_id, article_id, clicked)` events.
+
+    The policy picks `slots` articles per event, for a batch of events at a
+    time. An event counts only when the logged article is among the picks;
+    it is then fed back as an impression and, if clicked, a click. Other
+    events are skipped. The estimate is unbiased when the logged articles
+    were shown uniformly at random.
+
+    Returns:
+        dict: events, matched, clicks, ctr, seconds and events_per_second.
+    """
+    matched = clicks = 0
+    started = time.perf_counter()
+    for start in range(0, len(events), batch_size):
+        batch = events[start:start + batch_size]
+        picks = engine.select([()] * len(batch), slots)
+        for (user_id, article_id, clicked), picked in zip(batch, picks):
+            if article_id not in picked:
+                continue
+            matched += 1
+            clicks += bool(clicked)
+            engine.update(article_id, impressions=1, clicks=int(bool(clicked)))
+    seconds = time.perf_counter() - started
+    return {
+        'events': len(events),
+        'matched': matched,
+        'clicks': clicks,
+        'ctr': clicks / matched if matched else 0.0,
+        'seconds': seconds,
+        'events_per_second': len(events) / seconds if seconds else 0.0,
+    }
+
+
+home_bandit = BanditEngine()
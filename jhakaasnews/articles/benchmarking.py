@@ -0,0 +1,30 @@
+"""
+Helpers shared by the benchmark_* management commands.
+"""
+import numpy as np
+
+
+class Rollback(Exception):
+    """Raised inside `transaction.atomic()` to discard what a benchmark wrote."""
+
+
+class QueryCounter:
+    """`connection.execute_wrapper` that counts statements (without keeping them)."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def synthetic_rows(n, seed=0, words=200, vocabulary_size=20000, duplicate_fraction=0.05):
+    """`(title, text, labels)` rows of random words; a fraction repeat an earlier title."""
+    rng = np.random.default_rng(seed)
+    vocabulary = np.array([f'w{i}' for i in range(vocabulary_size)])
+    labels = ['politics', 'sports', 'tech', 'business', 'world', 'health']
+    for i in range(n):
+        title_id = int(rng.integers(0, i)) if i and rng.random() < duplicate_fraction else i
+        text = ' '.join(vocabulary[rng.zipf(1.3, words) % vocabulary_size])
+        yield f'Synthetic article {seed}-{title_id}', text, labels[i % len(labels)]
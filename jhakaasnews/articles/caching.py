@@ -0,0 +1,182 @@
+"""
+Versioned caching of page data for `home` and `index`.
+
+Entries are keyed by a content version, and per-user entries also by a user
+version. Both versions are counters kept in the cache itself. Invalidation
+bumps a counter instead of hunting down keys: article saves and deletes
+bump the content version; a user's interactions bump that user's version.
+Entries under old versions are never read again and expire after TIMEOUT.
+Counter-only updates (views, time spent) do not bump anything, so the
+popular list can lag by up to TIMEOUT.
+
+`get_or_compute` is single-flight: on a miss, one caller takes a short lock
+with `cache.add` and recomputes. Concurrent callers wait up to LOCK_WAIT
+seconds for the value, then compute it themselves. Only standard cache
+operations are used (`add`, `get`, `set`, `incr`, `delete`), so this works with
+the local-memory and file backends as well as Redis or memcached.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.http import HttpResponse
+
+DEFAULTS = {
+    'ENABLED': True,
+    'ALIAS': 'default',
+    'KEY_PREFIX': 'articles',
+    'TIMEOUT': 300,
+    'LOCK_TIMEOUT': 30,
+    'LOCK_WAIT': 5.0,
+    'POLL_INTERVAL': 0.05,
+}
+
+_MISSING = object()
+
+
+def page_cache_settings():
+    return {**DEFAULTS, **getattr(settings, 'PAGE_CACHE', {})}
+
+
+def _cache():
+    return caches[page_cache_settings()['ALIAS']]
+
+
+def _version_key(name):
+    return f"{page_cache_settings()['KEY_PREFIX']}:version:{name}"
+
+
+def _version(name):
+    cache = _cache()
+    key = _version_key(name)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, 1, timeout=None)
+        version = cache.get(key, 1)
+    return version
+
+
+def _bump(name):
+    cache = _cache()
+    key = _version_key(name)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Not cached yet (or evicted): any fresh value differs from what
+        # entries were keyed with, as long as it never repeats.
+        cache.set(key, time.time_ns(), timeout=None)
+
+
+def bump_content_version():
+    """Invalidate every entry (call after articles are added, edited or deleted)."""
+    if page_cache_settings()['ENABLED']:
+        _bump('content')
+
+
+def bump_user_versions(user_ids):
+    """Invalidate the per-user entries of `user_ids` (call after their interactions change)."""
+    if page_cache_settings()['ENABLED']:
+        for user_id in set(user_ids):
+            _bump(f'user:{user_id}')
+
+
+def cache_key(name, *parts, user_id=None):
+    """Key for entry `name`, varying by `parts` and the current content (and user) version."""
+    key = f"{page_cache_settings()['KEY_PREFIX']}:{name}:c{_version('content')}"
+    if user_id is not None:
+        key += f":u{user_id}.{_version(f'user:{user_id}')}"
+    if parts:
+        # Hashed so arbitrary search terms make valid memcached keys.
+        key += ':' + hashlib.md5(repr(parts).encode('utf-8')).hexdigest()
+    return key
+
+
+def get_or_compute(key, compute, cacheable=None):
+    """
+    Cached value of `key`, computing and storing it on a miss with at most
+    one concurrent `compute()` per key.
+
+    Args:
+        key (str): Cache key, usually from `cache_key`.
+        compute (callable): Produces the value; it must be picklable.
+        cacheable (callable): Optional predicate; values it rejects are
+            returned but not stored.
+    """
+    config = page_cache_settings()
+    if not config['ENABLED']:
+        return compute()
+    cache = _cache()
+    value = cache.get(key, _MISSING)
+    if value is not _MISSING:
+        return value
+
+    lock_key = f'{key}:lock'
+    if not cache.add(lock_key, 1, timeout=config['LOCK_TIMEOUT']):
+        deadline = time.monotonic() + config['LOCK_WAIT']
+        while time.monotonic() < deadline:
+            time.sleep(config['POLL_INTERVAL'])
+            value = cache.get(key, _MISSING)
+            if value is not _MISSING:
+                return value
+        # The holder is slow or gone; compute without the lock rather than
+        # keep the request waiting.
+        lock_key = None
+    try:
+        value = compute()
+        if cacheable is None or cacheable(value):
+            cache.set(key, value, timeout=config['TIMEOUT'])
+        return value
+    finally:
+        if lock_key is not None:
+            cache.delete(lock_key)
+
+
+def cached_response(request, name, render, *parts):
+    """
+    `render()`'s response, cached per content version. Only for pages that
+    do not vary by user. Responses that are not 200 are not cached, and
+    neither are responses that set a CSRF cookie.
+    """
+    def compute():
+        response = render()
+        return {
+            'content': response.content,
+            'content_type': response['Content-Type'],
+            'status': response.status_code,
+            'cacheable': response.status_code == 200 and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE'),
+        }
+
+    cached = get_or_compute(cache_key(name, *parts), compute, cacheable=lambda value: value['cacheable'])
+    return HttpResponse(cached['content'], content_type=cached['content_type'], status=cached['status'])
+
+
+class _ResultCount:
+    """Stands in for a cached result set so `Paginator` knows its size without a COUNT query."""
+
+    def __init__(self, count):
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+
+def cached_page(name, queryset, per_page, number, *parts):
+    """
+    Page `number` of `queryset`, cached per content version. Invalid numbers
+    fall back to the first page, and numbers past the end to the last page.
+    The cached value is the count, the resolved number and the page's objects.
+    """
+    def compute():
+        paginator = Paginator(queryset, per_page)
+        try:
+            page = paginator.page(number)
+        except PageNotAnInteger:
+            page = paginator.page(1)
+        except EmptyPage:
+            page = paginator.page(paginator.num_pages)
+        return paginator.count, page.number, list(page.object_list)
+
+    count, resolved, objects = get_or_compute(cache_key(name, number, *parts), compute)
+    return Page(objects, resolved, Paginator(_ResultCount(count), per_page))
@@ -0,0 +1,473 @@
+"""
+Collaborative filtering: implicit-feedback ALS over `UserInteractions`.
+
+Personalization used to be content-only: the profile is a weighted sum of
+the embeddings of what the user read. Here readers with similar histories
+recommend to each other. Every user and article gets a FACTORS-long
+vector. A user's score for an article is the dot product of the two, so the
+home feed scores every active article with one matrix product.
+
+Training follows Hu, Koren and Volinsky (2008). Each (user, article) pair
+has a preference of 1 if it was read and 0 otherwise. The confidence is
+`1 + ALPHA * strength`, where strength grows with `log1p` of the minutes
+read and halves for reads that were not finished. User and item factors
+are solved alternately in closed form. Rows with similar interaction
+counts are padded into batches, and each batch is solved with one batched
+matrix product and one stacked `np.linalg.solve`. Batches are spread over
+THREADS worker threads; NumPy releases the GIL in both.
+
+Factors are trained offline (the train_collaborative command) and saved to
+PATH. Between retrains, newcomers are folded in against the fixed factors:
+
+- a user with no factors, or with new reads since their factors were
+  solved, is solved from their interactions with the item factors held
+  fixed (one query and one small solve);
+- an active article with no factors is solved from its readers' factors.
+  Without readers, its embedding is mapped into the factor space by a ridge
+  regression fitted at training time.
+"""
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+from scipy import sparse
+
+from .instrumentation import span
+from .ranking import top_k_indices
+
+DEFAULTS = {
+    'ENABLED': True,
+    'PATH': None,
+    'FACTORS': 32,
+    'REGULARIZATION': 0.1,
+    'ALPHA': 20.0,
+    'ITERATIONS': 10,
+    'THREADS': os.cpu_count() or 1,
+    'CONTENT_REGULARIZATION': 1.0,
+    'REFRESH_INTERVAL': 300,
+}
+
+# Rows with at most this many interactions are solved in padded batches;
+# heavier rows get their own matrix product.
+LIGHT_ROW_NNZ = 64
+# Padded interactions per batch of light rows.
+BATCH_NNZ = 16384
+
+
+def collaborative_settings():
+    return {**DEFAULTS, **getattr(settings, 'COLLABORATIVE', {})}
+
+
+def interaction_strength(clicked, time_spent):
+    """Implicit feedback strength: grows with minutes read and halves for unfinished reads."""
+    strength = 1 + np.log1p(np.maximum(np.asarray(time_spent, dtype=np.float64), 0) / 60)
+    return np.where(np.asarray(clicked, dtype=bool), strength, strength / 2)
+
+
+def interaction_matrix(user_ids, article_ids, strengths):
+    """
+    Sparse users x articles strength matrix (repeated pairs summed).
+
+    Returns:
+        tuple: `(matrix, users, articles)`: the CSR matrix and the sorted user
+        and article ids of its rows and columns.
+    """
+    users, user_rows = np.unique(np.asarray(user_ids, dtype=np.int64), return_inverse=True)
+    articles, article_rows = np.unique(np.asarray(article_ids, dtype=np.int64), return_inverse=True)
+    matrix = sparse.csr_matrix(
+        (np.asarray(strengths, dtype=np.float64), (user_rows, article_rows)), shape=(len(users), len(articles))
+    )
+    matrix.sum_duplicates()
+    return matrix, users, articles
+
+
+def _batches(indptr, rows):
+    """
+    Group light `rows` by interaction count into batches of at most
+    BATCH_NNZ interactions once padded to the longest row of the batch.
+    """
+    counts = indptr[rows + 1] - indptr[rows]
+    order = np.argsort(counts, kind='stable')
+    rows, counts = rows[order], counts[order].tolist()
+    batches, start = [], 0
+    for end in range(1, len(rows) + 1):
+        if end == len(rows) or (end + 1 - start) * max(counts[end], 1) > BATCH_NNZ:
+            batches.append(rows[start:end])
+            start = end
+    return batches
+
+
+def _solve(rows, matrix, fixed, base, alpha, out):
+    """
+    Solve `out[rows]` against `fixed` factors:
+    `(base + Y^T (C_u - I) Y) x_u = Y^T C_u p_u` for each row `u`, with the
+    rows' interactions padded to a `(rows, width, factors)` array so every
+    `Y^T (C_u - I) Y` comes from one batched matrix product.
+    """
+    indptr, indices, data = matrix.indptr, matrix.indices, matrix.data
+    counts = indptr[rows + 1] - indptr[rows]
+    a = np.repeat(base[np.newaxis], len(rows), axis=0)
+    b = np.zeros((len(rows), fixed.shape[1]))
+    width = int(counts.max(initial=0))
+    if width:
+        offsets = np.arange(width)
+        present = offsets < counts[:, np.newaxis]
+        positions = np.where(present, indptr[rows][:, np.newaxis] + offsets, 0)
+        y = fixed[indices[positions]] * present[..., np.newaxis]
+        weighted = y * (alpha * data[positions])[..., np.newaxis]
+        a += np.matmul(weighted.transpose(0, 2, 1), y)
+        b = (weighted + y).sum(axis=1)
+    out[rows] = np.linalg.solve(a, b[..., np.newaxis])[..., 0]
+
+
+def solve_one(base, fixed, strengths, alpha):
+    """Factors of one row that interacted with the `fixed` factor rows with `strengths`."""
+    weighted = fixed * (alpha * np.asarray(strengths, dtype=np.float64))[:, np.newaxis]
+    return np.linalg.solve(base + weighted.T @ fixed, (weighted + fixed).sum(axis=0))
+
+
+def _solve_heavy(row, matrix, fixed, base, alpha, out):
+    start, end = matrix.indptr[row], matrix.indptr[row + 1]
+    out[row] = solve_one(base, fixed[matrix.indices[start:end]], matrix.data[start:end], alpha)
+
+
+def solve_side(matrix, fixed, regularization, alpha, out=None, executor=None):
+    """
+    One ALS half-step: least-squares factors for every row of `matrix`
+    (users x items or items x users) with the columns' factors `fixed`.
+    """
+    factors = fixed.shape[1]
+    if out is None:
+        out = np.zeros((matrix.shape[0], factors))
+    base = fixed.T @ fixed + regularization * np.eye(factors)
+    counts = np.diff(matrix.indptr)
+    light = np.flatnonzero(counts <= LIGHT_ROW_NNZ)
+    tasks = [(_solve, rows) for rows in _batches(matrix.indptr, light)]
+    tasks += [(_solve_heavy, row) for row in np.flatnonzero(counts > LIGHT_ROW_NNZ)]
+    run = lambda task: task[0](task[1], matrix, fixed, base, alpha, out)
+    if executor is None:
+        for task in tasks:
+            run(task)
+    else:
+        list(executor.map(run, tasks))
+    return out
+
+
+def train(matrix, factors=None, regularization=None, alpha=None, iterations=None, threads=None,
+          seed=0, progress=None):
+    """
+    Implicit ALS on a users x items strength matrix.
+
+    Args:
+        matrix (scipy.sparse.spmatrix): Interaction strengths.
+        progress (callable): Called with `(iteration, seconds)` after each iteration.
+
+    Returns:
+        tuple: `(user_factors, item_factors)` float64 arrays.
+    """
+    config = collaborative_settings()
+    factors = factors or config['FACTORS']
+    regularization = config['REGULARIZATION'] if regularization is None else regularization
+    alpha = config['ALPHA'] if alpha is None else alpha
+    iterations = iterations or config['ITERATIONS']
+    threads = threads or config['THREADS']
+
+    by_user = sparse.csr_matrix(matrix, dtype=np.float64)
+    by_item = by_user.T.tocsr()
+    rng = np.random.default_rng(seed)
+    user_factors = rng.normal(0, 0.01, (by_user.shape[0], factors))
+    item_factors = rng.normal(0, 0.01, (by_user.shape[1], factors))
+    executor = ThreadPoolExecutor(threads) if threads > 1 else None
+    try:
+        for iteration in range(iterations):
+            started = time.perf_counter()
+            solve_side(by_user, item_factors, regularization, alpha, user_factors, executor)
+            solve_side(by_item, user_factors, regularization, alpha, item_factors, executor)
+            if progress is not None:
+                progress(iteration, time.perf_counter() - started)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return user_factors, item_factors
+
+
+class FactorModel:
+    """Trained user and item factors with their ids, plus the embedding -> factor projection."""
+
+    def __init__(self, user_ids, user_factors, item_ids, item_factors, content_projection=None, regularization=None,
+                 alpha=None):
+        config = collaborative_settings()
+        self.user_ids = np.asarray(user_ids, dtype=np.int64)
+        self.user_factors = np.asarray(user_factors, dtype=np.float64)
+        self.item_ids = np.asarray(item_ids, dtype=np.int64)
+        self.item_factors = np.asarray(item_factors, dtype=np.float64)
+        self.content_projection = content_projection
+        self.regularization = config['REGULARIZATION'] if regularization is None else regularization
+        self.alpha = config['ALPHA'] if alpha is None else alpha
+        self.user_rows = {user_id: row for row, user_id in enumerate(self.user_ids.tolist())}
+        self.item_rows = {item_id: row for row, item_id in enumerate(self.item_ids.tolist())}
+        self._grams = {}
+
+    @property
+    def factors(self):
+        return self.item_factors.shape[1]
+
+    def gram(self, side):
+        """`F^T F + regularization * I` of the 'user' or 'item' factors, the base of every fold-in."""
+        cached = self._grams.get(side)
+        if cached is None:
+            fixed = self.user_factors if side == 'user' else self.item_factors
+            cached = self._grams[side] = fixed.T @ fixed + self.regularization * np.eye(self.factors)
+        return cached
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            projection = data['content_projection'] if data['content_projection'].size else None
+            return cls(
+                data['user_ids'], data['user_factors'], data['item_ids'], data['item_factors'], projection,
+                float(data['regularization']), float(data['alpha']),
+            )
+
+    def save(self, path):
+        """Atomically write the factors."""
+        directory = os.path.dirname(os.path.abspath(path))
+        with tempfile.NamedTemporaryFile(dir=directory, suffix='.npz', delete=False) as handle:
+            np.savez(
+                handle,
+                user_ids=self.user_ids,
+                user_factors=self.user_factors,
+                item_ids=self.item_ids,
+                item_factors=self.item_factors,
+                content_projection=self.content_projection if self.content_projection is not None else np.empty(0),
+                regularization=np.float64(self.regularization),
+                alpha=np.float64(self.alpha),
+            )
+        os.replace(handle.name, path)
+
+
+# Ids per `__in` lookup, below SQLite's bound-parameter limit.
+QUERY_CHUNK_SIZE = 500
+
+
+def _chunks(ids):
+    for start in range(0, len(ids), QUERY_CHUNK_SIZE):
+        yield ids[start:start + QUERY_CHUNK_SIZE]
+
+
+def train_from_database(progress=None, **options):
+    """
+    Train a `FactorModel` on every `UserInteractions` row and fit the
+    content projection on the trained articles' embeddings.
+
+    Args:
+        progress (callable): Passed to `train`.
+        **options: `train` overrides (factors, regularization, alpha, iterations, threads).
+    """
+    from .models import Article, UserInteractions
+
+    rows = UserInteractions.objects.values_list('user_id', 'article_id', 'clicked', 'time_spent')
+    columns = list(zip(*rows.iterator(chunk_size=10000))) or [(), (), (), ()]
+    user_ids, article_ids, clicked, time_spent = columns
+    matrix, users, articles = interaction_matrix(user_ids, article_ids, interaction_strength(clicked, time_spent))
+    user_factors, item_factors = train(matrix, progress=progress, **options)
+
+    # Accumulated over chunks so the embeddings are never all in memory.
+    config = collaborative_settings()
+    gram = target = None
+    item_rows = {item_id: row for row, item_id in enumerate(articles.tolist())}
+    for chunk in _chunks(articles.tolist()):
+        embedded = Article.objects.filter(id__in=chunk, vector_embedding__isnull=False).values_list(
+            'id', 'vector_embedding'
+        )
+        for article_id, embedding in embedded:
+            embedding = np.asarray(embedding, dtype=np.float64)
+            if gram is None:
+                gram = np.zeros((len(embedding), len(embedding)))
+                target = np.zeros((len(embedding), item_factors.shape[1]))
+            gram += np.outer(embedding, embedding)
+            target += np.outer(embedding, item_factors[item_rows[article_id]])
+    projection = None
+    if gram is not None:
+        projection = np.linalg.solve(gram + config['CONTENT_REGULARIZATION'] * np.eye(len(gram)), target)
+    return FactorModel(
+        users, user_factors, articles, item_factors, projection,
+        options.get('regularization'), options.get('alpha'),
+    )
+
+
+class CollaborativeRecommender:
+    """Per-process view of the saved factors plus folded-in users and articles; see the module docstring."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._model = None
+        self._mtime = None
+        self._checked_at = None
+        self._reset()
+
+    def _reset(self):
+        self._users = {}
+        self._stale_users = set()
+        self._folded_items = {}
+        self._active_ids = np.empty(0, dtype=np.int64)
+        self._active_factors = np.empty((0, 0))
+
+    @property
+    def model(self):
+        return self._model
+
+    def ensure_fresh(self):
+        """
+        Load the factors on first use and whenever PATH is rewritten, and
+        refresh the active articles' factors every REFRESH_INTERVAL seconds.
+        """
+        config = collaborative_settings()
+        now = timezone.now().timestamp()
+        if self._checked_at is not None and now - self._checked_at < config['REFRESH_INTERVAL']:
+            return
+        path = config['PATH']
+        mtime = os.path.getmtime(path) if path and os.path.exists(path) else None
+        with self._lock:
+            if mtime != self._mtime:
+                self._model = FactorModel.load(path) if mtime is not None else None
+                self._mtime = mtime
+                self._reset()
+            if self._model is not None:
+                self._refresh_active()
+            self._checked_at = now
+
+    def set_model(self, model):
+        """Serve `model` (instead of the file at PATH) until the file changes."""
+        with self._lock:
+            self._model = model
+            self._reset()
+            self._refresh_active()
+            self._checked_at = timezone.now().timestamp()
+
+    @span('collaborative.refresh')
+    def _refresh_active(self):
+        from .models import ActiveArticles
+
+        model = self._model
+        ids = np.array(ActiveArticles.objects.order_by('id').values_list('id', flat=True), dtype=np.int64)
+        rows = np.searchsorted(model.item_ids, ids)
+        known = rows < len(model.item_ids)
+        known[known] = model.item_ids[rows[known]] == ids[known]
+        missing = [article_id for article_id in ids[~known].tolist() if article_id not in self._folded_items]
+        if missing:
+            self._folded_items.update(self._fold_in_items(missing))
+        active = set(ids.tolist())
+        self._folded_items = {i: factors for i, factors in self._folded_items.items() if i in active}
+
+        factors = np.zeros((len(ids), model.factors))
+        factors[known] = model.item_factors[rows[known]]
+        has_factors = known.copy()
+        for position in np.flatnonzero(~known).tolist():
+            folded = self._folded_items.get(int(ids[position]))
+            if folded is not None:
+                factors[position] = folded
+                has_factors[position] = True
+        self._active_ids, self._active_factors = ids[has_factors], factors[has_factors]
+
+    def _fold_in_items(self, article_ids):
+        """Factors of articles missing from the model: from their readers, else from their embeddings."""
+        from .models import Article, UserInteractions
+
+        model = self._model
+        readers = {}
+        for chunk in _chunks(article_ids):
+            for article_id, user_id, clicked, time_spent in UserInteractions.objects.filter(
+                article_id__in=chunk
+            ).values_list('article_id', 'user_id', 'clicked', 'time_spent'):
+                row = model.user_rows.get(user_id)
+                if row is not None:
+                    readers.setdefault(article_id, []).append((row, clicked, time_spent))
+        folded = {}
+        for article_id, reads in readers.items():
+            rows, clicked, time_spent = zip(*reads)
+            folded[article_id] = solve_one(
+                model.gram('user'), model.user_factors[list(rows)],
+                interaction_strength(clicked, time_spent), model.alpha,
+            )
+        unread = [article_id for article_id in article_ids if article_id not in folded]
+        if model.content_projection is not None:
+            for chunk in _chunks(unread):
+                for article_id, embedding in Article.objects.filter(
+                    id__in=chunk, vector_embedding__isnull=False
+                ).values_list('id', 'vector_embedding'):
+                    if len(embedding) == model.content_projection.shape[0]:
+                        folded[article_id] = np.asarray(embedding, dtype=np.float64) @ model.content_projection
+        return folded
+
+    def users_changed(self, user_ids):
+        """Refold these users' factors on their next recommendation (call after they read something)."""
+        with self._lock:
+            if self._model is not None:
+                self._stale_users.update(user_ids)
+
+    def _item_factors(self, article_ids):
+        model = self._model
+        rows, factors = [], []
+        for position, article_id in enumerate(article_ids):
+            row = model.item_rows.get(article_id)
+            vector = model.item_factors[row] if row is not None else self._folded_items.get(article_id)
+            if vector is not None:
+                rows.append(position)
+                factors.append(vector)
+        return rows, np.array(factors).reshape(len(factors), model.factors)
+
+    def user_factors(self, user_id):
+        """The user's factors, folded in from their interactions when new or stale; None without any."""
+        from .models import UserInteractions
+
+        model = self._model
+        with self._lock:
+            if user_id not in self._stale_users:
+                if user_id in self._users:
+                    return self._users[user_id]
+                row = model.user_rows.get(user_id)
+                if row is not None:
+                    return model.user_factors[row]
+        reads = list(UserInteractions.objects.filter(user_id=user_id).values_list('article_id', 'clicked', 'time_spent'))
+        if not reads:
+            return None
+        article_ids, clicked, time_spent = zip(*reads)
+        rows, fixed = self._item_factors(article_ids)
+        if not rows:
+            return None
+        strengths = interaction_strength(clicked, time_spent)[rows]
+        factors = solve_one(model.gram('item'), fixed, strengths, model.alpha)
+        with self._lock:
+            self._users[user_id] = factors
+            self._stale_users.discard(user_id)
+        return factors
+
+    def recommend(self, user_id, k, exclude_ids=()):
+        """
+        `(article_id, score)` of the `k` best active articles for a user, by
+        one product of the active item factors with the user's factors. Empty
+        when disabled, untrained, or the user has no usable interactions.
+        """
+        if not collaborative_settings()['ENABLED']:
+            return []
+        self.ensure_fresh()
+        if self._model is None or not len(self._active_ids):
+            return []
+        factors = self.user_factors(user_id)
+        if factors is None:
+            return []
+        with self._lock:
+            ids, item_factors = self._active_ids, self._active_factors
+        scores = item_factors @ factors
+        if len(exclude_ids):
+            scores[np.isin(ids, np.fromiter(exclude_ids, dtype=np.int64))] = -np.inf
+        return [(int(ids[i]), float(scores[i])) for i in top_k_indices(scores, k)]
+
+
+collaborative_model = CollaborativeRecommender()
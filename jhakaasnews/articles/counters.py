@@ -0,0 +1,186 @@
+"""
+Buffered `views` / `time_spent_on` counters.
+
+`article_detail` used to run `UPDATE ... SET views = views + 1` per page view,
+so every reader of a hot article queued on the same row lock. Increments now
+go into an in-process accumulator split into SHARDS independently locked
+dicts (by article id), and a background thread writes them every
+FLUSH_INTERVAL seconds: one `UPDATE articles_article SET views = views + n,
+time_spent_on = time_spent_on + t WHERE id IN (...)` per distinct (n, t)
+pair, touching only the counter columns and never running `Article.save`.
+Each write also feeds the in-memory trending ranking (see trending.py).
+
+Stored counters lag by up to FLUSH_INTERVAL; `merge_pending` adds what is
+still buffered in this process for reads that need current numbers. Counts
+buffered by other processes are only visible once they flush. Set SYNC to
+write every increment immediately (e.g. in tests).
+"""
+import atexit
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+
+from .instrumentation import span
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'SHARDS': 16,
+    'FLUSH_INTERVAL': 5.0,
+    'MAX_PENDING': 10000,
+    'SYNC': False,
+}
+
+# Ids per UPDATE, below SQLite's bound-parameter limit.
+UPDATE_CHUNK_SIZE = 500
+
+
+def counter_settings():
+    return {**DEFAULTS, **getattr(settings, 'ARTICLE_COUNTERS', {})}
+
+
+@span('counters.write')
+def write_counts(deltas):
+    """
+    Add `{article_id: (views, time_spent)}` to the stored counters, batching
+    articles with equal increments into one UPDATE. Returns the number of
+    UPDATE statements run.
+    """
+    from .models import Article
+    from .trending import trending_engine
+
+    by_delta = defaultdict(list)
+    for article_id, delta in deltas.items():
+        if any(delta):
+            by_delta[tuple(delta)].append(article_id)
+    statements = 0
+    with transaction.atomic():
+        for (views, time_spent), article_ids in by_delta.items():
+            # Sorted so concurrent flushes take row locks in the same order.
+            article_ids.sort()
+            for start in range(0, len(article_ids), UPDATE_CHUNK_SIZE):
+                Article.objects.filter(pk__in=article_ids[start:start + UPDATE_CHUNK_SIZE]).update(
+                    views=F('views') + views, time_spent_on=F('time_spent_on') + time_spent
+                )
+                statements += 1
+        # Recorded before the commit, so a concurrent trending sync never
+        # counts these again as another process's writes.
+        trending_engine.record(deltas)
+    return statements
+
+
+class CounterAccumulator:
+    """Sharded in-memory counter deltas, flushed in batches by a daemon thread."""
+
+    def __init__(self, shards=None):
+        self._shards = [
+            (threading.Lock(), {}) for _ in range(shards or counter_settings()['SHARDS'])
+        ]
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        # Approximate number of buffered articles; only decides when to flush early.
+        self._size = 0
+
+    def _shard(self, article_id):
+        return self._shards[article_id % len(self._shards)]
+
+    def start(self):
+        """Start the background flusher if it is not running."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='article-counters', daemon=True)
+            self._thread.start()
+
+    def add(self, article_id, views=0, time_spent=0):
+        """Count `views` page views and `time_spent` seconds of reading for an article."""
+        config = counter_settings()
+        if config['SYNC']:
+            write_counts({article_id: (views, time_spent)})
+            return
+        lock, pending = self._shard(article_id)
+        with lock:
+            delta = pending.get(article_id)
+            if delta is None:
+                pending[article_id] = [views, time_spent]
+                self._size += 1
+            else:
+                delta[0] += views
+                delta[1] += time_spent
+        self.start()
+        if self._size >= config['MAX_PENDING']:
+            self._wakeup.set()
+
+    def pending(self, article_id):
+        """`(views, time_spent)` buffered for an article and not yet written."""
+        lock, pending = self._shard(article_id)
+        with lock:
+            return tuple(pending.get(article_id, (0, 0)))
+
+    def merge_pending(self, articles):
+        """Add buffered counts to the `views` / `time_spent_on` of loaded articles, in place."""
+        for article in articles:
+            views, time_spent = self.pending(article.pk)
+            if 'views' in article.__dict__:
+                article.views += views
+            if 'time_spent_on' in article.__dict__:
+                article.time_spent_on += time_spent
+        return articles
+
+    def _take(self):
+        deltas = {}
+        for lock, pending in self._shards:
+            with lock:
+                taken = dict(pending)
+                pending.clear()
+            deltas.update(taken)
+        self._size = 0
+        return deltas
+
+    def _restore(self, deltas):
+        for article_id, (views, time_spent) in deltas.items():
+            lock, pending = self._shard(article_id)
+            with lock:
+                delta = pending.get(article_id)
+                if delta is None:
+                    delta = pending[article_id] = [0, 0]
+                    self._size += 1
+                delta[0] += views
+                delta[1] += time_spent
+
+    def flush(self):
+        """Write everything buffered so far. Returns the number of articles updated."""
+        with self._flush_lock:
+            deltas = self._take()
+            if not deltas:
+                return 0
+            try:
+                write_counts(deltas)
+            except Exception:
+                # Keep the counts for the next flush rather than lose them.
+                self._restore(deltas)
+                raise
+            return len(deltas)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(counter_settings()['FLUSH_INTERVAL'])
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Failed to flush article counters")
+            finally:
+                close_old_connections()
+
+
+article_counters = CounterAccumulator()
+# Registered at import, before the interaction pipeline's own exit flush, so
+# it runs last and also writes the reading time that flush adds.
+atexit.register(article_counters.flush)
@@ -0,0 +1,260 @@
+"""
+Near-duplicate detection over article text with 64-bit SimHash.
+
+Each text is reduced to word shingles (single words by default; longer
+shingles make the fingerprint more order-sensitive but also flip more bits per
+edit), every occurrence is hashed to 64 bits and the fingerprint keeps, per
+bit, the majority vote, so texts that share most of their words (syndicated
+wire copy with a different byline, lightly re-edited stories) land a few bits
+apart. Two articles are near-duplicates when their fingerprints differ in at
+most `MAX_DISTANCE` bits.
+
+`SimHashIndex` finds them without a full scan: the fingerprint is cut into
+`MAX_DISTANCE + 1` bands, and by pigeonhole any fingerprint within that
+distance matches the query exactly on at least one band. Each band keeps the
+fingerprints sorted by that band's bits, so a query checks one contiguous
+slice per band found with `searchsorted`; recent additions sit in a small
+unsorted tail that is merged once it grows. Re-adding an article replaces its
+fingerprint; the sorted entries of re-added and discarded articles are
+skipped until the next merge drops them.
+"""
+import threading
+
+import numpy as np
+from django.conf import settings
+
+from .tfidf import term_id, tokenize
+
+DEFAULTS = {
+    'ENABLED': True,
+    'MAX_DISTANCE': 5,
+    'SHINGLE_SIZE': 1,
+}
+
+BITS = np.arange(64, dtype=np.uint64)
+
+# splitmix64 constants, used to spread shingle hashes over all 64 bits.
+MIX_1 = np.uint64(0xBF58476D1CE4E5B9)
+MIX_2 = np.uint64(0x94D049BB133111EB)
+GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+
+
+def dedup_settings():
+    return {**DEFAULTS, **getattr(settings, 'NEAR_DUPLICATES', {})}
+
+
+def _mix(values):
+    values = values ^ (values >> np.uint64(30))
+    values = values * MIX_1
+    values = values ^ (values >> np.uint64(27))
+    values = values * MIX_2
+    return values ^ (values >> np.uint64(31))
+
+
+def simhash(text, shingle_size=None):
+    """64-bit SimHash of `text` as a NumPy uint64, or None for text without tokens."""
+    shingle_size = shingle_size or dedup_settings()['SHINGLE_SIZE']
+    tokens = np.array([term_id(token) for token in tokenize(text)], dtype=np.uint64)
+    if tokens.size == 0:
+        return None
+    width = min(shingle_size, tokens.size)
+    with np.errstate(over='ignore'):
+        shingles = np.zeros(tokens.size - width + 1, dtype=np.uint64)
+        for offset in range(width):
+            shingles = _mix(shingles * GOLDEN + tokens[offset:offset + shingles.size])
+    bits = (shingles[:, None] >> BITS) & np.uint64(1)
+    votes = 2 * bits.sum(axis=0, dtype=np.int64) - shingles.size
+    return np.bitwise_or.reduce((votes > 0).astype(np.uint64) << BITS)
+
+
+def to_signed(fingerprint):
+    """Store a uint64 fingerprint in a signed 64-bit database column."""
+    if fingerprint is None:
+        return None
+    return int(np.asarray(fingerprint, dtype=np.uint64).view(np.int64))
+
+
+# Set bits of every byte value, for NumPy < 2.0 (no np.bitwise_count).
+BYTE_BITS = np.array([bin(value).count('1') for value in range(256)], dtype=np.uint8)
+
+
+def byte_popcount(values):
+    """Set bits of each uint64 in `values`, by byte lookups in BYTE_BITS."""
+    values = np.asarray(values, dtype=np.uint64)
+    flat = np.ascontiguousarray(values.reshape(-1))
+    return BYTE_BITS[flat.view(np.uint8)].reshape(-1, 8).sum(axis=1, dtype=np.uint8).reshape(values.shape)
+
+
+popcount = getattr(np, 'bitwise_count', byte_popcount)
+
+
+def hamming(fingerprints, fingerprint):
+    return popcount(np.asarray(fingerprints, dtype=np.uint64) ^ np.uint64(fingerprint))
+
+
+class SimHashIndex:
+    """Banded index of `(article_id, fingerprint)` pairs for Hamming-radius queries."""
+
+    def __init__(self, max_distance=5, merge_threshold=50000):
+        self.max_distance = max_distance
+        self.merge_threshold = merge_threshold
+        bands = max_distance + 1
+        widths = [64 // bands + (1 if band < 64 % bands else 0) for band in range(bands)]
+        self._shifts = np.cumsum([0] + widths[:-1]).astype(np.uint64)
+        self._masks = np.array([(1 << width) - 1 for width in widths], dtype=np.uint64)
+        self._lock = threading.RLock()
+        self._ids = np.empty(0, dtype=np.int64)
+        self._fingerprints = np.empty(0, dtype=np.uint64)
+        # Per band: (sorted band keys, fingerprints and ids in that order), so a
+        # query's candidates are one contiguous slice per band.
+        self._tables = []
+        # article id -> fingerprint added since the last merge.
+        self._tail = {}
+        # Ids whose entries in the sorted tables are outdated (discarded or re-added).
+        self._stale = set()
+        self._merge()
+
+    def __len__(self):
+        return self._ids.shape[0] + len(self._tail)
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for table in self._tables for array in table)
+
+    def _band(self, fingerprints, band):
+        return (fingerprints >> self._shifts[band]) & self._masks[band]
+
+    def _merge(self):
+        if self._stale:
+            keep = ~np.isin(self._ids, np.fromiter(self._stale, dtype=np.int64, count=len(self._stale)))
+            self._ids, self._fingerprints = self._ids[keep], self._fingerprints[keep]
+            self._stale = set()
+        if self._tail:
+            self._ids = np.concatenate([self._ids, np.fromiter(self._tail.keys(), dtype=np.int64)])
+            self._fingerprints = np.concatenate(
+                [self._fingerprints, np.array(list(self._tail.values()), dtype=np.uint64)]
+            )
+            self._tail = {}
+        self._tables = []
+        for band in range(len(self._shifts)):
+            keys = self._band(self._fingerprints, band).astype(np.uint16 if self._masks[band] < 1 << 16 else np.uint32)
+            order = np.argsort(keys, kind='stable')
+            self._tables.append((keys[order], self._fingerprints[order], self._ids[order]))
+
+    def build(self, ids, fingerprints):
+        with self._lock:
+            self._ids = np.asarray(ids, dtype=np.int64)
+            self._fingerprints = np.asarray(fingerprints, dtype=np.uint64)
+            self._tail, self._stale = {}, set()
+            self._merge()
+        return self
+
+    def add(self, article_id, fingerprint):
+        """Index `article_id`, replacing its previous fingerprint if it had one."""
+        with self._lock:
+            self._stale.add(int(article_id))
+            self._tail[int(article_id)] = np.uint64(fingerprint)
+            if len(self._tail) >= self.merge_threshold:
+                self._merge()
+
+    def query(self, fingerprint, max_distance=None):
+        """`(article_ids, distances)` of indexed fingerprints within `max_distance` bits."""
+        max_distance = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+        fingerprint = np.uint64(fingerprint)
+        ids, distances = [], []
+        with self._lock:
+            for band, (keys, fingerprints, band_ids) in enumerate(self._tables):
+                key = self._band(fingerprint, band).astype(keys.dtype)
+                lo, hi = np.searchsorted(keys, key, 'left'), np.searchsorted(keys, key, 'right')
+                if lo == hi:
+                    continue
+                band_distances = hamming(fingerprints[lo:hi], fingerprint)
+                close = band_distances <= max_distance
+                ids.append(band_ids[lo:hi][close])
+                distances.append(band_distances[close])
+            if ids and self._stale:
+                # Outdated sorted entries; current fingerprints are in the tail.
+                ids, distances = np.concatenate(ids), np.concatenate(distances)
+                keep = ~np.isin(ids, np.fromiter(self._stale, dtype=np.int64, count=len(self._stale)))
+                ids, distances = [ids[keep]], [distances[keep]]
+            if self._tail:
+                tail_distances = hamming(np.array(list(self._tail.values()), dtype=np.uint64), fingerprint)
+                close = tail_distances <= max_distance
+                ids.append(np.fromiter(self._tail.keys(), dtype=np.int64)[close])
+                distances.append(tail_distances[close])
+        if not ids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.uint8)
+        # A match can be found through several bands.
+        ids, first = np.unique(np.concatenate(ids), return_index=True)
+        distances = np.concatenate(distances)[first]
+        return ids, distances
+
+    def discard(self, article_id):
+        """Stop returning `article_id`; its entries are dropped at the next merge."""
+        with self._lock:
+            self._stale.add(int(article_id))
+            self._tail.pop(int(article_id), None)
+
+    def nearest(self, fingerprint, exclude_id=None):
+        """Id of the closest near-duplicate of `fingerprint` other than `exclude_id`, or None."""
+        ids, distances = self.query(fingerprint)
+        if exclude_id is not None:
+            keep = ids != exclude_id
+            ids, distances = ids[keep], distances[keep]
+        if not ids.size:
+            return None
+        return int(ids[np.argmin(distances)])
+
+
+class ArticleDuplicateIndex(SimHashIndex):
+    """`SimHashIndex` over every stored article, loaded lazily from `Article.simhash`."""
+
+    def __init__(self):
+        super().__init__(max_distance=dedup_settings()['MAX_DISTANCE'])
+        self._loaded = False
+
+    def ensure_loaded(self):
+        if self._loaded:
+            return
+        from .models import Article
+
+        with self._lock:
+            if self._loaded:
+                return
+            rows = np.array(
+                Article.objects.exclude(simhash__isnull=True).values_list('id', 'simhash'), dtype=np.int64
+            ).reshape(-1, 2)
+            self.build(rows[:, 0], rows[:, 1].view(np.uint64))
+            self._loaded = True
+
+    def add(self, article_id, stored_fingerprint):
+        """Index an article by its stored (signed) `Article.simhash` value; None unindexes it."""
+        if not self._loaded:
+            return
+        if stored_fingerprint is None:
+            self.discard(article_id)
+        else:
+            super().add(article_id, np.int64(stored_fingerprint).view(np.uint64))
+
+    def find_duplicate(self, fingerprint, exclude_id=None):
+        """
+        Id of a stored near-duplicate of a fingerprint from `simhash`, other
+        than `exclude_id`, or None. Hits are checked against the database, so
+        entries left by rolled-back saves are dropped instead of reported.
+        """
+        if fingerprint is None:
+            return None
+        from .models import Article
+
+        self.ensure_loaded()
+        while True:
+            duplicate_id = self.nearest(fingerprint, exclude_id)
+            if duplicate_id is None:
+                return None
+            stored = Article.objects.filter(pk=duplicate_id).values_list('simhash', flat=True).first()
+            if stored is not None and hamming([np.int64(stored).view(np.uint64)], fingerprint)[0] <= self.max_distance:
+                return duplicate_id
+            self.add(duplicate_id, stored)
+
+
+duplicate_index = ArticleDuplicateIndex()
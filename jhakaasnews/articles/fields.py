@@ -0,0 +1,133 @@
+import base64
+
+import numpy as np
+from django.core import exceptions
+from django.db import models
+
+
+class VectorField(models.BinaryField):
+    """
+    Dense vector stored as packed little-endian float bytes.
+
+    Works on any backend with a binary column type (BLOB on sqlite, bytea on
+    Postgres). Values read from the database are zero-copy, read-only NumPy views
+    created with `np.frombuffer`, so fetching a row never allocates one Python
+    float per element. Assign any sequence or array; it is packed on save.
+    """
+    description = "Packed float vector"
+
+    def __init__(self, *args, dim=None, dtype='float32', **kwargs):
+        self.dim = dim
+        self.dtype = np.dtype(dtype).newbyteorder('<')
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.dim is not None:
+            kwargs['dim'] = self.dim
+        if self.dtype != np.dtype('<f4'):
+            kwargs['dtype'] = self.dtype.name
+        return name, path, args, kwargs
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return None
+        return np.frombuffer(value, dtype=self.dtype)
+
+    def to_python(self, value):
+        if value is None or isinstance(value, np.ndarray):
+            return value
+        if isinstance(value, str):
+            value = base64.b64decode(value.encode('ascii'))
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return np.frombuffer(value, dtype=self.dtype)
+        return np.asarray(value, dtype=self.dtype)
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if value is None:
+            return None
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return super().get_db_prep_value(value, connection, prepared)
+        vector = np.asarray(value, dtype=self.dtype).ravel()
+        if self.dim is not None and vector.shape[0] != self.dim:
+            raise exceptions.ValidationError(
+                f"Expected a vector of {self.dim} values, got {vector.shape[0]}."
+            )
+        return super().get_db_prep_value(vector.tobytes(), connection, prepared)
+
+    def value_to_string(self, obj):
+        value = self.value_from_object(obj)
+        if value is None:
+            return None
+        return base64.b64encode(np.asarray(value, dtype=self.dtype).tobytes()).decode('ascii')
+
+
+class SparseVector:
+    """Sparse vector as parallel `indices` (int32) and `values` (float32) arrays."""
+    __slots__ = ('indices', 'values')
+
+    def __init__(self, indices, values):
+        self.indices = np.asarray(indices, dtype='<i4')
+        self.values = np.asarray(values, dtype='<f4')
+
+    @property
+    def nnz(self):
+        return self.indices.shape[0]
+
+    def __repr__(self):
+        return f'SparseVector(nnz={self.nnz})'
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, SparseVector)
+            and np.array_equal(self.indices, other.indices)
+            and np.array_equal(self.values, other.values)
+        )
+
+    def norm(self):
+        return float(np.linalg.norm(self.values))
+
+    def to_bytes(self):
+        return np.array([self.nnz], dtype='<u4').tobytes() + self.indices.tobytes() + self.values.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        nnz = int(np.frombuffer(data, dtype='<u4', count=1)[0])
+        vector = cls.__new__(cls)
+        vector.indices = np.frombuffer(data, dtype='<i4', count=nnz, offset=4)
+        vector.values = np.frombuffer(data, dtype='<f4', count=nnz, offset=4 + 4 * nnz)
+        return vector
+
+
+class SparseVectorField(models.BinaryField):
+    """
+    Sparse vector stored as `nnz` (uint32) followed by packed int32 indices and
+    float32 values. Values read from the database are `SparseVector`s whose
+    arrays are zero-copy views of the column bytes.
+    """
+    description = "Packed sparse float vector"
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return None
+        return SparseVector.from_bytes(value)
+
+    def to_python(self, value):
+        if value is None or isinstance(value, SparseVector):
+            return value
+        if isinstance(value, str):
+            value = base64.b64decode(value.encode('ascii'))
+        return SparseVector.from_bytes(value)
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if value is None:
+            return None
+        if isinstance(value, SparseVector):
+            value = value.to_bytes()
+        return super().get_db_prep_value(value, connection, prepared)
+
+    def value_to_string(self, obj):
+        value = self.value_from_object(obj)
+        if value is None:
+            return None
+        return base64.b64encode(value.to_bytes()).decode('ascii')
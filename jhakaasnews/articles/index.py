@@ -0,0 +1,277 @@
+"""
+Process-level in-memory index of active article embeddings.
+
+Article similarity used to be computed with a Python loop calling
+`scipy.spatial.distance.cosine` once per candidate. The index below keeps every
+active article's embedding in one contiguous, pre-normalized float32 matrix so a
+query is a single matrix-vector product followed by an `argpartition` top-k.
+Large windows can instead be searched through an approximate backend from
+`ann.py`; rows changed since that backend was built are scored exactly. The
+backend is built in a background thread from a snapshot of the matrix, so
+requests keep ranking against the previous backend (or exactly) meanwhile.
+"""
+import logging
+import threading
+
+import numpy as np
+from django.utils import timezone
+
+from .ann import ann_settings, make_backend
+from .instrumentation import span
+from .ranking import normalize_rows, rank_candidates, seen_mask, top_k_indices
+
+logger = logging.getLogger(__name__)
+
+
+class ArticleVectorIndex:
+    """
+    Contiguous matrix of L2-normalized article embeddings with an id -> row map.
+
+    Rows are appended into a pre-allocated buffer that grows geometrically, and
+    removals move the last row into the freed slot so the live rows always occupy
+    `matrix[:size]`.
+    """
+
+    def __init__(self, initial_capacity=1024):
+        self._lock = threading.RLock()
+        self._initial_capacity = initial_capacity
+        self._reset(dim=0)
+        self._built = False
+        self._built_at = 0.0
+        self._expires_at = None
+
+    def _reset(self, dim):
+        self.dim = dim
+        self.size = 0
+        self._matrix = np.zeros((self._initial_capacity if dim else 0, dim), dtype=np.float32)
+        self._ids = np.zeros(self._matrix.shape[0], dtype=np.int64)
+        self._timestamps = np.zeros(self._matrix.shape[0], dtype=np.float64)
+        self._rows = {}
+        self._ann = None
+        self._ann_pending = set()
+        # Ids changed since the snapshot of the backend being built, or None.
+        self._building_pending = None
+        # Bumped on every reset so a build of an older snapshot is discarded.
+        self._generation = getattr(self, '_generation', 0) + 1
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, article_id):
+        return article_id in self._rows
+
+    @staticmethod
+    def _normalize(vector):
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        if not np.isfinite(norm) or norm == 0:
+            return None
+        return vector / norm
+
+    def _grow(self):
+        capacity = max(self._initial_capacity, 2 * self._matrix.shape[0])
+        matrix = np.zeros((capacity, self.dim), dtype=np.float32)
+        matrix[:self.size] = self._matrix[:self.size]
+        ids = np.zeros(capacity, dtype=np.int64)
+        ids[:self.size] = self._ids[:self.size]
+        timestamps = np.zeros(capacity, dtype=np.float64)
+        timestamps[:self.size] = self._timestamps[:self.size]
+        self._matrix, self._ids, self._timestamps = matrix, ids, timestamps
+
+    def add(self, article_id, vector, date_added=None):
+        """Insert or replace the embedding of one article."""
+        if vector is None or len(vector) == 0:
+            self.remove(article_id)
+            return
+        normalized = self._normalize(vector)
+        if normalized is None:
+            self.remove(article_id)
+            return
+        timestamp = (date_added or timezone.now()).timestamp()
+        with self._lock:
+            if self.dim == 0:
+                self._reset(dim=normalized.shape[0])
+            if normalized.shape[0] != self.dim:
+                self.remove(article_id)
+                return
+            row = self._rows.get(article_id)
+            if row is None:
+                if self.size == self._matrix.shape[0]:
+                    self._grow()
+                row = self.size
+                self.size += 1
+                self._rows[article_id] = row
+            self._matrix[row] = normalized
+            self._ids[row] = article_id
+            self._timestamps[row] = timestamp
+            self._changed(article_id)
+            self._update_expiry(timestamp)
+
+    def remove(self, article_id):
+        """Drop an article from the index; unknown ids are ignored."""
+        with self._lock:
+            row = self._rows.pop(article_id, None)
+            if row is None:
+                return
+            self._changed(article_id)
+            last = self.size - 1
+            if row != last:
+                self._matrix[row] = self._matrix[last]
+                self._ids[row] = self._ids[last]
+                self._timestamps[row] = self._timestamps[last]
+                self._rows[int(self._ids[row])] = row
+            self.size = last
+
+    def _changed(self, article_id):
+        self._ann_pending.add(article_id)
+        if self._building_pending is not None:
+            self._building_pending.add(article_id)
+
+    def _update_expiry(self, timestamp):
+        from .models import ACTIVE_WINDOW
+
+        expires_at = timestamp + ACTIVE_WINDOW.total_seconds()
+        if self._expires_at is None or expires_at < self._expires_at:
+            self._expires_at = expires_at
+
+    @span('article_index.rebuild')
+    def rebuild(self):
+        """Reload the whole index from the active-article window in the database."""
+        from .models import ActiveArticles
+
+        rows = (
+            ActiveArticles.objects.ranking()
+            .exclude(vector_embedding__isnull=True)
+            .values_list('id', 'vector_embedding', 'date_added')
+        )
+        with self._lock:
+            self._reset(dim=0)
+            self._expires_at = None
+            for article_id, vector, date_added in rows.iterator():
+                self.add(article_id, vector, date_added)
+            self._built = True
+            self._built_at = timezone.now().timestamp()
+
+    def ensure_fresh(self):
+        """
+        Build the index on first use and rebuild it once the oldest indexed
+        article has rolled out of the active window, or every REFRESH_INTERVAL
+        seconds to pick up vectors written by other processes.
+        """
+        now = timezone.now().timestamp()
+        if (
+            not self._built
+            or (self._expires_at is not None and now >= self._expires_at)
+            or now - self._built_at >= ann_settings()['REFRESH_INTERVAL']
+        ):
+            self.rebuild()
+
+    def similarities(self, vector):
+        """Exact cosine similarity of `vector` with every indexed article, as `(ids, scores)`."""
+        normalized = self._normalize(vector) if vector is not None and len(vector) else None
+        with self._lock:
+            if normalized is None or normalized.shape[0] != self.dim:
+                return self._ids[:0].copy(), np.empty(0, dtype=np.float32)
+            return self._ids[:self.size].copy(), self._matrix[:self.size] @ normalized
+
+    def search(self, vector, k=3, exclude_ids=()):
+        """
+        Return up to `k` `(article_id, cosine_similarity)` pairs, best first.
+
+        Args:
+            vector: Query embedding; it does not need to be normalized.
+            k (int): Number of neighbours to return.
+            exclude_ids (iterable): Article ids that must not be returned.
+        """
+        if vector is None or len(vector) == 0:
+            return []
+        return self.rank(vector, k, seen_ids=[exclude_ids])[0]
+
+    def rank(self, queries, k=3, seen_ids=None):
+        """
+        Rank every indexed article for one query or a batch of queries at once.
+
+        Args:
+            queries: One embedding or a queries x dims matrix (e.g. user profiles).
+            k (int): Number of articles to return per query.
+            seen_ids (list): Optional list with one iterable of article ids to
+                exclude per query.
+
+        Returns:
+            list: One list of `(article_id, score)` pairs per query.
+        """
+        queries = np.array(queries, dtype=np.float32, ndmin=2)
+        with self._lock:
+            if self.size == 0 or queries.shape[1] != self.dim:
+                return [[] for _ in range(queries.shape[0])]
+            ann = self._approximate_backend()
+            if ann is not None:
+                return self._rank_approximate(ann, queries, k, seen_ids)
+            ids = self._ids[:self.size]
+            mask = seen_mask(ids, seen_ids) if seen_ids is not None else None
+            results = rank_candidates(queries, self._matrix[:self.size], k, mask)
+            return [
+                [(int(ids[row]), float(score)) for row, score in zip(rows, scores)]
+                for rows, scores in results
+            ]
+
+    def _approximate_backend(self):
+        """
+        Return the ANN backend to search, or None when an exact scan should be
+        used. Starts a build when there is none yet or too many rows changed
+        since the last one; the current backend is returned until it is ready.
+        """
+        config = ann_settings()
+        if config['BACKEND'] == 'exact' or self.size < config['MIN_SIZE']:
+            return None
+        if self._building_pending is None and (
+            self._ann is None or len(self._ann_pending) > config['REBUILD_FRACTION'] * self.size
+        ):
+            ids, matrix = self._ids[:self.size].copy(), self._matrix[:self.size].copy()
+            self._building_pending = set()
+            if config['SYNC']:
+                self._build(self._generation, ids, matrix, config)
+            else:
+                threading.Thread(
+                    target=self._build, args=(self._generation, ids, matrix, config),
+                    name='article-ann-build', daemon=True,
+                ).start()
+        return self._ann
+
+    def _build(self, generation, ids, matrix, config):
+        """Build a backend from a snapshot outside the lock, then swap it in."""
+        ann = None
+        try:
+            with span('article_index.ann_build'):
+                ann = make_backend(config).build(ids, matrix)
+        except Exception:
+            logger.exception("Building the approximate article index failed")
+        with self._lock:
+            if generation != self._generation:
+                return
+            if ann is not None:
+                # Rows changed while building are scored exactly until the next build.
+                self._ann, self._ann_pending = ann, self._building_pending
+            self._building_pending = None
+
+    def _rank_approximate(self, ann, queries, k, seen_ids):
+        """Merge ANN candidates with an exact scan of rows changed since the build."""
+        seen_ids = [np.fromiter(ids, dtype=np.int64) for ids in (seen_ids or [()] * len(queries))]
+        pending_ids = np.fromiter(self._ann_pending, dtype=np.int64)
+        live_pending = np.array([i for i in self._ann_pending if i in self._rows], dtype=np.int64)
+        pending_matrix = self._matrix[[self._rows[i] for i in live_pending]]
+        pending_scores = normalize_rows(queries) @ pending_matrix.T
+
+        fetch = k + max((ids.size for ids in seen_ids), default=0) + pending_ids.size
+        results = []
+        for (ann_ids, ann_scores), seen, extra_scores in zip(ann.search(queries, fetch), seen_ids, pending_scores):
+            keep = ~(np.isin(ann_ids, pending_ids) | np.isin(ann_ids, seen))
+            extra_keep = ~np.isin(live_pending, seen)
+            ids = np.concatenate([ann_ids[keep], live_pending[extra_keep]])
+            scores = np.concatenate([ann_scores[keep], extra_scores[extra_keep]])
+            best = top_k_indices(scores, k)
+            results.append([(int(ids[i]), float(scores[i])) for i in best])
+        return results
+
+
+article_index = ArticleVectorIndex()
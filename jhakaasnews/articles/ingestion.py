@@ -0,0 +1,230 @@
+"""
+Buffered ingestion of reading-time events posted to `update_interaction`.
+
+The view only enqueues an `InteractionEvent`; a background thread drains the
+queue in batches and applies them with a fixed number of queries per flush:
+one lookup of the affected interactions, one bulk insert and one bulk update,
+and one NumPy fold per user profile. Reading time is added to the buffered
+article counters (see articles/counters.py), and reads of articles the home
+bandit showed count as its clicks (see articles/bandits.py).
+"""
+import atexit
+import logging
+import queue
+import threading
+import time
+from collections import defaultdict, namedtuple
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .bandits import home_bandit
+from .caching import bump_user_versions
+from .collaborative import collaborative_model
+from .counters import article_counters
+from .instrumentation import span
+
+logger = logging.getLogger(__name__)
+
+InteractionEvent = namedtuple(
+    'InteractionEvent',
+    ['user_id', 'article_id', 'session_id', 'time_spent', 'final_update', 'created_at'],
+    defaults=(None,),
+)
+
+DEFAULTS = {
+    'BATCH_SIZE': 500,
+    'FLUSH_INTERVAL': 1.0,
+    'MAX_QUEUE_SIZE': 10000,
+    'SYNC': False,
+}
+
+
+def ingestion_settings():
+    return {**DEFAULTS, **getattr(settings, 'INTERACTION_INGESTION', {})}
+
+
+@span('ingestion.apply_events')
+def apply_events(events):
+    """
+    Persist a batch of interaction events.
+
+    Events for the same (user, article, session) are folded: the latest
+    `time_spent` wins and the interaction is marked clicked once any event is a
+    final update. Events for articles that no longer exist are dropped, so
+    they cannot fail the rest of the batch. Article counters and user
+    profiles are only updated for interactions that become clicked in this
+    batch, matching `UserInteractions.save`.
+    """
+    from .models import Article, UserInteractions, UserProfile
+
+    folded = {}
+    for event in events:
+        key = (event.user_id, event.article_id, event.session_id)
+        previous = folded.get(key)
+        folded[key] = (
+            event.time_spent,
+            event.final_update or (previous is not None and previous[1]),
+            event.created_at or timezone.now(),
+        )
+    if not folded:
+        return 0
+
+    user_ids = {user_id for user_id, _, _ in folded}
+    article_ids = {article_id for _, article_id, _ in folded}
+    with transaction.atomic():
+        known = set(Article.objects.filter(pk__in=article_ids).values_list('id', flat=True))
+        if known != article_ids:
+            logger.warning("Dropped interaction events for missing articles %s", sorted(article_ids - known))
+            folded = {key: value for key, value in folded.items() if key[1] in known}
+            article_ids = known
+        existing = {
+            (i.user_id, i.article_id, i.session_id): i
+            for i in UserInteractions.objects.select_for_update().filter(
+                user_id__in=user_ids,
+                article_id__in=article_ids,
+                session_id__in={session_id for _, _, session_id in folded},
+            )
+        }
+        to_create, to_update, clicks = [], [], []
+        for key, (time_spent, final_update, created_at) in folded.items():
+            interaction = existing.get(key)
+            newly_clicked = final_update and (interaction is None or not interaction.clicked)
+            if interaction is None:
+                user_id, article_id, session_id = key
+                to_create.append(UserInteractions(
+                    user_id=user_id, article_id=article_id, session_id=session_id,
+                    time_spent=time_spent, clicked=final_update, created_at=created_at,
+                ))
+            else:
+                interaction.time_spent = time_spent
+                interaction.clicked = interaction.clicked or final_update
+                to_update.append(interaction)
+            if newly_clicked:
+                clicks.append((key[0], key[1], time_spent, created_at))
+
+        UserInteractions.objects.bulk_create(to_create)
+        UserInteractions.objects.bulk_update(to_update, ['time_spent', 'clicked'])
+
+        if clicks:
+            _fold_profiles(clicks, Article, UserProfile)
+    # Reading time goes to the buffered counters once the interactions are
+    # stored; the views themselves were counted by article_detail.
+    for _, article_id, time_spent, _ in clicks:
+        article_counters.add(article_id, time_spent=time_spent)
+    # Reads of articles the home bandit showed are its rewards.
+    home_bandit.record_clicks([(user_id, article_id) for user_id, article_id, _, _ in clicks])
+    # Bulk writes send no post_save, so invalidate the users' cached pages here,
+    # and have their collaborative factors refolded with the new reads.
+    bump_user_versions(user_ids)
+    collaborative_model.users_changed(user_ids)
+    return len(folded)
+
+
+def _fold_profiles(clicks, Article, UserProfile):
+    vectors = {
+        article_id: (embedding, tfidf)
+        for article_id, embedding, tfidf in Article.objects.filter(
+            pk__in={article_id for _, article_id, _, _ in clicks}
+        ).values_list('id', 'vector_embedding', 'tfidf_vector')
+    }
+    per_user = defaultdict(list)
+    for user_id, article_id, time_spent, created_at in clicks:
+        embedding, tfidf = vectors.get(article_id, (None, None))
+        per_user[user_id].append((embedding, tfidf, time_spent, created_at))
+
+    profiles = {p.user_id: p for p in UserProfile.objects.filter(user_id__in=per_user)}
+    missing = [UserProfile(user_id=user_id) for user_id in per_user if user_id not in profiles]
+    for profile in UserProfile.objects.bulk_create(missing):
+        profiles[profile.user_id] = profile
+
+    changed = [
+        profiles[user_id] for user_id, interactions in per_user.items()
+        if profiles[user_id].fold_interactions(interactions)
+    ]
+    UserProfile.objects.bulk_update(
+        changed,
+        ['vector_embedding_profile', 'tfidf_profile', 'watched_articles',
+         'embedding_norm', 'tfidf_norm', 'profile_updated_at'],
+    )
+
+
+class InteractionPipeline:
+    """In-process queue drained by a daemon thread that calls `apply_events` per batch."""
+
+    def __init__(self):
+        self._queue = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def _start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            if self._queue is None:
+                self._queue = queue.Queue(maxsize=ingestion_settings()['MAX_QUEUE_SIZE'])
+                atexit.register(self.flush)
+            self._thread = threading.Thread(
+                target=self._run, name='interaction-ingestion', daemon=True
+            )
+            self._thread.start()
+
+    def enqueue(self, event):
+        """Queue one event; applied inline when SYNC is set or the queue is full."""
+        if ingestion_settings()['SYNC']:
+            apply_events([event])
+            return
+        self._start()
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.flush()
+            apply_events([event])
+
+    def _drain(self, limit):
+        events = []
+        while len(events) < limit:
+            try:
+                events.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return events
+
+    def flush(self):
+        """Apply everything queued so far in the calling thread."""
+        if self._queue is None:
+            return 0
+        applied = 0
+        with self._flush_lock:
+            batch_size = ingestion_settings()['BATCH_SIZE']
+            while True:
+                events = self._drain(batch_size)
+                if not events:
+                    return applied
+                applied += apply_events(events)
+
+    def _run(self):
+        while True:
+            config = ingestion_settings()
+            events = [self._queue.get()]
+            deadline = time.monotonic() + config['FLUSH_INTERVAL']
+            while len(events) < config['BATCH_SIZE']:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    events.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                with self._flush_lock:
+                    apply_events(events)
+            except Exception:
+                logger.exception("Dropped a batch of %d interaction events", len(events))
+            finally:
+                close_old_connections()
+
+
+interaction_pipeline = InteractionPipeline()
@@ -0,0 +1,279 @@
+"""
+Request and hot-path instrumentation for the articles app.
+
+Three pieces:
+
+- `InstrumentationMiddleware` times every request and counts its SQL
+  queries and their time (through `connection.execute_wrapper`). It records
+  them per view and sends the totals back in a `Server-Timing` header. A
+  PROFILE_SAMPLE_RATE fraction of requests runs under cProfile. The
+  profiles of those slower than PROFILE_SLOW_SECONDS are written to
+  PROFILE_DIR, keeping the newest PROFILE_KEEP.
+- `span(name)` is a context manager and a decorator. It times a block into
+  the `articles_span_seconds` histogram and adds it to the current
+  request's `Server-Timing` totals. Recommendation stages, vectorization,
+  index rebuilds, counter flushes and interaction ingestion use spans.
+- `registry` keeps histograms in process memory, plus gauge collectors
+  called at scrape time. `metrics` serves it in the Prometheus text format
+  to METRICS_ALLOWED_IPS.
+
+Registry values are per process. Scrape each worker, or add a label per
+process in the scraper.
+"""
+import bisect
+import contextvars
+import cProfile
+import random
+import threading
+import time
+from contextlib import ContextDecorator
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse, HttpResponseForbidden
+
+DEFAULTS = {
+    'ENABLED': True,
+    'BUCKETS': (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+    'QUERY_BUCKETS': (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000),
+    'METRICS_ALLOWED_IPS': ('127.0.0.1', '::1'),
+    'PROFILE_SAMPLE_RATE': 0.0,
+    'PROFILE_SLOW_SECONDS': 0.5,
+    'PROFILE_DIR': None,
+    'PROFILE_KEEP': 50,
+}
+
+# `{span name: [seconds, calls]}` of the request being handled, if any.
+_request_spans = contextvars.ContextVar('request_spans', default=None)
+
+
+def instrumentation_settings():
+    return {**DEFAULTS, **getattr(settings, 'INSTRUMENTATION', {})}
+
+
+class Histogram:
+    """Cumulative-bucket histogram with a running sum and count."""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        """`(cumulative counts per bucket and +Inf, sum, count)`."""
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        cumulative, running = [], 0
+        for bucket_count in counts:
+            running += bucket_count
+            cumulative.append(running)
+        return cumulative, total, count
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(labels, **extra):
+    pairs = [*labels, *extra.items()]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """Named histograms, one series per label set, plus gauge collectors."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._collectors = []
+
+    def histogram(self, name, help, buckets=None):
+        """Declare histogram `name`; buckets default to BUCKETS. Redeclaring keeps the first."""
+        with self._lock:
+            if name not in self._histograms:
+                self._histograms[name] = (help, tuple(buckets or instrumentation_settings()['BUCKETS']), {})
+
+    def observe(self, name, value, **labels):
+        """Add `value` to the series of `name` with `labels`, declaring `name` on first use."""
+        if name not in self._histograms:
+            self.histogram(name, name)
+        _, buckets, series = self._histograms[name]
+        key = tuple(sorted(labels.items()))
+        histogram = series.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = series.setdefault(key, Histogram(buckets))
+        histogram.observe(value)
+
+    def add_collector(self, collect):
+        """
+        Register `collect()`, called on every scrape. It returns
+        `(name, help, [(labels dict, value), ...])` gauges.
+        """
+        with self._lock:
+            self._collectors.append(collect)
+
+    def render(self):
+        """Every metric in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            histograms = [(name, help, buckets, dict(series)) for name, (help, buckets, series) in self._histograms.items()]
+            collectors = list(self._collectors)
+        for name, help, buckets, series in sorted(histograms):
+            lines += [f'# HELP {name} {help}', f'# TYPE {name} histogram']
+            for labels, histogram in sorted(series.items()):
+                cumulative, total, count = histogram.snapshot()
+                for bucket, bucket_count in zip((*buckets, float('inf')), cumulative):
+                    lines.append(f'{name}_bucket{_labels(labels, le=_number(bucket))} {bucket_count}')
+                lines.append(f'{name}_sum{_labels(labels)} {_number(total)}')
+                lines.append(f'{name}_count{_labels(labels)} {count}')
+        for collect in collectors:
+            for name, help, samples in collect():
+                lines += [f'# HELP {name} {help}', f'# TYPE {name} gauge']
+                for labels, value in samples:
+                    lines.append(f'{name}{_labels(sorted(labels.items()))} {_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+registry.histogram('articles_request_seconds', "Request duration by view.")
+registry.histogram('articles_request_db_seconds', "Time spent in SQL queries per request, by view.")
+registry.histogram(
+    'articles_request_queries', "SQL queries per request, by view.", buckets=DEFAULTS['QUERY_BUCKETS']
+)
+registry.histogram('articles_span_seconds', "Duration of instrumented code paths, by span.")
+
+
+def record(name, seconds):
+    """Count `seconds` spent in span `name`: in its histogram and in the current request's totals."""
+    if not instrumentation_settings()['ENABLED']:
+        return
+    registry.observe('articles_span_seconds', seconds, span=name)
+    spans = _request_spans.get()
+    if spans is not None:
+        totals = spans.setdefault(name, [0.0, 0])
+        totals[0] += seconds
+        totals[1] += 1
+
+
+class span(ContextDecorator):
+    """Time a block (`with span('name'):`) or every call of a function (`@span('name')`)."""
+
+    def __init__(self, name):
+        self.name = name
+        self._started = threading.local()
+
+    def __enter__(self):
+        # Thread-local, so one decorator instance can time concurrent calls.
+        self._started.__dict__.setdefault('stack', []).append(time.perf_counter())
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, time.perf_counter() - self._started.stack.pop())
+        return False
+
+
+class _QueryTimer:
+    """`connection.execute_wrapper` counting statements and their time."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match is not None else 'unresolved'
+
+
+def _dump_profile(profiler, view, seconds, config):
+    directory = Path(config['PROFILE_DIR'] or Path(settings.BASE_DIR) / 'profiles')
+    directory.mkdir(parents=True, exist_ok=True)
+    safe_view = ''.join(c if c.isalnum() or c in '-_.' else '_' for c in view)
+    profiler.dump_stats(directory / f'{time.strftime("%Y%m%d-%H%M%S")}-{safe_view}-{seconds * 1000:.0f}ms.prof')
+    dumps = sorted(directory.glob('*.prof'), key=lambda path: path.stat().st_mtime)
+    for path in dumps[:max(len(dumps) - config['PROFILE_KEEP'], 0)]:
+        path.unlink(missing_ok=True)
+
+
+class InstrumentationMiddleware:
+    """Per-request duration, SQL count and time, span totals and sampled profiles; see the module docstring."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        config = instrumentation_settings()
+        if not config['ENABLED']:
+            return self.get_response(request)
+        queries = _QueryTimer()
+        spans = {}
+        token = _request_spans.set(spans)
+        profiler = cProfile.Profile() if random.random() < config['PROFILE_SAMPLE_RATE'] else None
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(queries):
+                if profiler is not None:
+                    profiler.enable()
+                try:
+                    response = self.get_response(request)
+                finally:
+                    if profiler is not None:
+                        profiler.disable()
+        finally:
+            _request_spans.reset(token)
+        seconds = time.perf_counter() - started
+
+        view = _view_name(request)
+        registry.observe('articles_request_seconds', seconds, view=view)
+        registry.observe('articles_request_db_seconds', queries.seconds, view=view)
+        registry.observe('articles_request_queries', queries.count, view=view)
+        timings = [f'total;dur={seconds * 1000:.1f}', f'db;dur={queries.seconds * 1000:.1f};desc="{queries.count} queries"']
+        timings += [f'{name};dur={total * 1000:.1f}' for name, (total, _) in spans.items()]
+        response['Server-Timing'] = ', '.join(timings)
+        if profiler is not None and seconds >= config['PROFILE_SLOW_SECONDS']:
+            _dump_profile(profiler, view, seconds, config)
+        return response
+
+
+def related_refresher_gauges():
+    """The related-article refresher's counters and lags (see articles/related.py)."""
+    from .related import related_refresher
+
+    return [
+        (f'articles_related_{name}', f"Related-article refresher: {name.replace('_', ' ')}.", [({}, value)])
+        for name, value in related_refresher.metrics().items()
+        if isinstance(value, (int, float))
+    ]
+
+
+def metrics(request):
+    """The registry in the Prometheus text format, for METRICS_ALLOWED_IPS only."""
+    if request.META.get('REMOTE_ADDR') not in instrumentation_settings()['METRICS_ALLOWED_IPS']:
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,223 @@
+"""
+Normalized article labels and an in-memory label -> articles inverted index.
+
+`Article.labels` stays the editable comma-separated string; `Label` rows
+and the `Article.normalized_labels` links are derived from it on save and on
+import (`link_labels`), so label filters are indexed joins instead of
+`labels__icontains` scans.
+
+The label tier of the recommenders used to re-split the labels of every
+active article for every request. `label_index` keeps a sorted posting list
+of active article ids per label instead: candidates sharing labels with an
+article are the union of its labels' postings, and how many labels they
+share is the number of postings they occur in.
+"""
+import threading
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from .instrumentation import span
+
+DEFAULTS = {
+    'REFRESH_INTERVAL': 300,
+}
+
+
+def label_index_settings():
+    return {**DEFAULTS, **getattr(settings, 'LABEL_INDEX', {})}
+
+
+def parse_labels(labels):
+    """Distinct stripped, non-empty labels of a comma-separated string, in order."""
+    if not labels:
+        return []
+    return list(dict.fromkeys(label.strip() for label in labels.split(',') if label.strip()))
+
+
+def link_labels(articles):
+    """
+    Replace the `normalized_labels` links of saved `articles` with the labels
+    parsed from their `labels` strings, creating missing `Label` rows. Runs a
+    fixed number of queries for any number of articles.
+    """
+    from .models import Article, Label
+
+    articles = [article for article in articles if article.pk is not None and 'labels' in article.__dict__]
+    if not articles:
+        return
+    parsed = {article.pk: parse_labels(article.labels) for article in articles}
+    names = {name for labels in parsed.values() for name in labels}
+    if names:
+        Label.objects.bulk_create([Label(name=name) for name in names], ignore_conflicts=True)
+    label_ids = dict(Label.objects.filter(name__in=names).values_list('name', 'id'))
+    links = Article.normalized_labels.through
+    links.objects.filter(article_id__in=parsed).delete()
+    links.objects.bulk_create([
+        links(article_id=article_id, label_id=label_ids[name])
+        for article_id, labels in parsed.items() for name in labels
+    ])
+
+
+class LabelIndex:
+    """
+    Sorted posting lists of active article ids per label, plus each indexed
+    article's labels and its views when indexed (the final tie-break).
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._reset()
+        self._built = False
+        self._built_at = 0.0
+        self._expires_at = None
+
+    def _reset(self):
+        self._postings = {}
+        self._arrays = {}
+        self._labels = {}
+        self._views = {}
+
+    def __len__(self):
+        return len(self._labels)
+
+    def add(self, article_id, labels, date_added=None, views=0):
+        """Index (or re-index) one article under `labels` (a string or list of labels)."""
+        if isinstance(labels, str):
+            labels = parse_labels(labels)
+        with self._lock:
+            self.remove(article_id)
+            if not labels:
+                return
+            self._labels[article_id] = tuple(labels)
+            self._views[article_id] = views
+            for label in labels:
+                self._postings.setdefault(label, set()).add(article_id)
+                self._arrays.pop(label, None)
+            if date_added is not None:
+                self._update_expiry(date_added.timestamp())
+
+    def remove(self, article_id):
+        """Drop an article from every posting list; unknown ids are ignored."""
+        with self._lock:
+            labels = self._labels.pop(article_id, ())
+            self._views.pop(article_id, None)
+            for label in labels:
+                postings = self._postings.get(label)
+                if postings is not None:
+                    postings.discard(article_id)
+                    if not postings:
+                        del self._postings[label]
+                self._arrays.pop(label, None)
+
+    def _update_expiry(self, timestamp):
+        from .models import ACTIVE_WINDOW
+
+        expires_at = timestamp + ACTIVE_WINDOW.total_seconds()
+        if self._expires_at is None or expires_at < self._expires_at:
+            self._expires_at = expires_at
+
+    def _posting(self, label):
+        """`(ids, views)` arrays of a label's articles, sorted by id (rebuilt after changes)."""
+        arrays = self._arrays.get(label)
+        if arrays is None:
+            ids = np.fromiter(sorted(self._postings.get(label, ())), dtype=np.int64)
+            views = np.fromiter((self._views[i] for i in ids.tolist()), dtype=np.int64, count=len(ids))
+            arrays = self._arrays[label] = (ids, views)
+        return arrays
+
+    @span('label_index.rebuild')
+    def rebuild(self):
+        """Reload every active article's labels from the `normalized_labels` links."""
+        from .models import ActiveArticles, Article
+
+        rows = (
+            Article.normalized_labels.through.objects
+            .filter(article__in=ActiveArticles.objects.all())
+            .values_list('article_id', 'label__name')
+        )
+        articles = {
+            article_id: (date_added, views)
+            for article_id, date_added, views in ActiveArticles.objects.exclude(labels='')
+            .values_list('id', 'date_added', 'views')
+        }
+        labels = {}
+        for article_id, name in rows.iterator():
+            labels.setdefault(article_id, []).append(name)
+        with self._lock:
+            self._reset()
+            self._expires_at = None
+            for article_id, names in labels.items():
+                date_added, views = articles.get(article_id, (None, 0))
+                self.add(article_id, names, date_added, views)
+            self._built = True
+            self._built_at = timezone.now().timestamp()
+
+    def ensure_fresh(self):
+        """
+        Build on first use; rebuild once the oldest indexed article has left
+        the active window, or every REFRESH_INTERVAL seconds to pick up labels
+        written by other processes.
+        """
+        now = timezone.now().timestamp()
+        if (
+            not self._built
+            or (self._expires_at is not None and now >= self._expires_at)
+            or now - self._built_at >= label_index_settings()['REFRESH_INTERVAL']
+        ):
+            self.rebuild()
+
+    def article_ids(self, label):
+        """Sorted ids of the active articles carrying `label`."""
+        with self._lock:
+            return self._posting(label)[0].copy()
+
+    def overlap(self, labels, exclude_ids=()):
+        """
+        Articles sharing at least one of `labels`.
+
+        Returns:
+            tuple: `(ids, shared, views)` arrays sorted by id: the number of
+            `labels` each article carries, and its views when indexed.
+        """
+        with self._lock:
+            postings = [self._posting(label) for label in set(labels) if label in self._postings]
+        if not postings:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty, empty
+        ids = np.concatenate([posting[0] for posting in postings])
+        views = np.concatenate([posting[1] for posting in postings])
+        ids, first, shared = np.unique(ids, return_index=True, return_counts=True)
+        views = views[first]
+        if len(exclude_ids):
+            keep = ~np.isin(ids, np.asarray(list(exclude_ids), dtype=np.int64))
+            ids, shared, views = ids[keep], shared[keep], views[keep]
+        return ids, shared, views
+
+    def top(self, labels, k, keyword_scores=None, exclude_ids=()):
+        """
+        Ids of the `k` articles sharing the most of `labels`, ties broken by
+        `keyword_scores` (`{article_id: score}`), then by views, then newest.
+        """
+        ids, shared, views = self.overlap(labels, exclude_ids)
+        if not len(ids) or k <= 0:
+            return []
+        keyword = np.zeros(len(ids))
+        if keyword_scores:
+            scored = np.fromiter(keyword_scores.keys(), dtype=np.int64, count=len(keyword_scores))
+            values = np.fromiter(keyword_scores.values(), dtype=np.float64, count=len(keyword_scores))
+            rows = np.searchsorted(ids, scored)
+            found = rows < len(ids)
+            found[found] = ids[rows[found]] == scored[found]
+            keyword[rows[found]] = values[found]
+        # Only candidates with the best few shared counts can make the top k.
+        if len(ids) > k:
+            threshold = np.partition(shared, len(shared) - k)[len(shared) - k]
+            keep = shared >= threshold
+            ids, shared, views, keyword = ids[keep], shared[keep], views[keep], keyword[keep]
+        order = np.lexsort((-ids, -views, -keyword, -shared))[:k]
+        return ids[order].tolist()
+
+
+label_index = LabelIndex()
@@ -0,0 +1,67 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from articles.models import Article
+from articles.vector_cache import get_vector_cache
+from articles.vectorizations import bulk_generate_vectors, embedding_settings, get_embedder, set_cpu_threads
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate vector_embedding and tfidf_vector for articles missing either, in primary-key chunks. "
+        "Each chunk is committed on its own, so an interrupted run resumes where it stopped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help="Articles committed per chunk.")
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help="Texts per model call (defaults to EMBEDDINGS['BATCH_SIZE']).")
+        parser.add_argument('--start-after', type=int, default=0,
+                            help="Only process articles with a primary key above this one.")
+        parser.add_argument('--threads', type=int, default=None,
+                            help="CPU threads for the model (defaults to EMBEDDINGS['THREADS']).")
+
+    def handle(self, *args, **options):
+        embedder = get_embedder()
+        if options['threads']:
+            set_cpu_threads(options['threads'])
+        batch_size = options['batch_size'] or embedding_settings()['BATCH_SIZE']
+
+        missing = Article.objects.filter(
+            Q(vector_embedding__isnull=True) | Q(tfidf_vector__isnull=True)
+        ).order_by('pk')
+        remaining = missing.filter(pk__gt=options['start_after']).count()
+        self.stdout.write(f"Embedding {remaining} articles with {embedder.version}")
+
+        last_pk = options['start_after']
+        done = 0
+        started = time.perf_counter()
+        while True:
+            chunk_ids = list(
+                missing.filter(pk__gt=last_pk).values_list('pk', flat=True)[:options['chunk_size']]
+            )
+            if not chunk_ids:
+                break
+            processed, _ = bulk_generate_vectors(
+                Article.objects.filter(pk__in=chunk_ids).order_by('pk'), batch_size=batch_size
+            )
+            done += processed
+            last_pk = chunk_ids[-1]
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"{done}/{remaining} articles, last pk {last_pk}, {done / elapsed:,.1f} articles/sec"
+            )
+
+        elapsed = time.perf_counter() - started
+        rate = done / elapsed if elapsed else 0.0
+        self.stdout.write(self.style.SUCCESS(f"Embedded {done} articles in {elapsed:.1f}s ({rate:,.1f} articles/sec)"))
+        cache = get_vector_cache()
+        if cache is not None:
+            stats = cache.stats()
+            self.stdout.write(
+                f"Vector cache: {stats['hits']} hits, {stats['misses']} misses "
+                f"({stats['hit_rate']:.1%}), {stats['entries']} entries"
+            )
@@ -0,0 +1,69 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from articles.ann import ExactBackend, HNSWBackend, IVFFlatBackend, hnswlib
+from articles.ranking import normalize_rows
+
+
+def clustered_embeddings(rng, n, dim, topics, noise=1.5):
+    """Synthetic embeddings drawn around `topics` centres, like articles on shared stories."""
+    centres = rng.standard_normal((topics, dim))
+    assignment = rng.integers(0, topics, size=n)
+    return normalize_rows(centres[assignment] + noise * rng.standard_normal((n, dim)))
+
+
+def recall_at_k(approximate, exact):
+    hits = [len(set(a.tolist()) & set(e.tolist())) / max(1, len(e)) for (a, _), (e, _) in zip(approximate, exact)]
+    return float(np.mean(hits))
+
+
+class Command(BaseCommand):
+    help = "Compare recall@k and latency of the ANN backends against the exact article ranking."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--articles', type=int, default=50000)
+        parser.add_argument('--dim', type=int, default=1024)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--k', type=int, default=3)
+        parser.add_argument('--topics', type=int, default=200)
+        parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 4, 8, 16, 32])
+        parser.add_argument('--ef-search', type=int, nargs='+', default=[16, 64, 128])
+        parser.add_argument('--seed', type=int, default=0)
+
+    def _time_search(self, backend, queries, k):
+        start = time.perf_counter()
+        results = [backend.search(query, k)[0] for query in queries]
+        return results, (time.perf_counter() - start) * 1000 / len(queries)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        k = options['k']
+        matrix = clustered_embeddings(rng, options['articles'], options['dim'], options['topics'])
+        ids = np.arange(1, matrix.shape[0] + 1)
+        queries = matrix[rng.choice(matrix.shape[0], options['queries'], replace=False)]
+
+        exact = ExactBackend().build(ids, matrix)
+        truth, exact_ms = self._time_search(exact, queries, k)
+        self.stdout.write(f"{'backend':<22} {'build s':>8} {'ms/query':>9} {'recall@' + str(k):>9}")
+        self.stdout.write(f"{'exact':<22} {0:>8.2f} {exact_ms:>9.3f} {1:>9.3f}")
+
+        start = time.perf_counter()
+        ivf = IVFFlatBackend().build(ids, matrix)
+        build_s = time.perf_counter() - start
+        for nprobe in options['nprobe']:
+            ivf.nprobe = nprobe
+            results, ms = self._time_search(ivf, queries, k)
+            self.stdout.write(f"{'ivf nprobe=' + str(nprobe):<22} {build_s:>8.2f} {ms:>9.3f} {recall_at_k(results, truth):>9.3f}")
+
+        if hnswlib is None:
+            self.stdout.write("hnsw skipped: hnswlib is not installed")
+            return
+        start = time.perf_counter()
+        hnsw = HNSWBackend().build(ids, matrix)
+        build_s = time.perf_counter() - start
+        for ef_search in options['ef_search']:
+            hnsw.ef_search = ef_search
+            results, ms = self._time_search(hnsw, queries, k)
+            self.stdout.write(f"{'hnsw ef=' + str(ef_search):<22} {build_s:>8.2f} {ms:>9.3f} {recall_at_k(results, truth):>9.3f}")
@@ -0,0 +1,109 @@
+import resource
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from articles.collaborative import collaborative_settings, interaction_matrix, solve_one, train
+from articles.management.commands.benchmark_recommenders import interaction_log, ndcg_at_k, recall_at_k
+from articles.ranking import top_k_indices
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark implicit ALS on a synthetic click log of INTERACTIONS reads: training time per "
+        "iteration for each thread count, matrix and factor memory, peak RSS, fold-in and scoring "
+        "latency, and recall@k / NDCG@k on held-out reads against a most-read baseline. Uses no database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--articles', type=int, default=20000)
+        parser.add_argument('--topics', type=int, default=20)
+        parser.add_argument('--users', type=int, default=50000)
+        parser.add_argument('--interactions', type=int, default=1000000)
+        parser.add_argument('--factors', type=int, default=collaborative_settings()['FACTORS'])
+        parser.add_argument('--iterations', type=int, default=collaborative_settings()['ITERATIONS'])
+        parser.add_argument('--threads', type=int, nargs='+', default=[1, collaborative_settings()['THREADS']])
+        parser.add_argument('--samples', type=int, default=1000, help="Users evaluated.")
+        parser.add_argument('--k', type=int, default=10)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        user_rows, article_rows, _, held_out = interaction_log(
+            options['articles'], options['topics'], options['users'], options['interactions'], seed=options['seed'],
+        )
+        train_rows = ~held_out
+        matrix, users, articles = interaction_matrix(
+            user_rows[train_rows], article_rows[train_rows], np.ones(int(train_rows.sum())),
+        )
+        matrix_mb = (matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes) / 2 ** 20
+        self.stdout.write(
+            f"{matrix.nnz:,} training reads ({int(held_out.sum()):,} held out), "
+            f"{matrix.shape[0]:,} users x {matrix.shape[1]:,} articles, matrix {matrix_mb:.1f} MB, "
+            f"RSS before training {peak_rss_mb():.0f} MB"
+        )
+
+        for threads in dict.fromkeys(options['threads']):
+            iterations = []
+            started = time.perf_counter()
+            user_factors, item_factors = train(
+                matrix, factors=options['factors'], iterations=options['iterations'], threads=threads,
+                seed=options['seed'], progress=lambda iteration, seconds: iterations.append(seconds),
+            )
+            total = time.perf_counter() - started
+            self.stdout.write(
+                f"{threads:>2} threads: {total:.1f}s for {len(iterations)} iterations "
+                f"({np.mean(iterations):.2f}s each), peak RSS {peak_rss_mb():.0f} MB"
+            )
+        factors_mb = (user_factors.nbytes + item_factors.nbytes) / 2 ** 20
+        self.stdout.write(f"factors {factors_mb:.1f} MB")
+
+        # Held-out reads per user, in matrix rows and columns.
+        user_index = {user: row for row, user in enumerate(users.tolist())}
+        article_index = {article: column for column, article in enumerate(articles.tolist())}
+        relevant = {}
+        for user, article in zip(user_rows[held_out].tolist(), article_rows[held_out].tolist()):
+            if user in user_index and article in article_index:
+                relevant.setdefault(user_index[user], set()).add(article_index[article])
+        sample = rng.choice(list(relevant), min(options['samples'], len(relevant)), replace=False)
+
+        k = options['k']
+        popularity = np.asarray(matrix.sum(axis=0)).ravel()
+        results = {'most read': ([], [], set()), 'ALS': ([], [], set())}
+        scoring, folding = [], []
+        base = item_factors.T @ item_factors + collaborative_settings()['REGULARIZATION'] * np.eye(options['factors'])
+        for row in sample.tolist():
+            start, end = matrix.indptr[row], matrix.indptr[row + 1]
+            seen = matrix.indices[start:end]
+
+            started = time.perf_counter()
+            solve_one(base, item_factors[seen], matrix.data[start:end], collaborative_settings()['ALPHA'])
+            folding.append((time.perf_counter() - started) * 1000)
+
+            started = time.perf_counter()
+            scores = item_factors @ user_factors[row]
+            scores[seen] = -np.inf
+            ranked = top_k_indices(scores, k).tolist()
+            scoring.append((time.perf_counter() - started) * 1000)
+
+            baseline = popularity.astype(np.float64)
+            baseline[seen] = -np.inf
+            for name, recommended in (('most read', top_k_indices(baseline, k).tolist()), ('ALS', ranked)):
+                recalls, ndcgs, covered = results[name]
+                recalls.append(recall_at_k(recommended, relevant[row], k))
+                ndcgs.append(ndcg_at_k(recommended, relevant[row], k))
+                covered.update(recommended)
+        for name, (recalls, ndcgs, covered) in results.items():
+            self.stdout.write(
+                f"{name:>10}: recall@{k} {np.mean(recalls):.3f}, NDCG@{k} {np.mean(ndcgs):.3f}, "
+                f"coverage {len(covered) / matrix.shape[1]:.3f}"
+            )
+        self.stdout.write(
+            f"fold-in p50 {np.percentile(folding, 50):.3f} ms; scoring {matrix.shape[1]:,} articles "
+            f"p50 {np.percentile(scoring, 50):.3f} ms per user"
+        )
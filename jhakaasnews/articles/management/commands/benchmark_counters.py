@@ -0,0 +1,81 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import F, Sum
+from django.test.utils import override_settings
+
+from articles.benchmarking import QueryCounter, Rollback
+from articles.counters import CounterAccumulator, counter_settings
+from articles.models import ActiveArticles, Article
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark article_detail view counting: the former per-view UPDATE + refresh against "
+        "the buffered counters, on VIEWS views skewed towards a few hot articles. Runs in a "
+        "rolled-back transaction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--views', type=int, default=20000)
+        parser.add_argument('--skew', type=float, default=1.2,
+                            help="Zipf exponent of article popularity.")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        ids = np.array(ActiveArticles.objects.values_list('id', flat=True))
+        if not len(ids):
+            self.stderr.write("No active articles to count views on.")
+            return
+        rng = np.random.default_rng(options['seed'])
+        views = ids[(rng.zipf(options['skew'], options['views']) - 1) % len(ids)].tolist()
+        articles = ActiveArticles.objects.in_bulk(set(views))
+
+        config = {**counter_settings(), 'SYNC': False, 'FLUSH_INTERVAL': 3600}
+        try:
+            with transaction.atomic(), override_settings(ARTICLE_COUNTERS=config):
+                before = Article.objects.aggregate(total=Sum('views'))['total']
+                self._legacy(views, articles)
+                self._buffered(views, articles)
+                after = Article.objects.aggregate(total=Sum('views'))['total']
+                self.stdout.write(f"stored views grew by {after - before:,} (expected {2 * len(views):,})")
+                raise Rollback
+        except Rollback:
+            pass
+
+    def _report(self, name, views, seconds, queries):
+        self.stdout.write(
+            f"{name:>9}: {len(views):,} views in {seconds:.2f}s ({len(views) / seconds:,.0f} views/sec), "
+            f"{queries:,} queries"
+        )
+
+    def _legacy(self, views, articles):
+        queries = QueryCounter()
+        with connection.execute_wrapper(queries):
+            started = time.perf_counter()
+            for article_id in views:
+                article = articles[article_id]
+                with transaction.atomic():
+                    Article.objects.filter(id=article_id).update(views=F('views') + 1)
+                    article.refresh_from_db()
+            seconds = time.perf_counter() - started
+        self._report('legacy', views, seconds, queries.count)
+
+    def _buffered(self, views, articles):
+        counters = CounterAccumulator()
+        queries = QueryCounter()
+        with connection.execute_wrapper(queries):
+            started = time.perf_counter()
+            for article_id in views:
+                counters.add(article_id, views=1)
+                counters.merge_pending([articles[article_id]])
+            record_seconds = time.perf_counter() - started
+            flushed = counters.flush()
+            seconds = time.perf_counter() - started
+        self._report('buffered', views, seconds, queries.count)
+        self.stdout.write(
+            f"           {record_seconds * 1e6 / len(views):.1f} us per view recorded, "
+            f"{flushed:,} articles written in {(seconds - record_seconds) * 1000:.1f} ms"
+        )
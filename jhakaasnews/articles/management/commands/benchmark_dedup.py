@@ -0,0 +1,107 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from articles.dedup import SimHashIndex, dedup_settings, popcount, simhash
+from articles.models import Article
+
+
+def flip_bits(fingerprints, max_bits, rng):
+    """Copies of `fingerprints` with 0..max_bits random bits flipped."""
+    flipped = fingerprints.copy()
+    for row, count in enumerate(rng.integers(0, max_bits + 1, size=fingerprints.shape[0])):
+        for bit in rng.choice(64, size=count, replace=False):
+            flipped[row] ^= np.uint64(1) << np.uint64(bit)
+    return flipped
+
+
+def perturb(text, fraction, rng):
+    """`text` with `fraction` of its words replaced, like a lightly re-edited wire story."""
+    words = text.split()
+    for position in rng.choice(len(words), size=max(1, int(len(words) * fraction)), replace=False):
+        words[position] = f'edit{rng.integers(1 << 30)}'
+    return ' '.join(words)
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark near-duplicate detection: SimHash fingerprint throughput and accuracy on article "
+        "text, then index build time, query rate and recall with DOCUMENTS synthetic fingerprints."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--documents', type=int, default=1000000)
+        parser.add_argument('--queries', type=int, default=20000)
+        parser.add_argument('--max-distance', type=int, default=None,
+                            help="Defaults to NEAR_DUPLICATES['MAX_DISTANCE'].")
+        parser.add_argument('--texts', type=int, default=2000,
+                            help="Stored articles (or synthetic texts) used for the text-level checks.")
+        parser.add_argument('--edit-fraction', type=float, default=0.02)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        options['max_distance'] = options['max_distance'] or dedup_settings()['MAX_DISTANCE']
+        self._text_checks(options, rng)
+        self._index_checks(options, rng)
+
+    def _text_checks(self, options, rng):
+        texts = list(dict.fromkeys(
+            t for t in Article.objects.values_list('text', flat=True)[:options['texts']] if len(t.split()) > 50
+        ))
+        if len(texts) < options['texts']:
+            # Zipf-ranked words: the 20 most frequent are shared by every
+            # document, the rest are shifted to a per-document topic.
+            words = np.array([f'w{i}' for i in range(50000)])
+            for _ in range(options['texts'] - len(texts)):
+                ranks = rng.zipf(1.05, 300)
+                ranks = np.where(ranks > 20, ranks + rng.integers(words.size), ranks)
+                texts.append(' '.join(words[ranks % words.size]))
+        started = time.perf_counter()
+        originals = np.array([simhash(text) for text in texts], dtype=np.uint64)
+        seconds = time.perf_counter() - started
+        self.stdout.write(f"fingerprinted {len(texts)} texts at {len(texts) / seconds:,.0f} docs/sec")
+
+        edited = np.array([simhash(perturb(text, options['edit_fraction'], rng)) for text in texts], dtype=np.uint64)
+        distances = popcount(originals ^ edited)
+        detected = float(np.mean(distances <= options['max_distance']))
+        index = SimHashIndex(options['max_distance']).build(np.arange(len(texts)), originals)
+        false_matches = sum(
+            int(np.any(index.query(fingerprint)[0] != row)) for row, fingerprint in enumerate(originals)
+        )
+        wrapped = np.array(
+            [simhash(f'By staff reporters. {text} All rights reserved.') for text in texts], dtype=np.uint64
+        )
+        wrapped_detected = float(np.mean(popcount(originals ^ wrapped) <= options['max_distance']))
+        self.stdout.write(
+            f"{options['edit_fraction']:.0%} word edits: median distance {np.median(distances):.0f} bits, "
+            f"{detected:.1%} detected; byline/footer added: {wrapped_detected:.1%} detected; "
+            f"{false_matches} of {len(texts)} distinct texts matched another"
+        )
+
+    def _index_checks(self, options, rng):
+        n, max_distance = options['documents'], options['max_distance']
+        fingerprints = rng.integers(0, np.iinfo(np.uint64).max, size=n, dtype=np.uint64, endpoint=True)
+
+        started = time.perf_counter()
+        index = SimHashIndex(max_distance).build(np.arange(n), fingerprints)
+        build_seconds = time.perf_counter() - started
+
+        targets = rng.integers(0, n, size=options['queries'])
+        queries = flip_bits(fingerprints[targets], max_distance, rng)
+        started = time.perf_counter()
+        found = sum(int(np.any(index.query(query)[0] == target)) for query, target in zip(queries, targets))
+        query_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for query in queries[:200]:
+            np.flatnonzero(popcount(fingerprints ^ query) <= max_distance)
+        scan_ms = (time.perf_counter() - started) / 200 * 1000
+
+        self.stdout.write(
+            f"{n:,} fingerprints: built in {build_seconds:.2f}s ({index.nbytes / 2 ** 20:.0f} MiB), "
+            f"{options['queries'] / query_seconds:,.0f} queries/sec "
+            f"({query_seconds / options['queries'] * 1e6:.0f} us each, full scan {scan_ms:.1f} ms), "
+            f"recall {found / options['queries']:.1%} at <= {max_distance} bits"
+        )
@@ -0,0 +1,69 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from articles.add_articles import import_articles
+from articles.benchmarking import Rollback, synthetic_rows
+from articles.models import Article
+from articles.tfidf import TfidfVocabulary
+from articles.vectorizations import embed_texts
+
+
+def legacy_import(rows, vocabulary):
+    """The former row-at-a-time import: one lookup, one model call and one INSERT per row."""
+    for title, text, labels in rows:
+        if Article.objects.filter(title=title).exists():
+            continue
+        Article.objects.bulk_create([Article(
+            title=title,
+            text=text,
+            labels=labels,
+            vector_embedding=embed_texts([text], use_cache=False)[0],
+            tfidf_vector=vocabulary.update(text),
+        )])
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark CSV import throughput (rows/sec) on synthetic rows. Every run happens in a "
+        "transaction that is rolled back, and uses a throwaway TF-IDF vocabulary and no vector cache."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000])
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--workers', type=int, nargs='+', default=[0, 4],
+                            help="Process pool sizes to compare (0 vectorizes in-process).")
+        parser.add_argument('--legacy-rows', type=int, default=1000,
+                            help="Rows timed with the old per-row import (0 to skip).")
+
+    def _timed(self, run):
+        started = time.perf_counter()
+        try:
+            with transaction.atomic():
+                run()
+                raise Rollback
+        except Rollback:
+            pass
+        return time.perf_counter() - started
+
+    def handle(self, *args, **options):
+        if options['legacy_rows']:
+            n = options['legacy_rows']
+            seconds = self._timed(lambda: legacy_import(synthetic_rows(n), TfidfVocabulary()))
+            self.stdout.write(f"{'legacy':>8} {n:>8} rows {seconds:>8.2f}s {n / seconds:>10,.0f} rows/sec")
+
+        for n in options['rows']:
+            for workers in options['workers']:
+                seconds = self._timed(lambda: import_articles(
+                    synthetic_rows(n),
+                    chunk_size=options['chunk_size'],
+                    batch_size=options['batch_size'],
+                    workers=workers,
+                    vocabulary=TfidfVocabulary(),
+                    use_cache=False,
+                ))
+                label = f'bulk/{workers}' if workers else 'bulk'
+                self.stdout.write(f"{label:>8} {n:>8} rows {seconds:>8.2f}s {n / seconds:>10,.0f} rows/sec")
@@ -0,0 +1,103 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from articles.benchmarking import Rollback, synthetic_rows
+from articles.labels import LabelIndex, link_labels
+from articles.models import ActiveArticles, Article
+
+LABELS = [f'label{i}' for i in range(40)]
+
+
+def scan_label_ranking(article, k, keyword_scores):
+    """The former label tier: re-split every active article's labels and sort all matches."""
+    article_labels = set(article.get_labels_list())
+    matches = []
+    for other in ActiveArticles.objects.listing().exclude(id=article.id).order_by('-views', '-id'):
+        common = article_labels.intersection(other.get_labels_list())
+        if common:
+            matches.append((other.id, (len(common), keyword_scores.get(other.id, 0.0))))
+    matches.sort(key=lambda match: match[1], reverse=True)
+    return [article_id for article_id, _ in matches[:k]]
+
+
+def percentiles(run, samples):
+    latencies = []
+    for sample in samples:
+        started = time.perf_counter()
+        result = run(sample)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return np.percentile(latencies, 50), np.percentile(latencies, 95), result
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark label-based recommendations and label-filtered listings on ARTICLES synthetic "
+        "articles with 1-3 of 40 labels each: the former full scan against the inverted index, "
+        "and labels__icontains against the normalized-label join. Runs in a rolled-back transaction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--articles', type=int, default=100000)
+        parser.add_argument('--samples', type=int, default=50)
+        parser.add_argument('--scan-samples', type=int, default=3,
+                            help="Articles ranked with the former scan (it reads every active article).")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self._run(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def _run(self, options):
+        rng = np.random.default_rng(options['seed'])
+        popularity = rng.zipf(1.3, len(LABELS) * 10) % len(LABELS)
+        started = time.perf_counter()
+        created = Article.objects.bulk_create(
+            (
+                Article(
+                    title=title, text=text, views=int(rng.zipf(1.5)),
+                    labels=', '.join(dict.fromkeys(LABELS[i] for i in rng.choice(popularity, rng.integers(1, 4)))),
+                )
+                for title, text, _ in synthetic_rows(options['articles'], seed=options['seed'], words=20)
+            ),
+            batch_size=1000,
+        )
+        for start in range(0, len(created), 5000):
+            link_labels(created[start:start + 5000])
+        self.stdout.write(f"{len(created):,} articles stored and linked in {time.perf_counter() - started:.1f}s")
+
+        index = LabelIndex()
+        started = time.perf_counter()
+        index.rebuild()
+        self.stdout.write(f"inverted index over {len(index):,} articles built in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+        sample = [created[i] for i in rng.choice(len(created), options['samples'], replace=False)]
+        keyword_scores = {article.id: float(rng.random()) for article in created[::50]}
+        p50, p95, _ = percentiles(lambda a: scan_label_ranking(a, 10, keyword_scores), sample[:options['scan_samples']])
+        self.stdout.write(f"   scan top-10: p50 {p50:9.2f} ms, p95 {p95:9.2f} ms")
+        p50, p95, _ = percentiles(
+            lambda a: index.top(a.get_labels_list(), 10, keyword_scores, exclude_ids=[a.id]), sample
+        )
+        self.stdout.write(f"  index top-10: p50 {p50:9.2f} ms, p95 {p95:9.2f} ms")
+        mismatches = sum(
+            scan_label_ranking(a, 10, keyword_scores) != index.top(a.get_labels_list(), 10, keyword_scores, exclude_ids=[a.id])
+            for a in sample[:options['scan_samples']]
+        )
+        self.stdout.write(f"  rankings differing from the scan: {mismatches} of {options['scan_samples']}")
+
+        listing = ActiveArticles.objects.listing().order_by('-featured', '-views', '-id')
+        labels = [LABELS[i] for i in rng.choice(popularity, options['samples'])]
+        for name, run in (
+            ('icontains', lambda label: (listing.filter(labels__icontains=label).count(),
+                                         list(listing.filter(labels__icontains=label)[:10]))),
+            ('join', lambda label: (listing.filter(normalized_labels__name=label).count(),
+                                    list(listing.filter(normalized_labels__name=label)[:10]))),
+        ):
+            p50, p95, _ = percentiles(run, labels)
+            self.stdout.write(f"{name:>9} page: p50 {p50:9.2f} ms, p95 {p95:9.2f} ms (count + first 10)")
@@ -0,0 +1,116 @@
+import heapq
+import time
+from collections import defaultdict
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import override_settings
+
+from articles.add_articles import import_articles
+from articles.benchmarking import QueryCounter, Rollback, synthetic_rows
+from articles.index import article_index
+from articles.labels import label_index
+from articles.models import ActiveArticles
+from articles.pipeline import RecommendationPipeline, query_for_article
+from articles.related import related_settings
+from articles.tfidf import TfidfVocabulary, tfidf_index
+
+
+def legacy_recommended(article, num_recommendations=3):
+    """The former get_recommended_articles: one pass and one load per tier, then the recency walk."""
+    potential_recommendations = ActiveArticles.objects.listing().exclude(id=article.id)
+
+    vector_recommendations = []
+    if article.vector_embedding is not None:
+        article_index.ensure_fresh()
+        neighbours = article_index.search(article.vector_embedding, num_recommendations, exclude_ids=[article.id])
+        neighbour_ids = [article_id for article_id, _ in neighbours]
+        articles_by_id = potential_recommendations.in_bulk(neighbour_ids)
+        vector_recommendations = [articles_by_id[i] for i in neighbour_ids if i in articles_by_id]
+
+    keyword_scores = {}
+    if article.tfidf_vector is not None:
+        tfidf_index.ensure_fresh()
+        ids, scores = tfidf_index.scores(article.tfidf_vector)
+        keyword_scores = dict(zip(ids.tolist(), scores.tolist()))
+        keyword_scores.pop(article.id, None)
+
+    label_recommendations = []
+    if article.get_labels_list():
+        label_index.ensure_fresh()
+        label_ids = label_index.top(article.get_labels_list(), num_recommendations, keyword_scores, exclude_ids=[article.id])
+        labels_by_id = potential_recommendations.in_bulk(label_ids)
+        label_recommendations = [labels_by_id[i] for i in label_ids if i in labels_by_id]
+
+    keyword_ids = heapq.nlargest(
+        num_recommendations, (i for i, score in keyword_scores.items() if score > 0), key=keyword_scores.get
+    )
+    keywords_by_id = potential_recommendations.in_bulk(keyword_ids)
+    keyword_recommendations = [keywords_by_id[i] for i in keyword_ids if i in keywords_by_id]
+
+    recommendations, seen_ids = [], set()
+    for candidate in vector_recommendations + label_recommendations + keyword_recommendations:
+        if candidate.id not in seen_ids and len(recommendations) < num_recommendations:
+            recommendations.append(candidate)
+            seen_ids.add(candidate.id)
+    if len(recommendations) < num_recommendations:
+        for candidate in potential_recommendations.order_by('-date_added'):
+            if candidate.id not in seen_ids and len(recommendations) < num_recommendations:
+                recommendations.append(candidate)
+                seen_ids.add(candidate.id)
+    return recommendations
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark live article recommendations on ARTICLES synthetic articles: the former "
+        "per-tier passes against the blended pipeline, with queries per call and the pipeline's "
+        "per-stage timings. Runs in a rolled-back transaction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--articles', type=int, default=5000)
+        parser.add_argument('--reads', type=int, default=200)
+        parser.add_argument('--k', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic(), override_settings(RELATED_ARTICLES={**related_settings(), 'ENABLED': False}):
+                self._run(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def _run(self, options):
+        rng = np.random.default_rng(options['seed'])
+        import_articles(
+            synthetic_rows(options['articles'], seed=options['seed']),
+            vocabulary=TfidfVocabulary(), use_cache=False, near_duplicates=False,
+        )
+        ids = np.array(ActiveArticles.objects.values_list('id', flat=True))
+        sample = list(ActiveArticles.objects.filter(id__in=rng.choice(ids, options['reads']).tolist()))
+
+        stages = defaultdict(list)
+        pipeline = RecommendationPipeline()
+        pipeline.add_hook(lambda stage, seconds: stages[stage].append(seconds * 1000))
+        for name, recommend in (
+            ('legacy', lambda article: legacy_recommended(article, options['k'])),
+            ('pipeline', lambda article: pipeline.recommend(query_for_article(article), options['k'])),
+        ):
+            recommend(sample[0])  # build the in-memory indexes outside the timings
+            stages.clear()
+            latencies = []
+            queries = QueryCounter()
+            with connection.execute_wrapper(queries):
+                for article in sample:
+                    started = time.perf_counter()
+                    recommend(article)
+                    latencies.append((time.perf_counter() - started) * 1000)
+            self.stdout.write(
+                f"{name:>9}: p50 {np.percentile(latencies, 50):.2f} ms, p95 {np.percentile(latencies, 95):.2f} ms, "
+                f"{queries.count / len(sample):.1f} queries per call"
+            )
+        for stage, timings in stages.items():
+            self.stdout.write(f"{stage:>22}: p50 {np.percentile(timings, 50):.3f} ms")
@@ -0,0 +1,60 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from scipy.spatial.distance import cosine
+
+from articles.ranking import normalize_rows, rank_candidates, seen_mask
+
+
+def legacy_rank(profile, candidates, k):
+    """The former per-candidate cosine loop followed by a full sort."""
+    similarities = [
+        (row, 1 - cosine(np.array(profile), np.array(candidate)))
+        for row, candidate in enumerate(candidates)
+    ]
+    similarities.sort(key=lambda x: x[1], reverse=True)
+    return [row for row, _ in similarities[:k]]
+
+
+class Command(BaseCommand):
+    help = "Microbenchmark personalized ranking latency against the number of candidates."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--candidates', type=int, nargs='+', default=[1000, 5000, 20000, 50000])
+        parser.add_argument('--dim', type=int, default=1024)
+        parser.add_argument('--users', type=int, default=64, help="Batch size for the multi-user run.")
+        parser.add_argument('--k', type=int, default=3)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--legacy-limit', type=int, default=20000,
+                            help="Skip the legacy loop above this many candidates.")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        dim, k, repeat = options['dim'], options['k'], options['repeat']
+
+        self.stdout.write(f"{'candidates':>10} {'legacy ms':>10} {'1 user ms':>10} {'batch ms/user':>14}")
+        for n in options['candidates']:
+            candidates = normalize_rows(rng.standard_normal((n, dim)))
+            candidate_ids = np.arange(1, n + 1)
+            profiles = rng.standard_normal((options['users'], dim)).astype(np.float32)
+            seen = [rng.choice(candidate_ids, size=20, replace=False) for _ in range(options['users'])]
+
+            legacy_ms = float('nan')
+            if n <= options['legacy_limit']:
+                start = time.perf_counter()
+                legacy_rank(profiles[0], candidates, k)
+                legacy_ms = (time.perf_counter() - start) * 1000
+
+            start = time.perf_counter()
+            for _ in range(repeat):
+                rank_candidates(profiles[0], candidates, k, seen_mask(candidate_ids, seen[:1]))
+            single_ms = (time.perf_counter() - start) * 1000 / repeat
+
+            start = time.perf_counter()
+            for _ in range(repeat):
+                rank_candidates(profiles, candidates, k, seen_mask(candidate_ids, seen))
+            batch_ms = (time.perf_counter() - start) * 1000 / repeat / options['users']
+
+            self.stdout.write(f"{n:>10} {legacy_ms:>10.2f} {single_ms:>10.3f} {batch_ms:>14.4f}")
@@ -0,0 +1,303 @@
+import io
+import json
+import math
+import resource
+import subprocess
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from articles.add_articles import import_articles
+from articles.benchmarking import QueryCounter, Rollback
+from articles.counters import write_counts
+from articles.models import ActiveArticles, UserInteractions
+from articles.related import related_settings
+from articles.tfidf import TfidfVocabulary
+from articles.views import get_personalized_recommendations, get_recommended_articles, get_trending_articles
+
+PATHS = ['personalized', 'related', 'popular']
+
+
+def topic_corpus(n, topics, seed=0, words=60, vocabulary_size=5000):
+    """
+    `(title, text, labels)` rows; article `i` belongs to topic `i % topics` and
+    two thirds of its words come from that topic's own vocabulary, so its
+    embedding and TF-IDF vector cluster by topic.
+    """
+    rng = np.random.default_rng(seed)
+    own_words = words * 2 // 3
+    for i in range(n):
+        topic = i % topics
+        own = rng.zipf(1.3, own_words) % vocabulary_size
+        shared = rng.zipf(1.3, words - own_words) % vocabulary_size
+        text = ' '.join([f't{topic}w{j}' for j in own] + [f'w{j}' for j in shared])
+        yield f'Benchmark article {seed}-{i}', text, f'topic{topic}'
+
+
+def power_law_ranks(uniform, n, exponent):
+    """Map uniform draws to ranks 0..n-1 with probability proportional to 1 / (rank + 1) ** exponent."""
+    weights = np.cumsum(1 / np.arange(1, n + 1) ** exponent)
+    return np.searchsorted(weights, uniform * weights[-1])
+
+
+def interaction_log(n_articles, topics, users, interactions, affinity=0.8, exponent=0.8, holdout=0.2, seed=0):
+    """
+    A synthetic click log split for offline evaluation.
+
+    Each user prefers one or two topics and reads from them with probability
+    `affinity`, otherwise from the whole catalogue. Within either, the
+    article at popularity rank r is read with weight 1 / r ** `exponent`.
+    User activity is lognormal. A user's repeated reads of an article are
+    dropped, and the last `holdout` of every user's reads (by time) are
+    held out.
+
+    Returns:
+        tuple: `(user_rows, article_rows, seconds_ago, held_out)` arrays with
+        article rows in `topic_corpus` order, oldest read first.
+    """
+    rng = np.random.default_rng(seed)
+    preferred = rng.integers(0, topics, (users, 2))
+    single = rng.random(users) < 0.5
+    preferred[single, 1] = preferred[single, 0]
+
+    activity = rng.lognormal(0, 1, users)
+    user_rows = rng.choice(users, interactions, p=activity / activity.sum())
+    topic = preferred[user_rows, rng.integers(0, 2, interactions)]
+    # Popularity rank of the article read, within the topic or the catalogue.
+    rank = rng.random(interactions)
+    article_rows = rng.permutation(n_articles)[power_law_ranks(rank, n_articles, exponent)]
+    in_topic = rng.random(interactions) < affinity
+    for t in range(topics):
+        members = rng.permutation(np.arange(t, n_articles, topics))
+        chosen = in_topic & (topic == t)
+        article_rows[chosen] = members[power_law_ranks(rank[chosen], len(members), exponent)]
+
+    _, first = np.unique(user_rows.astype(np.int64) * n_articles + article_rows, return_index=True)
+    first.sort()
+    user_rows, article_rows = user_rows[first], article_rows[first]
+    seconds_ago = np.sort(rng.uniform(0, 2 * 86400, len(first)))[::-1]
+
+    # Position of each read within its user's history, oldest first.
+    order = np.lexsort((np.arange(len(user_rows)), user_rows))
+    counts = np.bincount(user_rows, minlength=users)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    position = np.empty(len(order), dtype=np.int64)
+    position[order] = np.arange(len(order)) - starts[user_rows[order]]
+    kept = np.ceil(counts * (1 - holdout)).astype(np.int64)
+    held_out = (position >= kept[user_rows]) & (counts[user_rows] >= 2)
+    return user_rows, article_rows, seconds_ago, held_out
+
+
+def recall_at_k(recommended, relevant, k):
+    return len(set(recommended[:k]) & relevant) / len(relevant)
+
+
+def ndcg_at_k(recommended, relevant, k):
+    """Binary-relevance NDCG of the first `k` recommendations."""
+    dcg = sum(1 / math.log2(rank + 2) for rank, i in enumerate(recommended[:k]) if i in relevant)
+    ideal = sum(1 / math.log2(rank + 2) for rank in range(min(len(relevant), k)))
+    return dcg / ideal
+
+
+def latency_summary(latencies):
+    latencies = np.asarray(latencies)
+    return {
+        'p50': float(np.percentile(latencies, 50)),
+        'p95': float(np.percentile(latencies, 95)),
+        'p99': float(np.percentile(latencies, 99)),
+        'mean': float(latencies.mean()),
+    }
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the recommendation paths on a synthetic topic corpus and click log: latency "
+        "p50/p95/p99, calls per second, queries per call and peak RSS, plus recall@k, NDCG@k and "
+        "catalogue coverage against each sampled user's held-out reads. Runs in a rolled-back "
+        "transaction and writes a JSON report (--output) that --compare diffs against an earlier run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--articles', type=int, default=5000)
+        parser.add_argument('--topics', type=int, default=20)
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--interactions', type=int, default=50000)
+        parser.add_argument('--holdout', type=float, default=0.2,
+                            help="Fraction of each user's latest reads held out for evaluation.")
+        parser.add_argument('--samples', type=int, default=200, help="Users evaluated per path.")
+        parser.add_argument('--k', type=int, default=10)
+        parser.add_argument('--path', choices=PATHS, action='append',
+                            help="Recommendation path to run; repeat for several (default: all).")
+        parser.add_argument('--output', help="Write the JSON report here ('-' for stdout).")
+        parser.add_argument('--compare', help="Earlier JSON report to print changes against.")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            # Read first: --output may overwrite the same file.
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+        try:
+            with transaction.atomic(), override_settings(RELATED_ARTICLES={**related_settings(), 'ENABLED': False}):
+                report = self._run(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+        if options['output'] == '-':
+            self.stdout.write(json.dumps(report, indent=2))
+        elif options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+        if baseline is not None:
+            self._compare(baseline, report)
+
+    def _run(self, options):
+        rng = np.random.default_rng(options['seed'])
+        report = {
+            'revision': git_revision(),
+            'config': {
+                name: options[name]
+                for name in ('articles', 'topics', 'users', 'interactions', 'holdout', 'samples', 'k', 'seed')
+            },
+            'setup_seconds': {},
+            'paths': {},
+        }
+        setup = report['setup_seconds']
+
+        started = time.perf_counter()
+        import_articles(
+            topic_corpus(options['articles'], options['topics'], seed=options['seed']),
+            vocabulary=TfidfVocabulary(), use_cache=False, near_duplicates=False,
+        )
+        # Imported in corpus order, so row i is the i-th article created.
+        article_ids = np.array(
+            ActiveArticles.objects.filter(title__startswith=f"Benchmark article {options['seed']}-")
+            .order_by('id').values_list('id', flat=True)
+        )
+        setup['articles'] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        User = get_user_model()
+        users = User.objects.bulk_create(
+            (User(email=f"benchmark-{options['seed']}-{i}@example.com", password='!') for i in range(options['users'])),
+            batch_size=1000,
+        )
+        user_ids = np.array([user.pk for user in users])
+        user_rows, article_rows, seconds_ago, held_out = interaction_log(
+            len(article_ids), options['topics'], options['users'], options['interactions'],
+            holdout=options['holdout'], seed=options['seed'],
+        )
+        train = ~held_out
+        now = timezone.now()
+        UserInteractions.objects.bulk_create(
+            (
+                UserInteractions(
+                    user_id=int(user_ids[u]), article_id=int(article_ids[a]), session_id='benchmark',
+                    clicked=True, time_spent=60, created_at=now - timedelta(seconds=float(ago)),
+                )
+                for u, a, ago in zip(user_rows[train], article_rows[train], seconds_ago[train])
+            ),
+            batch_size=5000,
+        )
+        views = np.bincount(article_rows[train], minlength=len(article_ids))
+        write_counts({int(article_ids[a]): (int(views[a]), 60 * int(views[a])) for a in np.flatnonzero(views)})
+        call_command('rebuild_profiles', stdout=io.StringIO())
+        setup['interactions'] = time.perf_counter() - started
+        report['interactions'] = {'train': int(train.sum()), 'held_out': int(held_out.sum())}
+        self.stdout.write(
+            f"{len(article_ids):,} articles, {len(user_ids):,} users, {int(train.sum()):,} training and "
+            f"{int(held_out.sum()):,} held-out reads; set up in {sum(setup.values()):.1f}s"
+        )
+
+        # Users with both training and held-out reads; `related` starts from their latest training read.
+        relevant, latest = {}, {}
+        for u, a, is_held_out in zip(user_rows.tolist(), article_rows.tolist(), held_out.tolist()):
+            if is_held_out:
+                relevant.setdefault(u, set()).add(int(article_ids[a]))
+            else:
+                latest[u] = int(article_ids[a])
+        candidates = [u for u in relevant if u in latest]
+        sample = rng.choice(candidates, min(options['samples'], len(candidates)), replace=False).tolist()
+        sample_users = User.objects.select_related('userprofile').in_bulk([int(user_ids[u]) for u in sample])
+        latest_articles = ActiveArticles.objects.in_bulk([latest[u] for u in sample])
+
+        k = options['k']
+        paths = {
+            'personalized': lambda u: get_personalized_recommendations(sample_users[int(user_ids[u])], k),
+            'related': lambda u: get_recommended_articles(latest_articles[latest[u]], k),
+            'popular': lambda u: get_trending_articles(k),
+        }
+        for name in options['path'] or PATHS:
+            recommend = paths[name]
+            recommend(sample[0])  # build the in-memory indexes outside the timings
+            latencies, recalls, ndcgs, recommended_ids = [], [], [], set()
+            queries = QueryCounter()
+            with connection.execute_wrapper(queries):
+                for u in sample:
+                    started = time.perf_counter()
+                    recommended = [article.id for article in recommend(u)]
+                    latencies.append((time.perf_counter() - started) * 1000)
+                    recalls.append(recall_at_k(recommended, relevant[u], k))
+                    ndcgs.append(ndcg_at_k(recommended, relevant[u], k))
+                    recommended_ids.update(recommended)
+            result = report['paths'][name] = {
+                'latency_ms': latency_summary(latencies),
+                'calls_per_second': len(sample) / (sum(latencies) / 1000),
+                'queries_per_call': queries.count / len(sample),
+                f'recall@{k}': float(np.mean(recalls)),
+                f'ndcg@{k}': float(np.mean(ndcgs)),
+                'coverage': len(recommended_ids) / len(article_ids),
+                'peak_rss_mb': peak_rss_mb(),
+            }
+            latency = result['latency_ms']
+            self.stdout.write(
+                f"{name:>12}: p50 {latency['p50']:.2f} ms, p95 {latency['p95']:.2f} ms, p99 {latency['p99']:.2f} ms, "
+                f"{result['calls_per_second']:,.0f}/s, {result['queries_per_call']:.1f} queries, "
+                f"recall@{k} {result[f'recall@{k}']:.3f}, NDCG@{k} {result[f'ndcg@{k}']:.3f}, "
+                f"coverage {result['coverage']:.3f}"
+            )
+        report['peak_rss_mb'] = peak_rss_mb()
+        self.stdout.write(f"peak RSS {report['peak_rss_mb']:.0f} MB")
+        return report
+
+    def _compare(self, baseline, report):
+        """Print each path's metric changes against `baseline`, a report from an earlier run."""
+        self.stdout.write(f"changes against {baseline.get('revision') or 'baseline'}:")
+        if baseline.get('config') != report['config']:
+            self.stdout.write("  (configurations differ)")
+        for name, result in report['paths'].items():
+            before = baseline.get('paths', {}).get(name)
+            if before is None:
+                continue
+            changes = [
+                f"p50 {before['latency_ms']['p50']:.2f} -> {result['latency_ms']['p50']:.2f} ms",
+                f"p99 {before['latency_ms']['p99']:.2f} -> {result['latency_ms']['p99']:.2f} ms",
+            ]
+            changes += [
+                f"{metric} {before[metric]:.3f} -> {result[metric]:.3f}"
+                for metric in result if metric.startswith(('recall@', 'ndcg@', 'coverage')) and metric in before
+            ]
+            self.stdout.write(f"{name:>12}: " + ', '.join(changes))
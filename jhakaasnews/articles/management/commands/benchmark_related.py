@@ -0,0 +1,86 @@
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from articles.add_articles import import_articles
+from articles.benchmarking import Rollback, synthetic_rows
+from articles.models import ActiveArticles, Article
+from articles.related import related_refresher, related_settings
+from articles.tfidf import TfidfVocabulary
+from articles.views import get_recommended_articles, get_related_articles
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the precomputed related-articles table on ARTICLES synthetic articles: full "
+        "recompute time, article_detail read latency against the live ranking, and incremental "
+        "refreshes after an article is added or articles expire. Runs in a rolled-back transaction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--articles', type=int, default=5000)
+        parser.add_argument('--reads', type=int, default=200)
+        parser.add_argument('--expire', type=float, default=0.01,
+                            help="Fraction of articles moved out of the active window.")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        config = {**related_settings(), 'SYNC': True, 'SWEEP_INTERVAL': 0}
+        try:
+            with transaction.atomic(), override_settings(RELATED_ARTICLES=config):
+                self._run(options, config)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def _run(self, options, config):
+        rng = np.random.default_rng(options['seed'])
+        with override_settings(RELATED_ARTICLES={**config, 'ENABLED': False}):
+            import_articles(
+                synthetic_rows(options['articles'], seed=options['seed']),
+                vocabulary=TfidfVocabulary(), use_cache=False, near_duplicates=False,
+            )
+        ids = np.array(ActiveArticles.objects.values_list('id', flat=True))
+
+        started = time.perf_counter()
+        recomputed = related_refresher.refresh(full=True)
+        full_seconds = time.perf_counter() - started
+        self.stdout.write(
+            f"full recompute: {recomputed} lists in {full_seconds:.2f}s "
+            f"({recomputed / full_seconds:,.0f} lists/sec)"
+        )
+
+        sample = list(ActiveArticles.objects.filter(id__in=rng.choice(ids, options['reads']).tolist()))
+        for name, read in (('live ranking', get_recommended_articles), ('precomputed', get_related_articles)):
+            latencies = []
+            for article in sample:
+                started = time.perf_counter()
+                read(article)
+                latencies.append((time.perf_counter() - started) * 1000)
+            self.stdout.write(
+                f"{name:>14}: p50 {np.percentile(latencies, 50):.2f} ms, "
+                f"p95 {np.percentile(latencies, 95):.2f} ms per article_detail read"
+            )
+
+        title, text, labels = next(synthetic_rows(1, seed=options['seed'] + 1))
+        article = Article.objects.create(title=title, text=text, labels=labels)
+        metrics = related_refresher.metrics()
+        self.stdout.write(
+            f"  1 new article: {metrics['last_articles_recomputed']} lists recomputed in "
+            f"{metrics['last_recompute_seconds'] * 1000:.1f} ms"
+        )
+
+        expired = rng.choice(ids, max(1, int(len(ids) * options['expire'])), replace=False).tolist()
+        Article.objects.filter(id__in=expired).update(date_added=timezone.now() - timedelta(days=30))
+        related_refresher.refresh()
+        metrics = related_refresher.metrics()
+        self.stdout.write(
+            f"{len(expired):>4} expired:    {metrics['last_articles_recomputed']} lists recomputed in "
+            f"{metrics['last_recompute_seconds'] * 1000:.1f} ms"
+        )
+        article.delete()
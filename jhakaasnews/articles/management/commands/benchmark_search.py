@@ -0,0 +1,84 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.core.paginator import Paginator
+from django.db import transaction
+from django.db.models import Q
+
+from articles.benchmarking import Rollback, synthetic_rows
+from articles.models import ActiveArticles, Article, active_window_start
+from articles.search import SearchResults, search_index
+
+
+def icontains_page(query):
+    """The former `index` search: a substring filter over title and text, page 1 plus the count."""
+    articles = ActiveArticles.objects.listing().filter(
+        Q(featured=True) | Q(title__icontains=query) | Q(text__icontains=query)
+    ).order_by('-featured', '-views', '-id')
+    page = Paginator(articles, 10).page(1)
+    return page.paginator.count, list(page.object_list)
+
+
+def indexed_page(query):
+    results = SearchResults(query, ActiveArticles.objects.listing(), since=active_window_start())
+    page = Paginator(results, 10).page(1)
+    return page.paginator.count, list(page.object_list)
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark index-view search latency (page 1 and the result count) with the full-text "
+        "index against the former icontains filter, on synthetic articles. Each size runs in a "
+        "rolled-back transaction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--articles', type=int, nargs='+', default=[10000, 100000])
+        parser.add_argument('--queries', type=int, default=50)
+        parser.add_argument('--legacy-queries', type=int, default=10,
+                            help="Queries timed with icontains (it scans every article).")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        for n in options['articles']:
+            try:
+                with transaction.atomic():
+                    self._run(n, options)
+                    raise Rollback
+            except Rollback:
+                pass
+
+    def _run(self, n, options):
+        rng = np.random.default_rng(options['seed'])
+        started = time.perf_counter()
+        Article.objects.bulk_create(
+            (Article(title=title, text=text, labels=labels, views=int(rng.integers(0, 1000)))
+             for title, text, labels in synthetic_rows(n, seed=options['seed'])),
+            batch_size=1000,
+        )
+        search_index.rebuild()
+        self.stdout.write(f"{n:,} articles stored and indexed in {time.perf_counter() - started:.1f}s")
+
+        # Words from the frequent head down to the rare tail of the zipf vocabulary,
+        # alone and in pairs.
+        words = [f'w{rank}' for rank in rng.integers(1, 2000, options['queries'])]
+        queries = [
+            word if i % 2 else f'{word} w{int(rng.integers(1, 200))}'
+            for i, word in enumerate(words)
+        ]
+        for name, run, sample in (
+            ('icontains', icontains_page, queries[:options['legacy_queries']]),
+            ('fts', indexed_page, queries),
+        ):
+            latencies, matches = [], []
+            for query in sample:
+                started = time.perf_counter()
+                count, _ = run(query)
+                latencies.append((time.perf_counter() - started) * 1000)
+                matches.append(count)
+            self.stdout.write(
+                f"{name:>10}: p50 {np.percentile(latencies, 50):8.2f} ms, "
+                f"p95 {np.percentile(latencies, 95):8.2f} ms over {len(sample)} queries "
+                f"(median {np.median(matches):,.0f} results)"
+            )
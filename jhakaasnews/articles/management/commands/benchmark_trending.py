@@ -0,0 +1,79 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from articles.benchmarking import Rollback, synthetic_rows
+from articles.counters import write_counts
+from articles.models import ActiveArticles, Article
+from articles.trending import TrendingEngine
+
+
+def timed(run, repeat):
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        latencies.append((time.perf_counter() - started) * 1000)
+    return np.percentile(latencies, 50), np.percentile(latencies, 95)
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark home's popular list on ARTICLES synthetic articles: the former "
+        "order_by('-views') query against the in-memory trending ranking, and the cost of "
+        "feeding counter flushes into it. Runs in a rolled-back transaction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--articles', type=int, default=20000)
+        parser.add_argument('--reads', type=int, default=200)
+        parser.add_argument('--flushes', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self._run(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def _run(self, options):
+        rng = np.random.default_rng(options['seed'])
+        Article.objects.bulk_create(
+            (Article(title=title, text=text, labels=labels, views=int(rng.zipf(1.5)), time_spent_on=int(rng.integers(0, 600)))
+             for title, text, labels in synthetic_rows(options['articles'], seed=options['seed'])),
+            batch_size=1000,
+        )
+        ids = np.array(ActiveArticles.objects.values_list('id', flat=True))
+        engine = TrendingEngine()
+        started = time.perf_counter()
+        engine.sync()
+        self.stdout.write(f"{len(ids):,} active articles loaded in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+        p50, p95 = timed(lambda: list(ActiveArticles.objects.listing().order_by('-views')[:3]), options['reads'])
+        self.stdout.write(f"order_by('-views')[:3]: p50 {p50:.3f} ms, p95 {p95:.3f} ms")
+        p50, p95 = timed(lambda: engine.top(3), options['reads'])
+        self.stdout.write(f"      trending top(3): p50 {p50:.3f} ms, p95 {p95:.3f} ms")
+        p50, p95 = timed(lambda: engine.top(3, label='sports'), options['reads'])
+        self.stdout.write(f"  top(3, label=sports): p50 {p50:.3f} ms, p95 {p95:.3f} ms")
+
+        # Flushes of 100 zipf-skewed articles, as the counters would write them.
+        batches = [
+            {int(article_id): (1, int(rng.integers(0, 120)))
+             for article_id in ids[(rng.zipf(1.2, 100) - 1) % len(ids)]}
+            for _ in range(options['flushes'])
+        ]
+        started = time.perf_counter()
+        for deltas in batches:
+            engine.record(deltas)
+        seconds = time.perf_counter() - started
+        recorded = sum(len(deltas) for deltas in batches)
+        self.stdout.write(f"record: {recorded:,} article updates in {seconds * 1000:.1f} ms "
+                          f"({seconds * 1e6 / recorded:.1f} us each, in memory)")
+        started = time.perf_counter()
+        for deltas in batches[:20]:
+            write_counts(deltas)
+        self.stdout.write(f"write_counts incl. record: {(time.perf_counter() - started) * 1000 / 20:.1f} ms per flush")
@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from articles.models import Article
+from articles.tfidf import get_vocabulary, tfidf_settings
+
+
+class Command(BaseCommand):
+    help = (
+        "Refit the TF-IDF vocabulary and document frequencies over every Article.text, "
+        "rewrite each article's sparse tfidf_vector and persist the vocabulary. "
+        "Only needed when the vocabulary file is lost; new articles update it incrementally."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Articles written per bulk_update.")
+
+    def handle(self, *args, **options):
+        vocabulary = get_vocabulary()
+        started = time.perf_counter()
+        articles = list(Article.objects.only('id', 'text').order_by('pk'))
+        with vocabulary.batch():
+            vectors = vocabulary.fit(article.text for article in articles)
+        for article, vector in zip(articles, vectors):
+            article.tfidf_vector = vector
+        Article.objects.bulk_update(articles, ['tfidf_vector'], batch_size=options['batch_size'])
+
+        elapsed = time.perf_counter() - started
+        nnz = sum(vector.nnz for vector in vectors)
+        self.stdout.write(self.style.SUCCESS(
+            f"Fitted {vocabulary.n_docs} articles, {len(vocabulary.terms)} terms, "
+            f"{nnz / max(len(vectors), 1):.1f} terms/article in {elapsed:.2f}s -> {tfidf_settings()['PATH']}"
+        ))
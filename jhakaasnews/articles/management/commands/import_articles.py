@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from articles.add_articles import import_articles, read_csv_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream articles from a CSV file (title/headline, text/content, optional labels) into the "
+        "database in chunks, skipping titles that already exist."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_file', help="Path to the CSV file, e.g. Scrapping_data/scraped_news.csv.")
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help="Rows deduplicated and inserted per transaction.")
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help="Texts per model call (defaults to EMBEDDINGS['BATCH_SIZE']).")
+        parser.add_argument('--workers', type=int, default=0,
+                            help="Vectorize on this many processes (0 vectorizes in-process).")
+        parser.add_argument('--keep-near-duplicates', action='store_true',
+                            help="Import texts that are SimHash near-duplicates of stored articles.")
+
+    def handle(self, *args, **options):
+        def report(stats):
+            if options['verbosity'] > 1:
+                self.stdout.write(
+                    f"{stats['read']} read, {stats['created']} created, {stats['skipped']} skipped, "
+                    f"{stats['near_duplicates']} near-duplicates"
+                )
+
+        try:
+            stats = import_articles(
+                read_csv_rows(options['csv_file']),
+                chunk_size=options['chunk_size'],
+                batch_size=options['batch_size'],
+                workers=options['workers'],
+                near_duplicates=False if options['keep_near_duplicates'] else None,
+                progress=report,
+            )
+        except FileNotFoundError as e:
+            raise CommandError(e)
+        rate = stats['read'] / stats['seconds'] if stats['seconds'] else 0.0
+        self.stdout.write(self.style.SUCCESS(
+            f"Read {stats['read']} rows: {stats['created']} created, {stats['skipped']} skipped, "
+            f"{stats['near_duplicates']} near-duplicates in {stats['seconds']:.2f}s ({rate:,.0f} rows/sec)"
+        ))
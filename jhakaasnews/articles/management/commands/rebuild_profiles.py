@@ -0,0 +1,116 @@
+import time
+from datetime import datetime, timezone as dt_timezone
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from articles import profiles
+from articles.caching import bump_content_version
+from articles.fields import SparseVector
+from articles.models import Article, UserInteractions, UserProfile
+
+
+class Command(BaseCommand):
+    help = "Rebuild every user profile offline by replaying clicked UserInteractions history."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=200000,
+                            help="Approximate number of interactions replayed per batch.")
+
+    def handle(self, *args, **options):
+        interactions = (
+            UserInteractions.objects.filter(clicked=True)
+            .order_by('user_id', 'created_at')
+            .values_list('user_id', 'article_id', 'time_spent', 'created_at')
+        )
+        started = time.perf_counter()
+        total = 0
+        chunk = []
+        for row in interactions.iterator(chunk_size=10000):
+            # Only cut chunks on user boundaries so each profile is rebuilt in one pass.
+            if len(chunk) >= options['chunk_size'] and row[0] != chunk[-1][0]:
+                total += self._replay(chunk)
+                chunk = []
+            chunk.append(row)
+        if chunk:
+            total += self._replay(chunk)
+        # Profiles were bulk-written; drop every cached recommendation list.
+        bump_content_version()
+
+        elapsed = time.perf_counter() - started
+        rate = total / elapsed if elapsed else 0.0
+        self.stdout.write(f"Replayed {total} interactions in {elapsed:.2f}s ({rate:,.0f} interactions/sec)")
+
+    def _replay(self, chunk):
+        user_ids, article_ids, times_spent, created_at = zip(*chunk)
+        users, user_rows = np.unique(np.array(user_ids), return_inverse=True)
+        articles, article_rows = np.unique(np.array(article_ids), return_inverse=True)
+
+        vectors = dict(
+            Article.objects.filter(pk__in=articles.tolist(), vector_embedding__isnull=False)
+            .values_list('id', 'vector_embedding')
+        )
+        has_vectors = np.array([int(article_id) in vectors for article_id in articles])
+        if not has_vectors.any():
+            return 0
+        keep = has_vectors[article_rows]
+        embeddings = np.array([vectors[int(a)] for a in articles[has_vectors]], dtype=np.float32)
+        compact_rows = np.cumsum(has_vectors) - 1
+
+        timestamps = np.array([value.timestamp() for value in created_at])[keep]
+        user_rows, article_rows = user_rows[keep], compact_rows[article_rows[keep]]
+        times_spent = np.array(times_spent)[keep]
+        embedding_profiles, embedding_norms, updated_at = profiles.replay(
+            user_rows, article_rows, times_spent, timestamps, embeddings, len(users)
+        )
+        tfidf_profiles, tfidf_norms = self._replay_tfidf(
+            articles[has_vectors], user_rows, article_rows, times_spent, timestamps, updated_at
+        )
+        watched = np.bincount(user_rows, minlength=len(users))
+
+        existing = {p.user_id: p for p in UserProfile.objects.filter(user_id__in=users.tolist())}
+        to_create, to_update = [], []
+        for row, user_id in enumerate(users.tolist()):
+            if not watched[row]:
+                continue
+            profile = existing.get(user_id) or UserProfile(user_id=user_id)
+            profile.vector_embedding_profile = embedding_profiles[row]
+            profile.embedding_norm = float(embedding_norms[row])
+            if tfidf_profiles is not None:
+                start, end = tfidf_profiles.indptr[row], tfidf_profiles.indptr[row + 1]
+                profile.tfidf_profile = SparseVector(
+                    tfidf_profiles.indices[start:end], tfidf_profiles.data[start:end]
+                )
+                profile.tfidf_norm = float(tfidf_norms[row])
+            profile.watched_articles = int(watched[row])
+            profile.profile_updated_at = datetime.fromtimestamp(updated_at[row], tz=dt_timezone.utc)
+            (to_update if profile.pk else to_create).append(profile)
+
+        with transaction.atomic():
+            UserProfile.objects.bulk_create(to_create, batch_size=1000)
+            UserProfile.objects.bulk_update(
+                to_update,
+                ['vector_embedding_profile', 'tfidf_profile', 'embedding_norm', 'tfidf_norm',
+                 'watched_articles', 'profile_updated_at'],
+                batch_size=1000,
+            )
+        return int(keep.sum())
+
+    def _replay_tfidf(self, articles, user_rows, article_rows, times_spent, timestamps, updated_at):
+        tfidf = dict(
+            Article.objects.filter(pk__in=articles.tolist(), tfidf_vector__isnull=False)
+            .values_list('id', 'tfidf_vector')
+        )
+        has_tfidf = np.array([int(article_id) in tfidf and tfidf[int(article_id)].nnz > 0 for article_id in articles])
+        if not has_tfidf.any():
+            return None, None
+        keep = has_tfidf[article_rows]
+        tfidf_vectors = profiles.sparse_rows([tfidf[int(a)] for a in articles[has_tfidf]])
+        compact_rows = np.cumsum(has_tfidf) - 1
+        # Decay to the same per-user time as the embedding profile.
+        tfidf_profiles, tfidf_norms, _ = profiles.replay(
+            user_rows[keep], compact_rows[article_rows[keep]], times_spent[keep], timestamps[keep],
+            tfidf_vectors, len(updated_at), until=updated_at,
+        )
+        return tfidf_profiles, tfidf_norms
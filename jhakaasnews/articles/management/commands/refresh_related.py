@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from articles.models import RelatedArticle
+from articles.related import related_refresher
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the precomputed related-article lists: every active article with --full "
+        "(e.g. after deploying, or after changing RELATED_ARTICLES['TOP_K']), otherwise only "
+        "the given articles, the lists they affect and lists holding expired articles."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('article_ids', nargs='*', type=int)
+        parser.add_argument('--full', action='store_true',
+                            help="Recompute every active article's list.")
+
+    def handle(self, *args, **options):
+        recomputed = related_refresher.refresh(full=options['full'], article_ids=options['article_ids'])
+        metrics = related_refresher.metrics()
+        self.stdout.write(self.style.SUCCESS(
+            f"Recomputed {recomputed} lists ({metrics['rows_written']} rows) in "
+            f"{metrics['last_recompute_seconds']:.2f}s; {RelatedArticle.objects.count()} rows stored"
+        ))
@@ -0,0 +1,68 @@
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from articles.bandits import BanditEngine, EpsilonGreedy, bandit_settings, make_policy, replay
+from articles.models import Article, UserInteractions
+
+POLICIES = ['epsilon_greedy', 'thompson', 'ucb']
+
+
+def synthetic_log(articles, events, labels, seed=0):
+    """
+    Arms and a uniformly logged event stream: each article has a click rate
+    drawn around its first label's rate, and each event shows one article
+    chosen at random.
+    """
+    rng = np.random.default_rng(seed)
+    label_rates = rng.beta(2, 20, labels)
+    article_labels = [rng.choice(labels, rng.integers(1, 4), replace=False) for _ in range(articles)]
+    rates = np.clip([label_rates[chosen[0]] * rng.lognormal(0, 0.5) for chosen in article_labels], 0, 1)
+    arms = {article_id: [f'label{i}' for i in chosen] for article_id, chosen in enumerate(article_labels, 1)}
+    shown = rng.integers(1, articles + 1, events)
+    clicked = rng.random(events) < rates[shown - 1]
+    users = rng.integers(1, 1000, events)
+    return arms, list(zip(users.tolist(), shown.tolist(), clicked.tolist()))
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay logged interactions (or a synthetic uniformly logged stream with --synthetic) "
+        "through each home bandit policy and report matched events, CTR and events replayed "
+        "per second. Logged UserInteractions were not shown at random, so their CTRs are biased."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--policy', choices=POLICIES, action='append',
+                            help="Policy to replay; repeat for several (default: all).")
+        parser.add_argument('--slots', type=int, default=bandit_settings()['EXPLORE_SLOTS'])
+        parser.add_argument('--batch-size', type=int, default=256)
+        parser.add_argument('--synthetic', type=int, metavar='EVENTS',
+                            help="Replay a synthetic stream of EVENTS events instead of UserInteractions.")
+        parser.add_argument('--articles', type=int, default=200, help="Synthetic arms.")
+        parser.add_argument('--labels', type=int, default=20, help="Synthetic labels.")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if options['synthetic']:
+            arms, events = synthetic_log(options['articles'], options['synthetic'], options['labels'], options['seed'])
+        else:
+            events = list(
+                UserInteractions.objects.order_by('created_at', 'id').values_list('user_id', 'article_id', 'clicked')
+            )
+            arms = dict(
+                Article.objects.filter(id__in={article_id for _, article_id, _ in events}).values_list('id', 'labels')
+            )
+        self.stdout.write(f"{len(events):,} events over {len(arms):,} arms, {options['slots']} slots per request")
+        if not events or not arms:
+            return
+
+        policies = [('random', EpsilonGreedy(1.0))]
+        policies += [(name, make_policy(name)) for name in options['policy'] or POLICIES]
+        for name, policy in policies:
+            engine = BanditEngine(policy, seed=options['seed'])
+            engine.set_arms(arms)
+            result = replay(engine, events, options['slots'], options['batch_size'])
+            self.stdout.write(
+                f"{name:>15}: {result['matched']:,} matched, CTR {result['ctr']:.4f}, "
+                f"{result['events_per_second']:,.0f} events/s"
+            )
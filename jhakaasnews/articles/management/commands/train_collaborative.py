@@ -0,0 +1,39 @@
+import resource
+import time
+
+from django.core.management.base import BaseCommand
+
+from articles.caching import bump_content_version
+from articles.collaborative import collaborative_settings, train_from_database
+
+
+class Command(BaseCommand):
+    help = (
+        "Train the collaborative-filtering factors on every UserInteractions row and save them to "
+        "COLLABORATIVE['PATH'], where running processes pick them up."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--factors', type=int)
+        parser.add_argument('--iterations', type=int)
+        parser.add_argument('--threads', type=int)
+        parser.add_argument('--path', help="Write here instead of COLLABORATIVE['PATH'].")
+
+    def handle(self, *args, **options):
+        path = options['path'] or collaborative_settings()['PATH']
+        if not path:
+            self.stderr.write("COLLABORATIVE['PATH'] is not set.")
+            return
+        started = time.perf_counter()
+        model = train_from_database(
+            progress=lambda iteration, seconds: self.stdout.write(f"iteration {iteration + 1}: {seconds:.2f}s"),
+            **{name: options[name] for name in ('factors', 'iterations', 'threads') if options[name]},
+        )
+        model.save(path)
+        # Cached recommendation lists predate the new factors.
+        bump_content_version()
+        self.stdout.write(
+            f"Trained {len(model.user_ids):,} users x {len(model.item_ids):,} articles in "
+            f"{time.perf_counter() - started:.1f}s (peak RSS "
+            f"{resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB); saved to {path}"
+        )
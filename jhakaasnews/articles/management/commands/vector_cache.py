@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from articles.vector_cache import get_vector_cache, vector_cache_settings
+
+
+class Command(BaseCommand):
+    help = "Show the size of the content-hash vector cache, or clear it."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clear', action='store_true',
+                            help="Delete every cached vector.")
+
+    def handle(self, *args, **options):
+        cache = get_vector_cache()
+        if cache is None:
+            raise CommandError("The vector cache is disabled (VECTOR_CACHE['ENABLED'] = False).")
+        if options['clear']:
+            cache.clear()
+            self.stdout.write(self.style.SUCCESS(f"Cleared {cache.path}"))
+            return
+        stats = cache.stats()
+        self.stdout.write(
+            f"{stats['entries']} of {stats['max_entries']} entries in {vector_cache_settings()['PATH']}"
+        )
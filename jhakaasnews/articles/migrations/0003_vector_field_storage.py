@@ -0,0 +1,78 @@
+# Float array columns to packed float32 VectorField bytes; see articles/fields.py.
+
+import articles.fields
+import numpy as np
+from django.db import migrations
+
+VECTOR_FIELDS = {
+    'article': ['vector_embedding', 'tfidf_vector'],
+    'userprofile': ['vector_embedding_profile', 'tfidf_profile'],
+}
+
+
+def pack_vectors(apps, schema_editor):
+    """Copy float8[] array values into the packed float32 columns."""
+    for model_name, field_names in VECTOR_FIELDS.items():
+        model = apps.get_model('articles', model_name)
+        packed_names = [f'{name}_packed' for name in field_names]
+        batch = []
+        for row in model.objects.only('id', *field_names).iterator(chunk_size=1000):
+            changed = False
+            for name, packed_name in zip(field_names, packed_names):
+                value = getattr(row, name)
+                if isinstance(value, (list, tuple)) and value:
+                    setattr(row, packed_name, np.asarray(value, dtype=np.float32))
+                    changed = True
+            if changed:
+                batch.append(row)
+            if len(batch) >= 1000:
+                model.objects.bulk_update(batch, packed_names)
+                batch = []
+        if batch:
+            model.objects.bulk_update(batch, packed_names)
+
+
+def unpack_vectors(apps, schema_editor):
+    for model_name, field_names in VECTOR_FIELDS.items():
+        model = apps.get_model('articles', model_name)
+        batch = []
+        for row in model.objects.only('id', *(f'{name}_packed' for name in field_names)).iterator(chunk_size=1000):
+            for name in field_names:
+                value = getattr(row, f'{name}_packed')
+                setattr(row, name, value.tolist() if value is not None else None)
+            batch.append(row)
+            if len(batch) >= 1000:
+                model.objects.bulk_update(batch, field_names)
+                batch = []
+        if batch:
+            model.objects.bulk_update(batch, field_names)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('articles', '0002_article_featured_article_tfidf_vector_and_more'),
+    ]
+
+    operations = [
+        *[
+            migrations.AddField(
+                model_name=model_name,
+                name=f'{name}_packed',
+                field=articles.fields.VectorField(blank=True, null=True),
+            )
+            for model_name, field_names in VECTOR_FIELDS.items()
+            for name in field_names
+        ],
+        migrations.RunPython(pack_vectors, unpack_vectors),
+        *[
+            migrations.RemoveField(model_name=model_name, name=name)
+            for model_name, field_names in VECTOR_FIELDS.items()
+            for name in field_names
+        ],
+        *[
+            migrations.RenameField(model_name=model_name, old_name=f'{name}_packed', new_name=name)
+            for model_name, field_names in VECTOR_FIELDS.items()
+            for name in field_names
+        ],
+    ]
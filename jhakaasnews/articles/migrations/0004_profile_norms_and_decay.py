@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:34
+
+import django.utils.timezone
+import numpy as np
+from django.db import migrations, models
+
+
+def cache_profile_norms(apps, schema_editor):
+    UserProfile = apps.get_model('articles', 'UserProfile')
+    batch = []
+    for profile in UserProfile.objects.iterator(chunk_size=1000):
+        if profile.vector_embedding_profile is not None:
+            profile.embedding_norm = float(np.linalg.norm(profile.vector_embedding_profile))
+        if profile.tfidf_profile is not None:
+            profile.tfidf_norm = float(np.linalg.norm(profile.tfidf_profile))
+        batch.append(profile)
+        if len(batch) >= 1000:
+            UserProfile.objects.bulk_update(batch, ['embedding_norm', 'tfidf_norm'])
+            batch = []
+    if batch:
+        UserProfile.objects.bulk_update(batch, ['embedding_norm', 'tfidf_norm'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('articles', '0003_vector_field_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userinteractions',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='embedding_norm',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='profile_updated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='tfidf_norm',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.RunPython(cache_profile_norms, migrations.RunPython.noop),
+    ]
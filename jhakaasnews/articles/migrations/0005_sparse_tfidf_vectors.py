@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:40
+
+import articles.fields
+from django.db import migrations
+
+
+def clear_dense_tfidf(apps, schema_editor):
+    # Dense per-document vectors have no term ids; regenerate them with the
+    # fitted vocabulary (backfill_embeddings / rebuild_profiles) after migrating.
+    Article = apps.get_model('articles', 'Article')
+    UserProfile = apps.get_model('articles', 'UserProfile')
+    Article.objects.exclude(tfidf_vector__isnull=True).update(tfidf_vector=None)
+    UserProfile.objects.update(tfidf_profile=None, tfidf_norm=0.0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('articles', '0004_profile_norms_and_decay'),
+    ]
+
+    operations = [
+        migrations.RunPython(clear_dense_tfidf, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='article',
+            name='tfidf_vector',
+            field=articles.fields.SparseVectorField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='tfidf_profile',
+            field=articles.fields.SparseVectorField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:52
+
+from django.db import migrations, models
+
+
+def fingerprint_articles(apps, schema_editor):
+    from articles.dedup import simhash, to_signed
+
+    Article = apps.get_model('articles', 'Article')
+    batch = []
+    for article in Article.objects.only('id', 'text').iterator(chunk_size=1000):
+        article.simhash = to_signed(simhash(article.text))
+        batch.append(article)
+        if len(batch) >= 1000:
+            Article.objects.bulk_update(batch, ['simhash'])
+            batch = []
+    if batch:
+        Article.objects.bulk_update(batch, ['simhash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('articles', '0005_sparse_tfidf_vectors'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='simhash',
+            field=models.BigIntegerField(blank=True, editable=False, help_text='64-bit SimHash of the text (stored signed), used to detect near-duplicates', null=True),
+        ),
+        migrations.RunPython(fingerprint_articles, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Full-text search index for the index view; see articles/search.py.
+
+from django.db import migrations
+
+FTS_TABLE = 'articles_article_fts'
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        # A plain (not external-content) table, maintained from signals: sqlite
+        # migrations that alter articles_article rebuild it and would drop triggers.
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+            "title, text, tokenize = 'porter unicode61 remove_diacritics 2')"
+        )
+        schema_editor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, title, text) SELECT id, title, text FROM articles_article"
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            "ALTER TABLE articles_article ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ("
+            "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+            "setweight(to_tsvector('english', coalesce(text, '')), 'B')) STORED"
+        )
+        schema_editor.execute(
+            "CREATE INDEX articles_article_search_vector ON articles_article USING GIN (search_vector)"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+    elif vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS articles_article_search_vector")
+        schema_editor.execute("ALTER TABLE articles_article DROP COLUMN IF EXISTS search_vector")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('articles', '0007_related_articles'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
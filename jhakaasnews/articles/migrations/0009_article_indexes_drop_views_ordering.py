@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('articles', '0008_article_search_index'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='article',
+            options={'verbose_name': 'Article', 'verbose_name_plural': 'Articles'},
+        ),
+        migrations.AddIndex(
+            model_name='article',
+            index=models.Index(fields=['date_added', 'featured', 'views'], name='article_active_listing_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='article',
+            index=models.Index(fields=['-featured', '-views', '-id'], name='article_featured_views_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:16
+
+from django.db import migrations, models
+
+
+def link_existing_labels(apps, schema_editor):
+    Article = apps.get_model('articles', 'Article')
+    Label = apps.get_model('articles', 'Label')
+    links = Article.normalized_labels.through
+
+    parsed = {
+        article_id: list(dict.fromkeys(label.strip() for label in labels.split(',') if label.strip()))
+        for article_id, labels in Article.objects.exclude(labels='').values_list('id', 'labels').iterator()
+    }
+    names = {name for labels in parsed.values() for name in labels}
+    Label.objects.bulk_create([Label(name=name) for name in names], ignore_conflicts=True)
+    label_ids = dict(Label.objects.values_list('name', 'id'))
+    links.objects.bulk_create(
+        [
+            links(article_id=article_id, label_id=label_ids[name])
+            for article_id, labels in parsed.items() for name in labels
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('articles', '0009_article_indexes_drop_views_ordering'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Label',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='article',
+            name='normalized_labels',
+            field=models.ManyToManyField(blank=True, help_text='Labels parsed from `labels`, kept in sync on save', related_name='articles', to='articles.label'),
+        ),
+        migrations.RunPython(link_existing_labels, migrations.RunPython.noop),
+    ]
@@ -1,16 +1,50 @@
+import numpy as np
 from django.db import models
 from django.utils import timezone
-from datetime import timedelta
-from django.contrib.postgres.fields import ArrayField
+from datetime import datetime, timedelta, timezone as dt_timezone
 from django.conf import settings
-from django.db.models import F
+from django.core.exceptions import ValidationError
+from django.db.models.functions import Left
 from django.contrib.auth.models import User
+from . import profiles
+from .counters import article_counters
+from .dedup import dedup_settings, duplicate_index, simhash, to_signed
+from .fields import SparseVector, SparseVectorField, VectorField
+from .labels import link_labels
 from .vectorizations import make_tfidf, make_embedding
 
+ACTIVE_WINDOW = timedelta(days=3)
+
+
+def active_window_start():
+    """Oldest `date_added` still considered active."""
+    return timezone.now() - ACTIVE_WINDOW
+
+SNIPPET_LENGTH = 300
+
+class ArticleQuerySet(models.QuerySet):
+    """
+    Column projections for the two ways articles are read: rendered in lists,
+    or scored by the recommenders. Neither loads what it does not use.
+    """
+    def listing(self):
+        """Columns needed to render article cards, with a DB-side `snippet` instead of `text`."""
+        return self.only('id', 'title', 'date_added', 'labels', 'featured', 'views').annotate(
+            snippet=Left('text', SNIPPET_LENGTH)
+        )
+
+    def ranking(self):
+        """Columns needed to score candidates; skips `text` and the TF-IDF vector."""
+        return self.only('id', 'date_added', 'labels', 'featured', 'views', 'vector_embedding')
+
+class ArticleManager(models.Manager.from_queryset(ArticleQuerySet)):
+    pass
+
 class Article(models.Model):
     """
     Model representing a news article with basic fields for title, content, date, labels,
-    and vector representations that are automatically generated upon saving.
+    and vector representations that are automatically generated upon saving. Saving a
+    text that is a near-duplicate of another article raises ValidationError.
     """
     title = models.CharField(
         max_length=200,
@@ -37,24 +71,41 @@ class Article(models.Model):
     views = models.IntegerField(default=0)
     time_spent_on = models.IntegerField(default=0)
     
-    vector_embedding = ArrayField(
-        models.FloatField(),
-        size=1024,  # adjust according to the embedding dimension
+    vector_embedding = VectorField(
         null=True,
         blank=True,
     )
     
-    tfidf_vector = ArrayField(
-        models.FloatField(),
-        size=1024,  # adjust according to your TF-IDF vector size
+    tfidf_vector = SparseVectorField(
+        null=True,
+        blank=True,
+    )
+
+    normalized_labels = models.ManyToManyField(
+        'Label',
+        related_name='articles',
+        blank=True,
+        help_text="Labels parsed from `labels`, kept in sync on save"
+    )
+
+    simhash = models.BigIntegerField(
         null=True,
         blank=True,
+        editable=False,
+        help_text="64-bit SimHash of the text (stored signed), used to detect near-duplicates"
     )
     
+    objects = ArticleManager()
+
     class Meta:
-        ordering = ['-views']
         verbose_name = 'Article'
         verbose_name_plural = 'Articles'
+        indexes = [
+            # Active-window listings: date_added range, featured filter, views order.
+            models.Index(fields=['date_added', 'featured', 'views'], name='article_active_listing_idx'),
+            # index page order: featured first, then most viewed.
+            models.Index(fields=['-featured', '-views', '-id'], name='article_featured_views_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -64,40 +115,90 @@ class Article(models.Model):
             return [label.strip() for label in self.labels.split(',')]
         return []
 
-    def generate_vectors(self):
-        """Generate TF-IDF and embedding vectors for the article content."""
-        self.tfidf_vector = make_tfidf(self.text)
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored text so save() can tell whether it changed.
+        instance._loaded_text = instance.__dict__.get('text')
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using, fields, from_queryset)
+        if fields is None or 'text' in fields:
+            self._loaded_text = self.text
+
+    def text_changed(self):
+        """True when `text` was assigned a value different from the stored one."""
+        if 'text' not in self.__dict__:
+            return False
+        return self.text != getattr(self, '_loaded_text', None)
+
+    def generate_vectors(self, fingerprint=None):
+        """Generate TF-IDF and embedding vectors and the SimHash fingerprint for the article content."""
+        if fingerprint is None:
+            fingerprint = simhash(self.text)
+        self.tfidf_vector = make_tfidf(self.text, previous=self.tfidf_vector)
         self.vector_embedding = make_embedding(self.text)
+        self.simhash = to_signed(fingerprint)
+
+    def check_not_duplicate(self, fingerprint):
+        """Raise ValidationError when another stored article's text is within NEAR_DUPLICATES['MAX_DISTANCE']."""
+        if not dedup_settings()['ENABLED']:
+            return
+        duplicate_id = duplicate_index.find_duplicate(fingerprint, exclude_id=self.pk)
+        if duplicate_id is not None:
+            raise ValidationError(
+                f"The text is a near-duplicate of article {duplicate_id}.", code='near_duplicate'
+            )
 
     def save(self, *args, **kwargs):
-        if self.labels:
+        update_fields = kwargs.get('update_fields')
+        if self.labels and (update_fields is None or 'labels' in update_fields):
             labels_list = self.get_labels_list()
             self.labels = ', '.join(labels_list)
-        
-        # Generate vectors for new articles or when text is updated
-        if self._state.adding or self.tracker.has_changed('text'):
-            self.generate_vectors()
-        
+
+        # Generate vectors for new articles or when text is updated; saves that
+        # only touch other columns (counters, flags) never vectorize.
+        if self._state.adding or (
+            self.text_changed() and (update_fields is None or 'text' in update_fields)
+        ):
+            # Checked before vectorizing, so a rejected save never runs the embedder.
+            fingerprint = simhash(self.text)
+            self.check_not_duplicate(fingerprint)
+            self.generate_vectors(fingerprint)
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'vector_embedding', 'tfidf_vector', 'simhash'}
+
         super().save(*args, **kwargs)
+        self._loaded_text = self.__dict__.get('text')
+        if update_fields is None or 'labels' in update_fields:
+            link_labels([self])
 
     def update_interaction_metrics(self, time_spent):
-        """Update article metrics based on user interaction."""
-        self.views = F('views') + 1
-        self.time_spent_on = F('time_spent_on') + time_spent
-        self.save()
+        """
+        Add a finished read's time to the article's counters. The view itself
+        was already counted by `article_detail`.
+        """
+        article_counters.add(self.pk, time_spent=time_spent)
+
+class ActiveArticleManager(ArticleManager):
+    """Manager restricting articles to the active window."""
+    def get_queryset(self):
+        return super().get_queryset().filter(date_added__gte=active_window_start())
 
 class ActiveArticles(Article):
     """
     Proxy model for Article that only shows articles from the last 3 days.
     All operations on ActiveArticles objects directly affect the underlying Article objects.
     """
+    objects = ActiveArticleManager()
+
     class Meta:
         proxy = True
         
     @classmethod
     def get_queryset(cls):
-        three_days_ago = timezone.now() - timedelta(days=3)
-        return super().get_queryset().filter(date_added__gte=three_days_ago)
+        return cls.objects.all()
     
     def save(self, *args, **kwargs):
         # Ensure the date_added is within the last 3 days
@@ -105,76 +206,132 @@ class ActiveArticles(Article):
             self.date_added = timezone.now()
         super().save(*args, **kwargs)
 
+class Label(models.Model):
+    """One distinct article label; articles link to theirs through `Article.normalized_labels`."""
+    name = models.CharField(max_length=100, unique=True)
+
+    def __str__(self):
+        return self.name
+
+class RelatedArticle(models.Model):
+    """
+    Precomputed "related articles" of an article, best first. Maintained in the
+    background by `related.related_refresher` and read by `article_detail`.
+    """
+    article = models.ForeignKey(Article, on_delete=models.CASCADE, related_name='related_articles')
+    related = models.ForeignKey(Article, on_delete=models.CASCADE, related_name='related_from')
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        constraints = [
+            # Also the index behind the top-k read: WHERE article_id = ? ORDER BY rank.
+            models.UniqueConstraint(fields=['article', 'rank'], name='unique_related_article_rank'),
+        ]
+
+    def __str__(self):
+        return f"{self.article_id} -> {self.related_id} (#{self.rank})"
+
 class UserProfile(models.Model):
     """
     Extended user profile to store both embedding and TF-IDF vector representations
     of user interests along with interaction metrics.
     """
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
-    vector_embedding_profile = ArrayField(
-        models.FloatField(),
-        size=1024,  # adjust according to embedding dimension
+    vector_embedding_profile = VectorField(
         null=True,
         blank=True,
     )
-    tfidf_profile = ArrayField(
-        models.FloatField(),
-        size=1024,  # adjust according to TF-IDF dimension
+    tfidf_profile = SparseVectorField(
         null=True,
         blank=True,
     )
     watched_articles = models.IntegerField(default=0)
+    embedding_norm = models.FloatField(default=0.0)
+    tfidf_norm = models.FloatField(default=0.0)
+    profile_updated_at = models.DateTimeField(null=True, blank=True)
 
     def initialize_vectors(self, vector_size):
         """Initialize vector profiles if they don't exist."""
-        if not self.vector_embedding_profile:
-            self.vector_embedding_profile = [0.0] * vector_size
-        if not self.tfidf_profile:
-            self.tfidf_profile = [0.0] * vector_size
+        if self.vector_embedding_profile is None or len(self.vector_embedding_profile) == 0:
+            self.vector_embedding_profile = np.zeros(vector_size, dtype=np.float32)
+            self.embedding_norm = 0.0
+        if self.tfidf_profile is None:
+            self.tfidf_profile = SparseVector([], [])
+            self.tfidf_norm = 0.0
 
-    def update_profile_vectors(self, article, time_spent):
+    def update_profile_vectors(self, article, time_spent, at=None):
         """
         Update both embedding and TF-IDF profiles based on article interaction.
-        Vectors are weighted by time spent and normalized by total articles watched.
+        Vectors are weighted by time spent and decayed with the configured half-life.
         """
-        if article.vector_embedding and article.tfidf_vector:
-            vector_size = len(article.vector_embedding)
-            self.initialize_vectors(vector_size)
-            
-            # Calculate weight based on time spent and watched articles
-            weight = time_spent / (self.watched_articles + 1)
-            
-            # Update embedding profile
-            self.vector_embedding_profile = [
-                existing + (article_val * weight)
-                for existing, article_val in zip(self.vector_embedding_profile, article.vector_embedding)
-            ]
-            
-            # Update TF-IDF profile
-            self.tfidf_profile = [
-                existing + (article_val * weight)
-                for existing, article_val in zip(self.tfidf_profile, article.tfidf_vector)
-            ]
-            
-            self.watched_articles += 1
+        if self.fold_interactions([(article.vector_embedding, article.tfidf_vector, time_spent, at)]):
             self.save()
 
+    def fold_interactions(self, interactions):
+        """
+        Apply several `(embedding, tfidf_vector, time_spent, at)` interactions at once.
+
+        `at` is the datetime of the interaction (now when None). Interactions
+        without an embedding are skipped, and a missing TF-IDF vector only skips
+        the TF-IDF side. Both profiles are decayed to the latest interaction and
+        updated with one weighted sum each, and their norms are cached. Does not
+        save; returns the number of interactions applied.
+        """
+        now = timezone.now()
+        interactions = [
+            (embedding, tfidf, time_spent, (at or now).timestamp())
+            for embedding, tfidf, time_spent, at in interactions
+            if embedding is not None and len(embedding)
+        ]
+        if not interactions:
+            return 0
+        embeddings = np.array([i[0] for i in interactions], dtype=np.float32)
+        times = np.array([i[2] for i in interactions])
+        timestamps = np.array([i[3] for i in interactions])
+        with_tfidf = np.array([i[1] is not None and i[1].nnz > 0 for i in interactions])
+        self.initialize_vectors(embeddings.shape[1])
+
+        updated_at = self.profile_updated_at.timestamp() if self.profile_updated_at else None
+        self.vector_embedding_profile, self.embedding_norm, until = profiles.fold(
+            self.vector_embedding_profile, updated_at, embeddings, times, timestamps
+        )
+        if with_tfidf.any():
+            self.tfidf_profile, self.tfidf_norm, _ = profiles.fold_sparse(
+                self.tfidf_profile, updated_at,
+                [i[1] for i, keep in zip(interactions, with_tfidf) if keep],
+                times[with_tfidf], timestamps[with_tfidf], until=until,
+            )
+        elif self.tfidf_profile.nnz and updated_at is not None:
+            decay = np.exp2((updated_at - until) / profiles.half_life_seconds())
+            self.tfidf_profile = SparseVector(self.tfidf_profile.indices, self.tfidf_profile.values * decay)
+            self.tfidf_norm *= decay
+        self.profile_updated_at = datetime.fromtimestamp(until, tz=dt_timezone.utc)
+        self.watched_articles += len(interactions)
+        return len(interactions)
+
     def get_normalized_profiles(self):
         """
         Return normalized versions of both profile vectors.
         Useful for similarity calculations and recommendations.
         """
-        def normalize_vector(vector):
-            if not vector:
+        def normalize_vector(vector, norm):
+            if vector is None or len(vector) == 0:
                 return None
-            magnitude = sum(x * x for x in vector) ** 0.5
-            if magnitude == 0:
+            if norm == 0:
                 return vector
-            return [x / magnitude for x in vector]
-        
+            return np.asarray(vector, dtype=np.float32) / np.float32(norm)
+
+        def normalize_sparse(vector, norm):
+            if vector is None or vector.nnz == 0:
+                return None
+            if norm == 0:
+                return vector
+            return SparseVector(vector.indices, vector.values / np.float32(norm))
+
         return {
-            'normalized_embedding': normalize_vector(self.vector_embedding_profile),
-            'normalized_tfidf': normalize_vector(self.tfidf_profile)
+            'normalized_embedding': normalize_vector(self.vector_embedding_profile, self.embedding_norm),
+            'normalized_tfidf': normalize_sparse(self.tfidf_profile, self.tfidf_norm)
         }
 
 class UserInteractions(models.Model):
@@ -183,6 +340,7 @@ class UserInteractions(models.Model):
     session_id = models.CharField(max_length=255)
     clicked = models.BooleanField(default=False)
     time_spent = models.IntegerField(default=0)  # Time spent in seconds
+    created_at = models.DateTimeField(default=timezone.now)
 
     def __str__(self):
         return f"{self.user.username} - {self.article.title} - {self.session_id}"
@@ -196,6 +354,6 @@ class UserInteractions(models.Model):
             
             # Update user profile
             user_profile, created = UserProfile.objects.get_or_create(user=self.user)
-            user_profile.update_profile_vectors(self.article, self.time_spent)
+            user_profile.update_profile_vectors(self.article, self.time_spent, self.created_at)
         
         super().save(*args, **kwargs)
\ No newline at end of file
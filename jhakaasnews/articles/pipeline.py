@@ -0,0 +1,254 @@
+"""
+Recommendation pipeline: candidate generation, blended scoring, hydration.
+
+`get_recommended_articles` used to run separate passes for embedding
+neighbours, shared labels, keywords and recent articles, loading Article
+objects in each pass and walking the whole window for the recency fallback.
+A `RecommendationPipeline` runs in three stages instead:
+
+1. generate: each candidate generator returns `(ids, scores)` arrays of at
+   most CANDIDATES articles, from an in-memory index or (recency) one
+   indexed query;
+2. score: generator scores are scaled to [0, 1] by their maximum, weighted
+   by WEIGHTS and summed per article with NumPy; the top k are kept;
+3. hydrate: the final k ids are loaded with one `in_bulk` query.
+
+Generators are looked up by name in GENERATORS, so another source is a class
+with a `generate(query, limit)` method registered there plus a weight in
+settings. Every stage is timed; callables passed to `add_hook` receive
+`(stage, seconds)` after each one.
+"""
+import time
+from collections import namedtuple
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+DEFAULTS = {
+    'WEIGHTS': {
+        'embedding': 1.0,
+        'labels': 0.3,
+        'keywords': 0.3,
+        'popularity': 0.05,
+        'recency': 0.02,
+    },
+    'CANDIDATES': 50,
+}
+
+RecommendationQuery = namedtuple(
+    'RecommendationQuery',
+    ['vector', 'labels', 'tfidf_vector', 'exclude_ids'],
+    defaults=(None, (), None, ()),
+)
+
+
+def pipeline_settings():
+    config = {**DEFAULTS, **getattr(settings, 'RECOMMENDATION_PIPELINE', {})}
+    config['WEIGHTS'] = {**DEFAULTS['WEIGHTS'], **config['WEIGHTS']}
+    return config
+
+
+def query_for_article(article):
+    """Pipeline query for the articles related to `article`."""
+    return RecommendationQuery(
+        vector=article.vector_embedding,
+        labels=tuple(article.get_labels_list()),
+        tfidf_vector=article.tfidf_vector,
+        exclude_ids=(article.id,),
+    )
+
+
+def _empty():
+    return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+
+
+def _top(ids, scores, limit):
+    """The `limit` best `(ids, scores)`, unordered."""
+    if len(ids) > limit:
+        keep = np.argpartition(-scores, limit - 1)[:limit]
+        ids, scores = ids[keep], scores[keep]
+    return ids, scores
+
+
+def _without(ids, scores, exclude_ids):
+    if len(exclude_ids) and len(ids):
+        keep = ~np.isin(ids, np.fromiter(exclude_ids, dtype=np.int64))
+        ids, scores = ids[keep], scores[keep]
+    return ids, scores
+
+
+class EmbeddingGenerator:
+    """Nearest active articles by embedding cosine (exact or ANN; see articles/index.py)."""
+
+    def generate(self, query, limit):
+        from .index import article_index
+
+        if query.vector is None or not len(query.vector):
+            return _empty()
+        article_index.ensure_fresh()
+        neighbours = article_index.search(query.vector, limit, exclude_ids=query.exclude_ids)
+        return (
+            np.array([article_id for article_id, _ in neighbours], dtype=np.int64),
+            np.array([score for _, score in neighbours], dtype=np.float64),
+        )
+
+
+class LabelGenerator:
+    """Active articles sharing labels, scored by the fraction of the query's labels they carry."""
+
+    def generate(self, query, limit):
+        from .labels import label_index
+
+        if not query.labels:
+            return _empty()
+        label_index.ensure_fresh()
+        ids, shared, _ = label_index.overlap(query.labels, query.exclude_ids)
+        return _top(ids, shared / len(set(query.labels)), limit)
+
+
+class KeywordGenerator:
+    """Active articles by TF-IDF cosine (see articles/tfidf.py)."""
+
+    def generate(self, query, limit):
+        from .tfidf import tfidf_index
+
+        if query.tfidf_vector is None:
+            return _empty()
+        tfidf_index.ensure_fresh()
+        ids, scores = tfidf_index.scores(query.tfidf_vector)
+        positive = scores > 0
+        ids, scores = _without(ids[positive], np.asarray(scores[positive], dtype=np.float64), query.exclude_ids)
+        return _top(ids, scores, limit)
+
+
+class PopularityGenerator:
+    """Trending active articles by time-decayed views (see articles/trending.py)."""
+
+    def generate(self, query, limit):
+        from .trending import trending_engine
+
+        ranked = trending_engine.top(limit, exclude_ids=query.exclude_ids)
+        return (
+            np.array([article_id for article_id, _ in ranked], dtype=np.int64),
+            np.array([score for _, score in ranked], dtype=np.float64),
+        )
+
+
+class RecencyGenerator:
+    """
+    Newest active articles, scored by how much of the active window is still
+    ahead of them. Read from the database rather than the vector index, so
+    articles still waiting for an embedding are candidates too.
+    """
+
+    def generate(self, query, limit):
+        from .models import ACTIVE_WINDOW, ActiveArticles
+
+        newest = [
+            (article_id, added.timestamp())
+            for article_id, added in ActiveArticles.objects.exclude(pk__in=query.exclude_ids)
+            .order_by('-date_added', '-id')
+            .values_list('id', 'date_added')[:limit]
+        ]
+        now = timezone.now().timestamp()
+        window = ACTIVE_WINDOW.total_seconds()
+        return (
+            np.array([article_id for article_id, _ in newest], dtype=np.int64),
+            np.array([1 - (now - added) / window for _, added in newest], dtype=np.float64),
+        )
+
+
+GENERATORS = {
+    'embedding': EmbeddingGenerator,
+    'labels': LabelGenerator,
+    'keywords': KeywordGenerator,
+    'popularity': PopularityGenerator,
+    'recency': RecencyGenerator,
+}
+
+
+def blend(candidates, weights, k):
+    """
+    Vectorized scorer: sum `weight * score / max score` per article over all
+    generators and keep the best `k`.
+
+    Args:
+        candidates (dict): `{generator name: (ids, scores)}`.
+        weights (dict): `{generator name: weight}`.
+        k (int): Number of articles to keep.
+
+    Returns:
+        tuple: `(ids, scores)` arrays, best first; ties go to the newest id.
+    """
+    ids, scores = [], []
+    for name, (generated_ids, generated_scores) in candidates.items():
+        if not len(generated_ids):
+            continue
+        top = generated_scores.max()
+        ids.append(generated_ids)
+        scores.append(weights[name] * (generated_scores / top if top > 0 else np.zeros(len(generated_scores))))
+    if not ids:
+        return _empty()
+    unique, inverse = np.unique(np.concatenate(ids), return_inverse=True)
+    totals = np.bincount(inverse, weights=np.concatenate(scores), minlength=len(unique))
+    order = np.lexsort((-unique, -totals))[:k]
+    return unique[order], totals[order]
+
+
+class RecommendationPipeline:
+    """Generators -> blended scorer -> hydration; see the module docstring."""
+
+    def __init__(self, weights=None, candidates=None):
+        self.weights = weights
+        self.candidates = candidates
+        self._hooks = []
+
+    def add_hook(self, hook):
+        """Call `hook(stage, seconds)` after every stage ('generate:<name>', 'score', 'hydrate')."""
+        self._hooks.append(hook)
+
+    def _timed(self, stage, started):
+        seconds = time.perf_counter() - started
+        for hook in self._hooks:
+            hook(stage, seconds)
+        return seconds
+
+    def rank(self, query, k):
+        """
+        Blended top `k` article ids for `query`, without loading articles.
+
+        Returns:
+            tuple: `(ids, scores)` arrays, best first.
+        """
+        config = pipeline_settings()
+        weights = {name: weight for name, weight in (self.weights or config['WEIGHTS']).items() if weight > 0}
+        limit = max(self.candidates or config['CANDIDATES'], k)
+        candidates = {}
+        for name in weights:
+            started = time.perf_counter()
+            candidates[name] = GENERATORS[name]().generate(query, limit)
+            self._timed(f'generate:{name}', started)
+        started = time.perf_counter()
+        ranked = blend(candidates, weights, k)
+        self._timed('score', started)
+        return ranked
+
+    def recommend(self, query, k, queryset=None):
+        """
+        The blended top `k` articles for `query`, loaded with one `in_bulk`
+        query on `queryset` (the listing columns of active articles by default).
+        """
+        from .models import ActiveArticles
+
+        ids, _ = self.rank(query, k)
+        started = time.perf_counter()
+        queryset = queryset if queryset is not None else ActiveArticles.objects.listing()
+        ids = ids.tolist()
+        rows = queryset.in_bulk(ids)
+        articles = [rows[article_id] for article_id in ids if article_id in rows]
+        self._timed('hydrate', started)
+        return articles
+
+
+recommendation_pipeline = RecommendationPipeline()
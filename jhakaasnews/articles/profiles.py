@@ -0,0 +1,150 @@
+"""
+NumPy profile engine for user interest vectors.
+
+A profile is a time-decayed sum of the vectors of the articles a user read,
+each weighted by the seconds spent on it:
+
+    profile(T) = sum_i time_spent_i * 0.5 ** ((T - t_i) / half_life) * vector_i
+
+so older reads fade out with the configured half-life. The profile is updated
+incrementally (scale by the decay since the last update, then axpy the new
+vectors) and its L2 norm is cached next to it so ranking never recomputes it.
+"""
+import numpy as np
+from django.conf import settings
+from scipy.linalg import blas
+from scipy.sparse import csr_matrix, issparse
+
+from .fields import SparseVector
+
+DEFAULTS = {
+    'HALF_LIFE_DAYS': 7.0,
+}
+
+
+def profile_settings():
+    return {**DEFAULTS, **getattr(settings, 'USER_PROFILES', {})}
+
+
+def half_life_seconds():
+    return profile_settings()['HALF_LIFE_DAYS'] * 86400.0
+
+
+def decay_weights(times_spent, timestamps, until, half_life=None):
+    """Per-interaction weights `time_spent * 0.5 ** ((until - t) / half_life)`."""
+    half_life = half_life or half_life_seconds()
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    return (
+        np.asarray(times_spent, dtype=np.float64) * np.exp2((timestamps - until) / half_life)
+    ).astype(np.float32)
+
+
+def fold(profile, updated_at, vectors, times_spent, timestamps, half_life=None, until=None):
+    """
+    Fold interactions into a profile vector.
+
+    Args:
+        profile (np.ndarray): Current profile, or None for an empty one.
+        updated_at (float): Unix time the profile was last updated (None if empty).
+        vectors (np.ndarray): interactions x dims matrix of article vectors.
+        times_spent: Seconds spent per interaction.
+        timestamps: Unix time of each interaction.
+        half_life (float): Decay half-life in seconds; defaults to the setting.
+        until (float): Time to decay the result to; defaults to the latest
+            of `updated_at` and `timestamps`.
+
+    Returns:
+        tuple: `(profile, norm, updated_at)` with a new writeable float32 profile.
+    """
+    half_life = half_life or half_life_seconds()
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if until is None:
+        until = float(np.max(timestamps))
+        if updated_at is not None:
+            until = max(until, updated_at)
+    if profile is None or len(profile) == 0:
+        profile = np.zeros(vectors.shape[1], dtype=np.float32)
+    else:
+        profile = np.array(profile, dtype=np.float32)
+        if updated_at is not None and until > updated_at:
+            profile *= np.float32(np.exp2((updated_at - until) / half_life))
+
+    weights = decay_weights(times_spent, timestamps, until, half_life)
+    if vectors.shape[0] == 1:
+        profile = blas.saxpy(vectors[0], profile, a=float(weights[0]))
+    else:
+        profile += weights @ vectors
+    return profile, float(blas.snrm2(profile)), until
+
+
+def fold_sparse(profile, updated_at, vectors, times_spent, timestamps, half_life=None, until=None):
+    """
+    `fold` for sparse profiles: `profile` is a `SparseVector` (or None) and
+    `vectors` a list of them. Terms are merged with one `np.unique` and summed
+    with `np.bincount`, so the cost follows the number of non-zeros only.
+
+    Returns:
+        tuple: `(profile, norm, updated_at)` with a new `SparseVector` profile.
+    """
+    half_life = half_life or half_life_seconds()
+    if until is None:
+        until = float(np.max(timestamps))
+        if updated_at is not None:
+            until = max(until, updated_at)
+    weights = decay_weights(times_spent, timestamps, until, half_life)
+    indices = [vector.indices for vector in vectors]
+    values = [vector.values * weight for vector, weight in zip(vectors, weights)]
+    if profile is not None and profile.nnz:
+        decay = np.exp2((updated_at - until) / half_life) if updated_at is not None else 1.0
+        indices.append(profile.indices)
+        values.append(profile.values * np.float32(decay))
+    terms, positions = np.unique(np.concatenate(indices), return_inverse=True)
+    summed = np.bincount(positions, weights=np.concatenate(values), minlength=terms.shape[0])
+    profile = SparseVector(terms, summed)
+    return profile, profile.norm(), until
+
+
+def sparse_rows(vectors):
+    """Stack `SparseVector`s into a CSR matrix with one row per vector."""
+    from .tfidf import N_FEATURES
+
+    lengths = np.array([vector.nnz for vector in vectors], dtype=np.int64)
+    indptr = np.concatenate([[0], np.cumsum(lengths)])
+    indices = np.concatenate([vector.indices for vector in vectors]) if vectors else np.empty(0, np.int32)
+    values = np.concatenate([vector.values for vector in vectors]) if vectors else np.empty(0, np.float32)
+    return csr_matrix((values, indices, indptr), shape=(len(vectors), N_FEATURES))
+
+
+def replay(user_rows, article_rows, times_spent, timestamps, vectors, n_users, half_life=None, until=None):
+    """
+    Rebuild many profiles from scratch with one sparse-dense product.
+
+    Args:
+        user_rows (np.ndarray): Profile row of each interaction.
+        article_rows (np.ndarray): Row in `vectors` of each interaction's article.
+        times_spent, timestamps: Per-interaction seconds spent and unix time.
+        vectors: articles x dims matrix of article vectors, dense or a scipy
+            sparse matrix (see `sparse_rows`).
+        n_users (int): Number of profile rows to produce.
+        until (np.ndarray): Per-user time to decay to; defaults to each
+            user's latest interaction.
+
+    Returns:
+        tuple: `(profiles, norms, updated_at)` arrays with one row per user; each
+        profile is decayed to that user's latest interaction, exactly as the
+        incremental `fold` would leave it. `profiles` is a CSR matrix when
+        `vectors` is sparse.
+    """
+    half_life = half_life or half_life_seconds()
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    if until is None:
+        until = np.full(n_users, -np.inf)
+        np.maximum.at(until, user_rows, timestamps)
+    weights = decay_weights(times_spent, timestamps, until[user_rows], half_life)
+    weight_matrix = csr_matrix((weights, (user_rows, article_rows)), shape=(n_users, vectors.shape[0]))
+    if issparse(vectors):
+        result = (weight_matrix @ vectors).tocsr().astype(np.float32)
+        norms = np.sqrt(np.asarray(result.multiply(result).sum(axis=1)).ravel())
+        return result, norms, until
+    result = np.asarray(weight_matrix @ vectors, dtype=np.float32)
+    return result, np.linalg.norm(result, axis=1), until
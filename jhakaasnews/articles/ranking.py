@@ -0,0 +1,84 @@
+"""
+Batched similarity ranking over a matrix of candidate embeddings.
+
+Queries may be a single vector or a users x dims matrix; either way all scores
+are produced by one matrix product and the top-k is taken with `argpartition`
+instead of sorting every candidate.
+"""
+import numpy as np
+
+
+def normalize_rows(matrix):
+    """Return a float32 copy of `matrix` with every non-zero row scaled to unit length."""
+    matrix = np.array(matrix, dtype=np.float32, ndmin=2)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def top_k_indices(scores, k):
+    """
+    Column indices of the `k` largest finite scores in each row, best first.
+
+    Args:
+        scores (np.ndarray): 1-D or 2-D score array.
+        k (int): Number of indices to keep per row.
+
+    Returns:
+        list: One index array per row (a single array for 1-D input). Rows may
+        hold fewer than `k` entries when some scores are masked with -inf.
+    """
+    single = scores.ndim == 1
+    scores = np.atleast_2d(scores)
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        empty = np.empty(0, dtype=np.intp)
+        return empty if single else [empty] * scores.shape[0]
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1)
+    top = np.take_along_axis(top, order, axis=1)
+    top_scores = np.take_along_axis(top_scores, order, axis=1)
+    rows = [row[np.isfinite(row_scores)] for row, row_scores in zip(top, top_scores)]
+    return rows[0] if single else rows
+
+
+def seen_mask(candidate_ids, seen_ids_per_query):
+    """
+    Boolean queries x candidates mask that is True where a candidate was already seen.
+
+    Args:
+        candidate_ids (np.ndarray): Article ids of the candidate matrix rows.
+        seen_ids_per_query (list): One iterable of seen article ids per query.
+    """
+    candidate_ids = np.asarray(candidate_ids)
+    mask = np.zeros((len(seen_ids_per_query), candidate_ids.shape[0]), dtype=bool)
+    for row, seen_ids in enumerate(seen_ids_per_query):
+        seen_ids = np.fromiter(seen_ids, dtype=candidate_ids.dtype)
+        if seen_ids.size:
+            mask[row] = np.isin(candidate_ids, seen_ids)
+    return mask
+
+
+def rank_candidates(queries, candidates, k, mask=None):
+    """
+    Score queries against unit-length candidate rows and keep the top `k` per query.
+
+    Args:
+        queries: One embedding or a queries x dims matrix; normalized here.
+        candidates (np.ndarray): candidates x dims matrix of unit-length rows.
+        k (int): Number of results per query.
+        mask (np.ndarray): Optional queries x candidates boolean array of
+            candidates to exclude.
+
+    Returns:
+        list: One `(indices, scores)` pair per query row.
+    """
+    queries = normalize_rows(queries)
+    scores = queries @ candidates.T
+    if mask is not None:
+        scores[mask] = -np.inf
+    return [
+        (indices, row_scores[indices])
+        for indices, row_scores in zip(top_k_indices(scores, k), scores)
+    ]
@@ -0,0 +1,305 @@
+"""
+Materialized "related articles" for `article_detail`.
+
+An article's neighbours only change when articles are added, edited, deleted
+or roll out of the active window, so they are computed ahead of time into
+`RelatedArticle` rows (top `TOP_K` per article, best first) and the page reads
+them with one indexed query.
+
+`related_refresher` keeps the table current incrementally. Saves and deletes
+queue the ids they touch; a background thread coalesces them and recomputes
+only the affected lists:
+
+- the changed articles themselves,
+- lists that contained a changed or deleted article,
+- lists a new or edited article now belongs in: an embedding cosine above the
+  list's last stored score, or a list that is not full yet,
+- lists that contained an article which has left the active window (checked
+  every SWEEP_INTERVAL seconds).
+
+Lists are ranked in tiers: embedding neighbours, then articles sharing
+labels, then TF-IDF neighbours. Unlike the blended live ranking
+(`pipeline.recommendation_pipeline`), tiers keep stored scores as embedding
+cosines, which is what makes the threshold test above sound. The recency
+fallback is applied by the view at read time.
+"""
+import atexit
+import logging
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+
+from .index import article_index
+from .labels import label_index, parse_labels
+from .models import ActiveArticles, RelatedArticle, active_window_start
+from .tfidf import tfidf_index
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': True,
+    'TOP_K': 10,
+    'BATCH_SIZE': 256,
+    'DEBOUNCE': 2.0,
+    'SWEEP_INTERVAL': 300,
+    'SYNC': False,
+}
+
+
+def related_settings():
+    return {**DEFAULTS, **getattr(settings, 'RELATED_ARTICLES', {})}
+
+
+def compute_related(article_ids, k=None):
+    """
+    Rank the related articles of each active article in `article_ids`.
+
+    Returns:
+        dict: `{article_id: [(related_id, score), ...]}`, best first, at most
+        `k` (default TOP_K) entries each. Scores are embedding cosines for
+        embedding neighbours and TF-IDF cosines for the label and keyword tiers.
+    """
+    k = k or related_settings()['TOP_K']
+    rows = list(
+        ActiveArticles.objects.filter(id__in=article_ids)
+        .values_list('id', 'labels', 'vector_embedding', 'tfidf_vector')
+    )
+    results = {article_id: [] for article_id, _, _, _ in rows}
+
+    article_index.ensure_fresh()
+    embedded = [(article_id, vector) for article_id, _, vector, _ in rows if vector is not None and len(vector)]
+    if embedded:
+        ranked = article_index.rank(
+            [vector for _, vector in embedded], k, seen_ids=[[article_id] for article_id, _ in embedded]
+        )
+        for (article_id, _), neighbours in zip(embedded, ranked):
+            results[article_id] = neighbours
+
+    # Only lists with too few embedding neighbours need the label and keyword tiers.
+    incomplete = [row for row in rows if len(results[row[0]]) < k]
+    if incomplete:
+        _fill(incomplete, results, k)
+    return results
+
+
+def _fill(rows, results, k):
+    tfidf_index.ensure_fresh()
+    with_tfidf = [row for row in rows if row[3] is not None and row[3].nnz]
+    ids, scores = tfidf_index.score_matrix([row[3] for row in with_tfidf])
+    columns = {row[0]: column for column, row in enumerate(with_tfidf)}
+    label_index.ensure_fresh()
+
+    for article_id, labels, _, _ in rows:
+        keyword_scores = {}
+        if article_id in columns:
+            keyword_scores = dict(zip(ids.tolist(), scores[:, columns[article_id]].tolist()))
+            keyword_scores.pop(article_id, None)
+
+        # Ranked as in the live ranking: shared labels, keyword score, views.
+        label_ids = label_index.top(parse_labels(labels), k, keyword_scores, exclude_ids=[article_id])
+        keyword_ids = sorted(
+            (other_id for other_id, score in keyword_scores.items() if score > 0),
+            key=keyword_scores.get, reverse=True,
+        )[:k]
+
+        ranked = results[article_id]
+        seen = {article_id, *(related_id for related_id, _ in ranked)}
+        for other_id in label_ids + keyword_ids:
+            if len(ranked) >= k:
+                break
+            if other_id not in seen:
+                ranked.append((other_id, float(keyword_scores.get(other_id, 0.0))))
+                seen.add(other_id)
+
+
+class RelatedArticleRefresher:
+    """Queue of changed article ids, applied to `RelatedArticle` by a daemon thread."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._pending = {}
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._last_sweep = 0.0
+        self._metrics = {
+            'refreshes': 0,
+            'articles_recomputed': 0,
+            'rows_written': 0,
+            'last_refresh_at': None,
+            'last_recompute_seconds': 0.0,
+            'last_articles_recomputed': 0,
+            'last_freshness_lag_seconds': 0.0,
+            'max_freshness_lag_seconds': 0.0,
+        }
+
+    def start(self):
+        """Start the background thread (also sweeps expired neighbours) if it is not running."""
+        if related_settings()['SYNC']:
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            if self._thread is None:
+                atexit.register(self.refresh)
+            self._thread = threading.Thread(target=self._run, name='related-articles', daemon=True)
+            self._thread.start()
+
+    def articles_changed(self, article_ids):
+        """Queue articles whose own list, or whose presence in other lists, may have changed."""
+        config = related_settings()
+        if not config['ENABLED']:
+            return
+        now = time.monotonic()
+        with self._lock:
+            for article_id in article_ids:
+                self._pending.setdefault(article_id, now)
+        if config['SYNC']:
+            self.refresh()
+            return
+        self.start()
+        self._wakeup.set()
+
+    def metrics(self):
+        """
+        Counters and timings of the refresher: recompute time of the last
+        refresh, freshness lag (seconds from a change being queued to its lists
+        being rewritten) and the age of the oldest change still queued.
+        """
+        with self._lock:
+            oldest = min(self._pending.values(), default=None)
+            metrics = dict(self._metrics, pending=len(self._pending))
+        metrics['oldest_pending_seconds'] = time.monotonic() - oldest if oldest is not None else 0.0
+        return metrics
+
+    def _run(self):
+        while True:
+            config = related_settings()
+            self._wakeup.wait(config['SWEEP_INTERVAL'])
+            self._wakeup.clear()
+            # Let a burst of saves (e.g. an import) coalesce into one refresh.
+            time.sleep(config['DEBOUNCE'])
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("Failed to refresh related articles")
+            finally:
+                close_old_connections()
+
+    def refresh(self, full=False, article_ids=()):
+        """
+        Recompute every list affected by the queued changes and `article_ids`
+        (or all active lists when `full`) and drop rows of expired articles.
+        Returns the number of articles recomputed.
+        """
+        config = related_settings()
+        with self._refresh_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            now = time.monotonic()
+            for article_id in article_ids:
+                pending.setdefault(article_id, now)
+            started = time.perf_counter()
+            try:
+                if full:
+                    affected = set(ActiveArticles.objects.values_list('id', flat=True))
+                    RelatedArticle.objects.exclude(article_id__in=affected).delete()
+                else:
+                    affected = self._affected(set(pending), config['TOP_K'])
+                    if time.monotonic() - self._last_sweep >= config['SWEEP_INTERVAL']:
+                        affected |= self._sweep_expired()
+                rows_written = self._rewrite(affected, config)
+            except Exception:
+                with self._lock:
+                    for article_id, queued_at in pending.items():
+                        self._pending.setdefault(article_id, queued_at)
+                raise
+
+            finished = time.monotonic()
+            lag = finished - min(pending.values()) if pending else 0.0
+            with self._lock:
+                metrics = self._metrics
+                metrics['refreshes'] += 1
+                metrics['articles_recomputed'] += len(affected)
+                metrics['rows_written'] += rows_written
+                metrics['last_refresh_at'] = time.time()
+                metrics['last_recompute_seconds'] = time.perf_counter() - started
+                metrics['last_articles_recomputed'] = len(affected)
+                metrics['last_freshness_lag_seconds'] = lag
+                metrics['max_freshness_lag_seconds'] = max(metrics['max_freshness_lag_seconds'], lag)
+            if affected:
+                logger.info(
+                    "Recomputed related articles of %d articles in %.2fs (freshness lag %.2fs)",
+                    len(affected), metrics['last_recompute_seconds'], lag,
+                )
+            return len(affected)
+
+    def _affected(self, changed, k):
+        if not changed:
+            return set()
+        active = set(ActiveArticles.objects.values_list('id', flat=True))
+        affected = changed & active
+        affected |= set(
+            RelatedArticle.objects.filter(related_id__in=changed).values_list('article_id', flat=True)
+        )
+        article_index.ensure_fresh()
+        if len(article_index) <= k + 1:
+            # Too few embedded articles for full embedding lists: the label and
+            # keyword tiers are in play everywhere, so recompute every list.
+            return affected | active
+
+        # The score of the k-th row is the bar a new neighbour has to beat.
+        thresholds = dict(RelatedArticle.objects.filter(rank=k - 1).values_list('article_id', 'score'))
+        # Lists that are not full (or not computed yet), and articles without
+        # an embedding, may take any new article.
+        affected |= {
+            article_id for article_id in active
+            if article_id not in thresholds or article_id not in article_index
+        }
+        changed_active = changed & active
+        vectors = dict(
+            ActiveArticles.objects.filter(id__in=changed_active, vector_embedding__isnull=False)
+            .values_list('id', 'vector_embedding')
+        )
+        for vector in vectors.values():
+            ids, scores = article_index.similarities(vector)
+            bars = np.array([thresholds.get(article_id, -np.inf) for article_id in ids.tolist()])
+            affected.update(ids[scores > bars].tolist())
+        return affected
+
+    def _sweep_expired(self):
+        """Delete rows of articles that left the active window; returns the lists that lost a neighbour."""
+        start = active_window_start()
+        affected = set(
+            RelatedArticle.objects.filter(related__date_added__lt=start, article__date_added__gte=start)
+            .values_list('article_id', flat=True)
+        )
+        RelatedArticle.objects.filter(
+            Q(article__date_added__lt=start) | Q(related__date_added__lt=start)
+        ).delete()
+        self._last_sweep = time.monotonic()
+        return affected
+
+    def _rewrite(self, affected, config):
+        affected = sorted(affected)
+        rows_written = 0
+        for start in range(0, len(affected), config['BATCH_SIZE']):
+            batch = affected[start:start + config['BATCH_SIZE']]
+            related = compute_related(batch, config['TOP_K'])
+            rows = [
+                RelatedArticle(article_id=article_id, related_id=related_id, score=score, rank=rank)
+                for article_id, neighbours in related.items()
+                for rank, (related_id, score) in enumerate(neighbours)
+            ]
+            with transaction.atomic():
+                RelatedArticle.objects.filter(article_id__in=batch).delete()
+                RelatedArticle.objects.bulk_create(rows, batch_size=1000)
+            rows_written += len(rows)
+        return rows_written
+
+
+related_refresher = RelatedArticleRefresher()
@@ -0,0 +1,330 @@
+"""
+Full-text search over article titles and text.
+
+`index` used to filter with `title__icontains | text__icontains`, a `LIKE
+'%q%'` scan over every article's text per search. Searches now go through an
+inverted index chosen by database vendor, behind one API (`search_index`):
+
+- sqlite: an FTS5 table `articles_article_fts` (porter stemming), ranked by
+  FTS5's BM25 with title matches weighted TITLE_WEIGHT times higher.
+- postgresql: a stored, generated `tsvector` column on `articles_article`
+  with a GIN index (title weighted 'A', text 'B'), ranked by `ts_rank_cd`.
+  Postgres has no built-in BM25; cover-density ranking is the closest
+  native equivalent.
+- anything else: the former `icontains` filter, ordered by views.
+
+Migration 0008 creates the index. The sqlite table is kept current from
+`post_save` / `post_delete` and after bulk imports; the Postgres column is
+maintained by the database itself.
+
+With HYBRID_WEIGHT > 0, the top HYBRID_CANDIDATES lexical matches are
+re-ranked by `(1 - w) * bm25 / max_bm25 + w * cosine(query embedding,
+article embedding)`.
+"""
+import re
+
+import numpy as np
+from django.conf import settings
+from django.db import connection
+
+from .instrumentation import span
+
+DEFAULTS = {
+    'TITLE_WEIGHT': 5.0,
+    'HYBRID_WEIGHT': 0.0,
+    'HYBRID_CANDIDATES': 200,
+}
+
+FTS_TABLE = 'articles_article_fts'
+
+TERM_RE = re.compile(r"\w+")
+
+# Ids of the articles linked to the label named by the one parameter.
+LABEL_SUBQUERY = (
+    "SELECT al.article_id FROM articles_article_normalized_labels al "
+    "JOIN articles_label l ON l.id = al.label_id WHERE l.name = %s"
+)
+
+
+def search_settings():
+    return {**DEFAULTS, **getattr(settings, 'SEARCH', {})}
+
+
+def query_terms(query):
+    """Lower-cased word terms of a user query; punctuation and operators are dropped."""
+    return TERM_RE.findall((query or '').lower())
+
+
+class Fts5Backend:
+    """SQLite FTS5 table holding a copy of each article's title and text."""
+
+    def _match(self, terms):
+        # Every term must appear; quoting keeps words like AND / NOT literal.
+        return ' '.join('"{}"'.format(term.replace('"', '""')) for term in terms)
+
+    def _where(self, terms, since, featured, label):
+        sql = f"{FTS_TABLE} MATCH %s"
+        params = [self._match(terms)]
+        if since is not None:
+            sql += " AND a.date_added >= %s"
+            params.append(since)
+        if featured is not None:
+            sql += " AND a.featured = %s"
+            params.append(featured)
+        if label is not None:
+            sql += f" AND a.id IN ({LABEL_SUBQUERY})"
+            params.append(label)
+        return sql, params
+
+    def search(self, terms, since=None, featured=None, label=None, limit=None, offset=0):
+        where, params = self._where(terms, since, featured, label)
+        # bm25() is lower for better matches; it is negated so scores grow with relevance.
+        sql = (
+            f"SELECT f.rowid, -bm25({FTS_TABLE}, %s, 1.0) FROM {FTS_TABLE} f "
+            f"JOIN articles_article a ON a.id = f.rowid WHERE {where} "
+            "ORDER BY 2 DESC, f.rowid DESC LIMIT %s OFFSET %s"
+        )
+        params = [float(search_settings()['TITLE_WEIGHT']), *params, -1 if limit is None else limit, offset]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def count(self, terms, since=None, featured=None, label=None):
+        where, params = self._where(terms, since, featured, label)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT COUNT(*) FROM {FTS_TABLE} f JOIN articles_article a ON a.id = f.rowid WHERE {where}",
+                params,
+            )
+            return cursor.fetchone()[0]
+
+    def update(self, articles):
+        """(Re)index `(id, title, text)` of each article."""
+        rows = [(article.pk, article.title, article.text) for article in articles if article.pk is not None]
+        if not rows:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [(row[0],) for row in rows])
+            cursor.executemany(f"INSERT INTO {FTS_TABLE} (rowid, title, text) VALUES (%s, %s, %s)", rows)
+
+    def remove(self, article_ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [(i,) for i in article_ids])
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE}")
+            cursor.execute(f"INSERT INTO {FTS_TABLE} (rowid, title, text) SELECT id, title, text FROM articles_article")
+            cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+
+
+class PostgresBackend:
+    """Generated `search_vector` tsvector column with a GIN index; the database keeps it current."""
+
+    def _where(self, terms, since, featured, label):
+        sql = "search_vector @@ query"
+        params = []
+        if since is not None:
+            sql += " AND date_added >= %s"
+            params.append(since)
+        if featured is not None:
+            sql += " AND featured = %s"
+            params.append(featured)
+        if label is not None:
+            sql += f" AND id IN ({LABEL_SUBQUERY})"
+            params.append(label)
+        return sql, params
+
+    def search(self, terms, since=None, featured=None, label=None, limit=None, offset=0):
+        where, params = self._where(terms, since, featured, label)
+        sql = (
+            "SELECT id, ts_rank_cd(search_vector, query) AS score "
+            "FROM articles_article, plainto_tsquery('english', %s) query "
+            f"WHERE {where} ORDER BY score DESC, id DESC LIMIT %s OFFSET %s"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [' '.join(terms), *params, limit, offset])
+            return cursor.fetchall()
+
+    def count(self, terms, since=None, featured=None, label=None):
+        where, params = self._where(terms, since, featured, label)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT COUNT(*) FROM articles_article, plainto_tsquery('english', %s) query "
+                f"WHERE {where}",
+                [' '.join(terms), *params],
+            )
+            return cursor.fetchone()[0]
+
+    def update(self, articles):
+        pass
+
+    def remove(self, article_ids):
+        pass
+
+    def rebuild(self):
+        pass
+
+
+class IcontainsBackend:
+    """The former substring filter, for databases without a full-text index here."""
+
+    def _queryset(self, terms, since, featured, label):
+        from django.db.models import Q
+
+        from .models import Article
+
+        queryset = Article.objects.all()
+        for term in terms:
+            queryset = queryset.filter(Q(title__icontains=term) | Q(text__icontains=term))
+        if since is not None:
+            queryset = queryset.filter(date_added__gte=since)
+        if featured is not None:
+            queryset = queryset.filter(featured=featured)
+        if label is not None:
+            queryset = queryset.filter(normalized_labels__name=label)
+        return queryset
+
+    def search(self, terms, since=None, featured=None, label=None, limit=None, offset=0):
+        ids = self._queryset(terms, since, featured, label).order_by('-views', '-id').values_list('id', flat=True)
+        ids = ids[offset:offset + limit] if limit is not None else ids[offset:]
+        return [(article_id, 0.0) for article_id in ids]
+
+    def count(self, terms, since=None, featured=None, label=None):
+        return self._queryset(terms, since, featured, label).count()
+
+    def update(self, articles):
+        pass
+
+    def remove(self, article_ids):
+        pass
+
+    def rebuild(self):
+        pass
+
+
+BACKENDS = {
+    'sqlite': Fts5Backend,
+    'postgresql': PostgresBackend,
+}
+
+
+class SearchIndex:
+    """Vendor-independent entry point; see the module docstring."""
+
+    def backend(self):
+        return BACKENDS.get(connection.vendor, IcontainsBackend)()
+
+    @span('search')
+    def search(self, query, since=None, featured=None, label=None, limit=None, offset=0):
+        """
+        Rank articles matching every word of `query`.
+
+        Args:
+            query (str): User input; it is split into words, not parsed as syntax.
+            since (datetime): Only articles added at or after this time.
+            featured (bool): Only featured (True) or non-featured (False) articles.
+            label (str): Only articles carrying this label.
+            limit (int): Maximum number of results (None for all).
+            offset (int): Results to skip, for pagination.
+
+        Returns:
+            list: `(article_id, score)` pairs, best first.
+        """
+        terms = query_terms(query)
+        if not terms:
+            return []
+        backend = self.backend()
+        config = search_settings()
+        head = config['HYBRID_CANDIDATES']
+        if config['HYBRID_WEIGHT'] <= 0 or offset >= head:
+            return backend.search(terms, since, featured, label, limit, offset)
+
+        reranked = self._hybrid(query, backend.search(terms, since, featured, label, head, 0), config['HYBRID_WEIGHT'])
+        end = None if limit is None else offset + limit
+        results = reranked[offset:end]
+        if len(reranked) == head and (end is None or end > head):
+            # Past the re-ranked head, results continue in lexical order.
+            results += backend.search(terms, since, featured, label, None if end is None else end - head, head)
+        return results
+
+    def _hybrid(self, query, results, weight):
+        from .index import article_index
+        from .vectorizations import embed_texts
+
+        if not results:
+            return []
+        ids = np.array([article_id for article_id, _ in results], dtype=np.int64)
+        lexical = np.array([score for _, score in results], dtype=np.float64)
+        top = lexical.max()
+        lexical = lexical / top if top > 0 else lexical
+
+        article_index.ensure_fresh()
+        indexed_ids, similarities = article_index.similarities(embed_texts([query], use_cache=False)[0])
+        similarity_of = dict(zip(indexed_ids.tolist(), similarities.tolist()))
+        semantic = np.array([similarity_of.get(article_id, 0.0) for article_id in ids.tolist()])
+
+        scores = (1 - weight) * lexical + weight * semantic
+        order = np.argsort(-scores, kind='stable')
+        return [(int(ids[row]), float(scores[row])) for row in order]
+
+    def count(self, query, since=None, featured=None, label=None):
+        terms = query_terms(query)
+        return self.backend().count(terms, since, featured, label) if terms else 0
+
+    def update(self, articles):
+        self.backend().update(articles)
+
+    def remove(self, article_ids):
+        self.backend().remove(article_ids)
+
+    def rebuild(self):
+        self.backend().rebuild()
+
+
+search_index = SearchIndex()
+
+
+class SearchResults:
+    """
+    Search results for `index`, sliceable by `Paginator`: every featured
+    article of `queryset` first, then the non-featured matches best first.
+    Only the requested slice is ranked and loaded (with `queryset`'s columns).
+    With `label`, `queryset` is expected to be filtered to that label too.
+    """
+
+    def __init__(self, query, queryset, since=None, label=None):
+        self.query = query
+        self.queryset = queryset
+        self.since = since
+        self.label = label
+        self._featured = None
+        self._count = None
+
+    def featured(self):
+        if self._featured is None:
+            self._featured = list(self.queryset.filter(featured=True).order_by('-views', '-id'))
+        return self._featured
+
+    def __len__(self):
+        if self._count is None:
+            self._count = len(self.featured()) + search_index.count(
+                self.query, self.since, featured=False, label=self.label
+            )
+        return self._count
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice) or index.step is not None:
+            raise TypeError('SearchResults only supports contiguous slices.')
+        start, stop, _ = index.indices(len(self))
+        featured = self.featured()
+        articles = featured[start:stop]
+        offset = max(start - len(featured), 0)
+        limit = stop - start - len(articles)
+        if limit > 0:
+            matches = search_index.search(
+                self.query, self.since, featured=False, label=self.label, limit=limit, offset=offset
+            )
+            rows = self.queryset.in_bulk([article_id for article_id, _ in matches])
+            articles += [rows[article_id] for article_id, _ in matches if article_id in rows]
+        return articles
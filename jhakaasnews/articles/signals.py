@@ -0,0 +1,76 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .caching import bump_content_version, bump_user_versions
+from .dedup import duplicate_index
+from .index import article_index
+from .labels import label_index
+from .models import Article, RelatedArticle, UserInteractions, active_window_start
+from .related import related_refresher
+from .search import search_index
+from .tfidf import get_vocabulary, tfidf_index
+
+# Saves touching any of these can change related-article lists.
+RELATED_FIELDS = frozenset({'vector_embedding', 'tfidf_vector', 'labels', 'date_added'})
+
+# Saves touching any of these change what the article is found by.
+SEARCH_FIELDS = frozenset({'title', 'text'})
+
+# Saves touching only these leave cached pages valid (they expire on their own).
+COUNTER_FIELDS = frozenset({'views', 'time_spent_on'})
+
+
+@receiver(post_save)
+def index_saved_article(sender, instance, **kwargs):
+    # Connected without a sender so ActiveArticles proxy saves are seen too.
+    if not isinstance(instance, Article):
+        return
+    update_fields = kwargs.get('update_fields')
+    if update_fields is None or 'tfidf_vector' in update_fields:
+        tfidf_index.mark_dirty()
+    if 'simhash' in instance.__dict__ and (update_fields is None or 'simhash' in update_fields):
+        duplicate_index.add(instance.id, instance.simhash)
+    if update_fields is None or RELATED_FIELDS.intersection(update_fields):
+        related_refresher.articles_changed([instance.id])
+    if update_fields is None or SEARCH_FIELDS.intersection(update_fields):
+        search_index.update([instance])
+    if update_fields is None or not COUNTER_FIELDS.issuperset(update_fields):
+        bump_content_version()
+    if instance.date_added < active_window_start():
+        article_index.remove(instance.id)
+        label_index.remove(instance.id)
+        return
+    if 'labels' in instance.__dict__:
+        label_index.add(instance.id, instance.labels, instance.date_added, instance.__dict__.get('views', 0))
+    article_index.add(instance.id, instance.vector_embedding, instance.date_added)
+
+
+@receiver(pre_delete)
+def queue_related_of_deleted_article(sender, instance, **kwargs):
+    # Rows pointing at the article are cascaded away with it, so the lists that
+    # held it are looked up before the delete.
+    if not isinstance(instance, Article):
+        return
+    related_refresher.articles_changed(
+        RelatedArticle.objects.filter(related_id=instance.id).values_list('article_id', flat=True)
+    )
+
+
+@receiver(post_delete)
+def unindex_deleted_article(sender, instance, **kwargs):
+    if not isinstance(instance, Article):
+        return
+    article_index.remove(instance.id)
+    label_index.remove(instance.id)
+    # Deferred fields cannot be loaded any more; such deletes leave the counts as they were.
+    get_vocabulary().remove(instance.__dict__.get('tfidf_vector'))
+    tfidf_index.mark_dirty()
+    duplicate_index.discard(instance.id)
+    search_index.remove([instance.id])
+    bump_content_version()
+
+
+@receiver(post_save, sender=UserInteractions)
+def invalidate_user_pages(sender, instance, **kwargs):
+    # A new interaction changes the user's profile and what they have already seen.
+    bump_user_versions([instance.user_id])
@@ -1,3 +1,972 @@
-from django.test import TestCase
+import json
+import threading
+import time
+import unittest
+from unittest import mock
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
 
-# Create your tests here.
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.contrib.postgres.fields import ArrayField
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test.utils import CaptureQueriesContext
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from scipy import sparse
+
+from .ann import hnswlib
+from .bandits import BanditEngine, EpsilonGreedy, bandit_settings, make_policy
+from .caching import bump_content_version, bump_user_versions, cache_key, get_or_compute
+from .collaborative import (
+    LIGHT_ROW_NNZ, CollaborativeRecommender, FactorModel, interaction_strength, solve_one, solve_side,
+)
+from .counters import CounterAccumulator, write_counts
+from .dedup import ArticleDuplicateIndex, SimHashIndex, byte_popcount, hamming, simhash, to_signed
+from .fields import SparseVector, VectorField
+from .index import ArticleVectorIndex
+from .instrumentation import MetricsRegistry, registry
+from .ingestion import InteractionEvent, apply_events
+from .labels import LabelIndex
+from .models import ActiveArticles, Article, UserInteractions
+from .pipeline import RecencyGenerator, RecommendationQuery
+from .search import BACKENDS, Fts5Backend, IcontainsBackend, SearchResults, search_index
+from .tfidf import TfidfVocabulary
+from .trending import TrendingEngine
+from .vectorizations import bulk_generate_vectors
+from .views import article_detail, update_interaction
+
+
+# Article.save embeds and queues related-list refreshes; tests keep both in memory.
+SAVE_SETTINGS = {'VECTOR_CACHE': {'ENABLED': False}, 'RELATED_ARTICLES': {'ENABLED': False}}
+
+
+def make_articles(count):
+    """Saved without `Article.save`, so no vectors are generated and no indexes are touched."""
+    return Article.objects.bulk_create(
+        Article(title=f'Article {i}', text=f'Text of article {i}.') for i in range(count)
+    )
+
+
+def event(user, article_id, time_spent=30, final_update=True, session_id='session'):
+    return InteractionEvent(
+        user_id=user.pk, article_id=article_id, session_id=session_id,
+        time_spent=time_spent, final_update=final_update, created_at=timezone.now(),
+    )
+
+
+@override_settings(INTERACTION_INGESTION={'SYNC': True}, ARTICLE_COUNTERS={'SYNC': True})
+class InteractionIngestionTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.users = [User.objects.create_user(email=f'reader{i}@example.com', password='x') for i in range(2)]
+        cls.articles = make_articles(3)
+
+    def test_missing_article_does_not_drop_the_batch(self):
+        first, second = self.users
+        events = [
+            event(first, self.articles[0].pk),
+            event(first, self.articles[1].pk, final_update=False),
+            event(second, 999999),
+            event(second, self.articles[2].pk),
+        ]
+        self.assertEqual(apply_events(events), 3)
+        self.assertEqual(
+            set(UserInteractions.objects.values_list('user_id', 'article_id', 'clicked')),
+            {
+                (first.pk, self.articles[0].pk, True),
+                (first.pk, self.articles[1].pk, False),
+                (second.pk, self.articles[2].pk, True),
+            },
+        )
+
+    def test_view_rejects_unknown_article(self):
+        request = RequestFactory().post(
+            '/', data=json.dumps({'time_spent': 10, 'final_update': True}), content_type='application/json'
+        )
+        request.user = self.users[0]
+        response = update_interaction(request, 999999)
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(UserInteractions.objects.exists())
+
+
+class TfidfVocabularyTests(TestCase):
+
+    def test_remove_undoes_add(self):
+        vocabulary = TfidfVocabulary()
+        kept = vocabulary.update("solar panels power the grid")
+        before = vocabulary.doc_freq.copy(), vocabulary.idf(kept.indices)
+        removed = vocabulary.update("the grid fails in the storm")
+        vocabulary.remove(removed)
+        self.assertEqual(vocabulary.n_docs, 1)
+        self.assertTrue((vocabulary.doc_freq == before[0]).all())
+        self.assertTrue((vocabulary.idf(kept.indices) == before[1]).all())
+
+
+@override_settings(**SAVE_SETTINGS)
+class BulkGenerateVectorsTests(TestCase):
+
+    def test_batches_notify_indexes(self):
+        articles = make_articles(5)
+        with mock.patch('articles.vectorizations.get_vocabulary', return_value=TfidfVocabulary()), \
+                mock.patch('articles.vectorizations.tfidf_index') as tfidf_index, \
+                mock.patch('articles.related.related_refresher') as related_refresher:
+            processed, _ = bulk_generate_vectors(Article.objects.order_by('pk'), batch_size=2)
+        self.assertEqual(processed, 5)
+        self.assertEqual(tfidf_index.mark_dirty.call_count, 3)
+        notified = [pk for call in related_refresher.articles_changed.call_args_list for pk in call.args[0]]
+        self.assertEqual(notified, [article.pk for article in articles])
+        self.assertFalse(Article.objects.filter(vector_embedding__isnull=True).exists())
+
+
+def flip_bits(fingerprint, count, rng):
+    bits = rng.choice(64, count, replace=False).astype(np.uint64)
+    return np.uint64(fingerprint) ^ np.bitwise_or.reduce(np.uint64(1) << bits)
+
+
+class SimHashIndexTests(TestCase):
+
+    def setUp(self):
+        self.rng = np.random.default_rng(0)
+        self.fingerprints = self.rng.integers(0, np.iinfo(np.uint64).max, 2000, dtype=np.uint64, endpoint=True)
+
+    def assertMatchesScan(self, index, fingerprints, query):
+        ids, distances = index.query(query)
+        scan = np.flatnonzero(hamming(fingerprints, query) <= index.max_distance)
+        self.assertEqual(ids.tolist(), scan.tolist())
+        self.assertEqual(distances.tolist(), hamming(fingerprints[scan], query).tolist())
+
+    def test_recall_at_max_distance(self):
+        # Half the fingerprints are merged into the band tables, the rest sit in the tail.
+        index = SimHashIndex(max_distance=5).build(np.arange(1000), self.fingerprints[:1000])
+        for article_id in range(1000, 2000):
+            index.add(article_id, self.fingerprints[article_id])
+        # Neighbours at exactly the maximum distance, from both halves.
+        fingerprints = np.concatenate(
+            [self.fingerprints, [flip_bits(f, 5, self.rng) for f in self.fingerprints[::50]]]
+        ).astype(np.uint64)
+        for article_id in range(2000, fingerprints.size):
+            index.add(article_id, fingerprints[article_id])
+        for fingerprint in self.fingerprints[::50]:
+            query = flip_bits(fingerprint, 5, self.rng)
+            self.assertMatchesScan(index, fingerprints, query)
+            self.assertMatchesScan(index, fingerprints, fingerprint)
+        self.assertEqual(index.query(flip_bits(self.fingerprints[0], 6, self.rng))[0].tolist(), [])
+
+    def test_merge_keeps_recall(self):
+        index = SimHashIndex(max_distance=5, merge_threshold=300)
+        for article_id, fingerprint in enumerate(self.fingerprints):
+            index.add(article_id, fingerprint)
+        for fingerprint in self.fingerprints[::100]:
+            self.assertMatchesScan(index, self.fingerprints, flip_bits(fingerprint, 5, self.rng))
+
+    def test_discard_then_add(self):
+        index = SimHashIndex(max_distance=5).build(np.arange(2000), self.fingerprints)
+        original, replacement = self.fingerprints[7], self.fingerprints[8] ^ np.uint64(1)
+        index.discard(7)
+        self.assertNotIn(7, index.query(original)[0])
+        index.add(7, replacement)
+        self.assertEqual(index.nearest(replacement), 7)
+        # Re-adding replaces the old fingerprint rather than keeping both.
+        self.assertNotIn(7, index.query(original)[0])
+        index.add(7, original)
+        self.assertEqual(index.nearest(original), 7)
+        self.assertNotIn(7, index.query(replacement)[0])
+        index.discard(7)
+        self.assertNotIn(7, index.query(original)[0])
+
+
+    def test_byte_popcount(self):
+        values = np.concatenate([self.fingerprints, np.array([0, 1, 1 << 63, 2 ** 64 - 1], dtype=np.uint64)])
+        expected = [bin(int(value)).count('1') for value in values]
+        self.assertEqual(byte_popcount(values).tolist(), expected)
+        self.assertEqual(byte_popcount(values.reshape(-1, 4)).tolist(), np.reshape(expected, (-1, 4)).tolist())
+        self.assertEqual(int(byte_popcount(np.uint64(2 ** 64 - 1))), 64)
+
+
+class ArticleDuplicateIndexTests(TestCase):
+
+    def test_signed_round_trip(self):
+        fingerprints = [np.uint64(1 << 63), np.uint64(0xFFFFFFFFFFFFFFFF), np.uint64(0x8000F0F0A5A5C3C3)]
+        stored = [to_signed(fingerprint) for fingerprint in fingerprints]
+        self.assertTrue(all(value < 0 for value in stored))
+        self.assertEqual(np.array(stored, dtype=np.int64).view(np.uint64).tolist(), [int(f) for f in fingerprints])
+
+        articles = Article.objects.bulk_create(
+            Article(title=f'Article {i}', text='', simhash=value) for i, value in enumerate(stored[:2])
+        )
+        self.assertEqual(
+            sorted(Article.objects.values_list('simhash', flat=True)), sorted(stored[:2])
+        )
+        index = ArticleDuplicateIndex()
+        index.ensure_loaded()
+        for article, fingerprint in zip(articles, fingerprints):
+            self.assertEqual(index.find_duplicate(fingerprint), article.pk)
+        # Added through the post_save path, by the stored signed value.
+        added = Article.objects.bulk_create([Article(title='Article 2', text='', simhash=stored[2])])[0]
+        index.add(added.pk, stored[2])
+        self.assertEqual(index.find_duplicate(fingerprints[2] ^ np.uint64(0b11)), added.pk)
+
+
+    @override_settings(**SAVE_SETTINGS)
+    def test_save_rejects_near_duplicates(self):
+        text = (
+            'Heavy rain flooded the old town market overnight after the river burst its banks. '
+            'Traders spent the morning carrying stock to higher ground while council crews cleared the drains. '
+            'Forecasters expect more rain on Thursday and have kept the flood warning in place for the valley.'
+        )
+        original = Article.objects.bulk_create(
+            [Article(title='Original', text=text, simhash=to_signed(simhash(text)))]
+        )[0]
+        original = Article.objects.get(pk=original.pk)
+        index = ArticleDuplicateIndex()
+        with mock.patch('articles.models.duplicate_index', index), \
+                mock.patch('articles.models.make_embedding', return_value=None) as make_embedding:
+            with self.assertRaises(ValidationError):
+                Article(title='Copy', text=text + ' Reuters').save()
+            make_embedding.assert_not_called()
+            self.assertFalse(Article.objects.filter(title='Copy').exists())
+
+            # An article never collides with its own stored fingerprint.
+            original.text = text + ' Reuters'
+            original.save()
+            with override_settings(NEAR_DUPLICATES={'ENABLED': False}):
+                Article(title='Copy', text=text).save()
+        self.assertTrue(Article.objects.filter(title='Copy').exists())
+
+    def test_stale_entries_are_dropped(self):
+        article = make_articles(1)[0]
+        fingerprint = np.uint64(0x0123456789ABCDEF)
+        index = ArticleDuplicateIndex()
+        index.ensure_loaded()
+        # As left behind by saves whose transaction rolled back.
+        index.add(article.pk, to_signed(fingerprint))
+        index.add(article.pk + 1, to_signed(fingerprint ^ np.uint64(1)))
+        self.assertIsNone(index.find_duplicate(fingerprint))
+        self.assertIsNone(index.nearest(fingerprint))
+
+        Article.objects.filter(pk=article.pk).update(simhash=to_signed(fingerprint))
+        index.add(article.pk, to_signed(fingerprint))
+        self.assertEqual(index.find_duplicate(fingerprint ^ np.uint64(0b11)), article.pk)
+
+
+class RecencyGeneratorTests(TestCase):
+
+    def test_articles_without_embeddings_are_candidates(self):
+        now = timezone.now()
+        articles = Article.objects.bulk_create(
+            Article(title=f'Article {i}', text='', date_added=now - timedelta(hours=i)) for i in range(4)
+        )
+        ids, scores = RecencyGenerator().generate(RecommendationQuery(exclude_ids=(articles[0].pk,)), 2)
+        self.assertEqual(ids.tolist(), [articles[1].pk, articles[2].pk])
+        self.assertTrue(scores[0] > scores[1] > 0)
+
+
+class AlternatingLeastSquaresTests(TestCase):
+
+    def test_batched_solve_matches_per_row(self):
+        rng = np.random.default_rng(0)
+        # Empty rows, light rows of every length, and rows above LIGHT_ROW_NNZ.
+        counts = np.concatenate([[0, 0], rng.integers(1, LIGHT_ROW_NNZ + 1, 300), [LIGHT_ROW_NNZ + 1, 150]])
+        columns = [rng.choice(200, count, replace=False) for count in counts]
+        matrix = sparse.csr_matrix(
+            (rng.uniform(0.5, 3, counts.sum()), np.concatenate(columns), np.concatenate([[0], np.cumsum(counts)])),
+            shape=(len(counts), 200),
+        )
+        fixed = rng.normal(0, 0.3, (200, 8))
+        base = fixed.T @ fixed + 0.1 * np.eye(8)
+        expected = np.array([
+            solve_one(base, fixed[matrix.indices[start:end]], matrix.data[start:end], 20.0)
+            for start, end in zip(matrix.indptr[:-1], matrix.indptr[1:])
+        ])
+        np.testing.assert_allclose(solve_side(matrix, fixed, 0.1, 20.0), expected, rtol=1e-8, atol=1e-10)
+        with ThreadPoolExecutor(2) as executor:
+            np.testing.assert_allclose(
+                solve_side(matrix, fixed, 0.1, 20.0, executor=executor), expected, rtol=1e-8, atol=1e-10
+            )
+
+
+@override_settings(COLLABORATIVE={'PATH': None})
+class CollaborativeRecommenderTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.users = [User.objects.create_user(email=f'cf{i}@example.com', password='x') for i in range(2)]
+        cls.articles = make_articles(6)
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        # The first five articles are trained; the last one has no factors and no embedding.
+        self.model = FactorModel(
+            [self.users[0].pk], rng.normal(size=(1, 4)),
+            [article.pk for article in self.articles[:5]], rng.normal(size=(5, 4)),
+        )
+        self.recommender = CollaborativeRecommender()
+        self.recommender.set_model(self.model)
+
+    def read(self, user, article, time_spent=120):
+        UserInteractions.objects.create(user=user, article=article, session_id='s', time_spent=time_spent)
+
+    def test_stale_users_are_folded_in(self):
+        user = self.users[0]
+        np.testing.assert_array_equal(self.recommender.user_factors(user.pk), self.model.user_factors[0])
+        self.read(user, self.articles[1])
+        self.read(user, self.articles[3], time_spent=600)
+        # Reads are not seen until ingestion marks the user changed.
+        np.testing.assert_array_equal(self.recommender.user_factors(user.pk), self.model.user_factors[0])
+
+        self.recommender.users_changed([user.pk])
+        expected = solve_one(
+            self.model.gram('item'), self.model.item_factors[[1, 3]],
+            interaction_strength([False, False], [120, 600]), self.model.alpha,
+        )
+        np.testing.assert_allclose(self.recommender.user_factors(user.pk), expected)
+        self.assertNotIn(user.pk, self.recommender._stale_users)
+
+    def test_new_user_folded_in_or_skipped(self):
+        newcomer = self.users[1]
+        self.assertIsNone(self.recommender.user_factors(newcomer.pk))
+        self.assertEqual(self.recommender.recommend(newcomer.pk, 3), [])
+        # Reads of articles without factors give nothing to fold in.
+        self.read(newcomer, self.articles[5])
+        self.assertIsNone(self.recommender.user_factors(newcomer.pk))
+        self.read(newcomer, self.articles[2])
+        np.testing.assert_allclose(
+            self.recommender.user_factors(newcomer.pk),
+            solve_one(self.model.gram('item'), self.model.item_factors[[2]], interaction_strength([False], [120]),
+                      self.model.alpha),
+        )
+
+    def test_recommend_excludes_seen_ids(self):
+        user = self.users[0]
+        trained = [article.pk for article in self.articles[:5]]
+        ranked = self.recommender.recommend(user.pk, 5)
+        self.assertEqual(sorted(article_id for article_id, _ in ranked), trained)
+        scores = [score for _, score in ranked]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+
+        seen = [article_id for article_id, _ in ranked[:3]]
+        ranked = self.recommender.recommend(user.pk, 5, seen)
+        self.assertEqual(
+            sorted(article_id for article_id, _ in ranked), [i for i in trained if i not in seen]
+        )
+        self.assertEqual(self.recommender.recommend(user.pk, 5, trained), [])
+
+    @override_settings(COLLABORATIVE={'PATH': None, 'ENABLED': False})
+    def test_disabled(self):
+        self.assertEqual(self.recommender.recommend(self.users[0].pk, 3), [])
+
+
+def clustered_vectors(rng, count, dim=32, clusters=40):
+    centres = rng.normal(size=(clusters, dim))
+    return centres[rng.integers(clusters, size=count)] + 0.3 * rng.normal(size=(count, dim))
+
+
+class ApproximateIndexTests(SimpleTestCase):
+
+    def build_index(self, backend, vectors):
+        index = ArticleVectorIndex()
+        with override_settings(ARTICLE_ANN={'BACKEND': backend, 'MIN_SIZE': 100, 'SYNC': True}):
+            for article_id, vector in enumerate(vectors):
+                index.add(article_id, vector)
+            index.rank(vectors[0], 1)
+        return index
+
+    def assertRecall(self, backend, minimum):
+        rng = np.random.default_rng(0)
+        vectors = clustered_vectors(rng, 3000)
+        index = self.build_index(backend, vectors)
+        self.assertIsNotNone(index._ann)
+        found = 0
+        with override_settings(ARTICLE_ANN={'BACKEND': backend, 'MIN_SIZE': 100, 'SYNC': True}):
+            for query in clustered_vectors(rng, 50):
+                ids, scores = index.similarities(query)
+                exact = set(ids[np.argsort(-scores)[:10]].tolist())
+                found += len(exact.intersection(i for i, _ in index.rank(query, 10)[0]))
+        self.assertGreaterEqual(found / 500, minimum)
+
+    def test_ivf_recall(self):
+        self.assertRecall('ivf', 0.9)
+
+    @unittest.skipIf(hnswlib is None, "hnswlib is not installed")
+    def test_hnsw_recall(self):
+        self.assertRecall('hnsw', 0.9)
+
+    def test_rows_changed_after_the_snapshot(self):
+        rng = np.random.default_rng(1)
+        vectors = clustered_vectors(rng, 1000)
+        index = self.build_index('ivf', vectors)
+        built = index._ann
+        query = rng.normal(size=32)
+        with override_settings(ARTICLE_ANN={'BACKEND': 'ivf', 'MIN_SIZE': 100, 'SYNC': True}):
+            index.add(5000, query)
+            index.add(3, -query)
+            index.remove(7)
+            self.assertEqual(index.rank(query, 1)[0][0][0], 5000)
+            ranked = dict(index.rank(query, 1000)[0])
+            self.assertIs(index._ann, built)
+        self.assertAlmostEqual(ranked[5000], 1.0, places=5)
+        # Changed rows are scored with their new vector, removed rows are gone.
+        self.assertAlmostEqual(ranked[3], -1.0, places=5)
+        self.assertNotIn(7, ranked)
+
+
+class VectorFieldTests(TestCase):
+
+    def test_float32_round_trip(self):
+        vector = np.random.default_rng(0).normal(size=384)
+        article = make_articles(1)[0]
+        Article.objects.filter(pk=article.pk).update(vector_embedding=vector)
+        stored = Article.objects.values_list('vector_embedding', flat=True).get(pk=article.pk)
+        self.assertEqual(stored.dtype, np.dtype('<f4'))
+        np.testing.assert_array_equal(stored, vector.astype(np.float32))
+
+    def test_from_db_value_is_a_read_only_view(self):
+        field = VectorField()
+        packed = np.arange(4, dtype='<f4').tobytes()
+        value = field.from_db_value(packed, None, connection)
+        self.assertFalse(value.flags.writeable)
+        self.assertFalse(value.flags.owndata)
+        self.assertEqual(value.tolist(), [0.0, 1.0, 2.0, 3.0])
+
+        sparse_vector = SparseVector([3, 9], [0.5, 2.0])
+        loaded = SparseVector.from_bytes(sparse_vector.to_bytes())
+        self.assertEqual(loaded, sparse_vector)
+        self.assertFalse(loaded.indices.flags.owndata or loaded.values.flags.owndata)
+
+    def test_none_and_empty(self):
+        field = VectorField()
+        self.assertIsNone(field.get_db_prep_value(None, connection))
+        self.assertIsNone(field.from_db_value(None, None, connection))
+        self.assertEqual(field.get_db_prep_value([], connection), b'')
+        self.assertEqual(field.from_db_value(b'', None, connection).shape, (0,))
+
+        articles = make_articles(2)
+        Article.objects.filter(pk=articles[0].pk).update(vector_embedding=[], tfidf_vector=SparseVector([], []))
+        stored = dict(Article.objects.values_list('id', 'vector_embedding'))
+        self.assertEqual(stored[articles[0].pk].shape, (0,))
+        self.assertIsNone(stored[articles[1].pk])
+        self.assertEqual(Article.objects.get(pk=articles[0].pk).tfidf_vector.nnz, 0)
+
+    def test_other_dtypes_are_converted(self):
+        field = VectorField()
+        for value in ([1, 2, 3], np.array([1, 2, 3], dtype=np.int64), np.array([1.0, 2.0, 3.0], dtype='>f8')):
+            packed = field.get_db_prep_value(value, connection)
+            self.assertEqual(np.frombuffer(packed, dtype='<f4').tolist(), [1.0, 2.0, 3.0])
+
+    def test_wrong_length_or_values(self):
+        field = VectorField(dim=3)
+        self.assertEqual(len(field.get_db_prep_value([1, 2, 3], connection)), 12)
+        with self.assertRaises(ValidationError):
+            field.get_db_prep_value([1, 2], connection)
+        with self.assertRaises(ValueError):
+            field.get_db_prep_value(['a', 'b', 'c'], connection)
+
+
+class MigrationTestCase(TransactionTestCase):
+    """Starts each test migrated to `before` and restores the latest schema afterwards."""
+
+    before = None
+    after = None
+
+    def setUp(self):
+        executor = MigrationExecutor(connection)
+        self.latest = executor.loader.graph.leaf_nodes('articles')
+        executor.migrate(self.before)
+
+    def tearDown(self):
+        MigrationExecutor(connection).migrate(self.latest)
+
+    def migrate(self, target):
+        # SQLite has no array type: ArrayField values are stored as JSON text
+        # here and converted as the Postgres driver would.
+        array_storage = {
+            'from_db_value': lambda field, value, *args: json.loads(value) if value else value,
+            'get_db_prep_value': lambda field, value, *args, **kwargs: None if value is None else json.dumps(value),
+            'get_placeholder': lambda field, *args: '%s',
+        }
+        with mock.patch.multiple(ArrayField, create=True, **array_storage):
+            executor = MigrationExecutor(connection)
+            executor.loader.build_graph()
+            executor.migrate(target)
+
+
+class PackVectorsMigrationTests(MigrationTestCase):
+    """0003 packs the former float arrays into VectorField bytes, and unpacks them when reversed."""
+
+    before = [('articles', '0002_article_featured_article_tfidf_vector_and_more')]
+    after = [('articles', '0003_vector_field_storage')]
+
+    def test_pack_and_unpack(self):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                'INSERT INTO articles_article (id, title, date_added, text, labels, views, featured, time_spent_on, '
+                'vector_embedding, tfidf_vector) VALUES (%s, %s, %s, %s, %s, 0, 0, 0, %s, %s)',
+                [
+                    (1, 'Packed', timezone.now(), 'text', '', '[0.5, -1.25, 3.0]', '[1.0, 0.0]'),
+                    (2, 'Empty', timezone.now(), 'text', '', '[]', None),
+                    (3, 'Missing', timezone.now(), 'text', '', None, None),
+                ],
+            )
+        self.migrate(self.after)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT id, vector_embedding, tfidf_vector FROM articles_article ORDER BY id')
+            rows = cursor.fetchall()
+        self.assertEqual(np.frombuffer(rows[0][1], dtype='<f4').tolist(), [0.5, -1.25, 3.0])
+        self.assertEqual(np.frombuffer(rows[0][2], dtype='<f4').tolist(), [1.0, 0.0])
+        self.assertEqual([rows[1][1:], rows[2][1:]], [(None, None), (None, None)])
+
+        self.migrate(self.before)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT id, vector_embedding, tfidf_vector FROM articles_article ORDER BY id')
+            rows = cursor.fetchall()
+        self.assertEqual([json.loads(rows[0][1]), json.loads(rows[0][2])], [[0.5, -1.25, 3.0], [1.0, 0.0]])
+        self.assertEqual([rows[2][1], rows[2][2]], [None, None])
+
+
+class PageCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_version_bump_invalidates_keys(self):
+        key = cache_key('index', 1, 'storm')
+        user_key = cache_key('home', user_id=7)
+        self.assertEqual(get_or_compute(key, lambda: 'before'), 'before')
+        self.assertEqual(get_or_compute(key, lambda: 'after'), 'before')
+
+        bump_user_versions([7])
+        self.assertEqual(cache_key('index', 1, 'storm'), key)
+        self.assertNotEqual(cache_key('home', user_id=7), user_key)
+
+        bump_content_version()
+        self.assertNotEqual(cache_key('index', 1, 'storm'), key)
+        self.assertEqual(get_or_compute(cache_key('index', 1, 'storm'), lambda: 'after'), 'after')
+
+    def test_concurrent_misses_compute_once(self):
+        calls = []
+        lock = threading.Lock()
+
+        def compute():
+            with lock:
+                calls.append(1)
+            time.sleep(0.2)
+            return 'page'
+
+        key = cache_key('index', 1)
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(lambda _: get_or_compute(key, compute), range(8)))
+        self.assertEqual(results, ['page'] * 8)
+        self.assertEqual(len(calls), 1)
+
+    @override_settings(**SAVE_SETTINGS)
+    def test_counter_saves_keep_pages_cached(self):
+        article = make_articles(1)[0]
+        key = cache_key('index', 1)
+        article.views = 5
+        article.time_spent_on = 90
+        article.save(update_fields=['views', 'time_spent_on'])
+        self.assertEqual(cache_key('index', 1), key)
+
+        article.featured = True
+        article.save(update_fields=['views', 'featured'])
+        self.assertNotEqual(cache_key('index', 1), key)
+
+
+@override_settings(**SAVE_SETTINGS)
+class SearchTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.title_match = Article.objects.create(
+            title='Volcano erupts near the coast', text='Ash closed two airports on Monday.', views=1
+        )
+        self.text_match = Article.objects.create(
+            title='Airline schedules', text='Flights were rerouted around the volcano plume.', views=50
+        )
+        self.featured = Article.objects.create(
+            title='Election results', text='Counting finished late on Sunday night.', featured=True
+        )
+        Article.objects.create(title='Harvest report', text='Wheat prices rose after a dry summer.')
+
+    def ids(self, results):
+        return [article.pk for article in results]
+
+    def test_title_matches_rank_first_after_featured(self):
+        results = SearchResults('Volcano', ActiveArticles.objects.listing())
+        self.assertEqual(len(results), 3)
+        self.assertEqual(self.ids(results[0:3]), [self.featured.pk, self.title_match.pk, self.text_match.pk])
+        self.assertEqual(self.ids(results[2:3]), [self.text_match.pk])
+        # Porter stemming: "erupting" matches "erupts".
+        self.assertEqual([pk for pk, _ in search_index.search('erupting volcanoes')], [self.title_match.pk])
+
+    def test_saves_and_deletes_update_the_index(self):
+        self.text_match.title = 'Glacier melt speeds up'
+        self.text_match.save()
+        self.assertEqual(
+            [pk for pk, _ in search_index.search('glacier')], [self.text_match.pk]
+        )
+        self.title_match.delete()
+        self.assertEqual([pk for pk, _ in search_index.search('volcano')], [self.text_match.pk])
+
+    def test_icontains_fallback_orders_by_views(self):
+        with mock.patch.dict(BACKENDS, clear=True):
+            self.assertIsInstance(search_index.backend(), IcontainsBackend)
+            results = SearchResults('volcano', ActiveArticles.objects.listing())
+            self.assertEqual(self.ids(results[0:3]), [self.featured.pk, self.text_match.pk, self.title_match.pk])
+
+    def test_index_view_uses_full_text_search(self):
+        with mock.patch.object(Fts5Backend, 'search', autospec=True, side_effect=Fts5Backend.search) as search:
+            response = self.client.get('/', {'q': 'volcano'})
+        self.assertEqual(response.status_code, 200)
+        search.assert_called()
+        self.assertEqual(
+            self.ids(response.context['articles']), [self.featured.pk, self.title_match.pk, self.text_match.pk]
+        )
+
+
+class SearchIndexMigrationTests(MigrationTestCase):
+    """0008 builds the FTS5 table from the existing articles and drops it when reversed."""
+
+    before = [('articles', '0007_related_articles')]
+    after = [('articles', '0008_article_search_index')]
+
+    def test_index_existing_articles(self):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                'INSERT INTO articles_article (id, title, date_added, text, labels, views, featured, time_spent_on) '
+                'VALUES (%s, %s, %s, %s, %s, 0, 0, 0)',
+                [
+                    (1, 'Volcano erupts', timezone.now(), 'Ash closed the airports.', ''),
+                    (2, 'Harvest report', timezone.now(), 'Wheat prices rose.', ''),
+                ],
+            )
+        self.migrate(self.after)
+        self.assertEqual([article_id for article_id, _ in Fts5Backend().search(['airports'])], [1])
+
+        self.migrate(self.before)
+        self.assertNotIn('articles_article_fts', connection.introspection.table_names())
+
+
+@mock.patch.object(CounterAccumulator, 'start')
+class ArticleCounterTests(TestCase):
+
+    def setUp(self):
+        self.articles = make_articles(3)
+        self.ids = [article.pk for article in self.articles]
+
+    def stored(self):
+        return list(Article.objects.order_by('pk').values_list('views', 'time_spent_on'))
+
+    def test_flush_writes_summed_counts(self, start):
+        counters = CounterAccumulator(shards=2)
+        first, second, third = self.ids
+        counters.add(first, views=1)
+        counters.add(first, time_spent=30)
+        counters.add(second, views=1, time_spent=30)
+        counters.add(third, views=2)
+        self.assertEqual(self.stored(), [(0, 0)] * 3)
+        self.assertEqual(counters.pending(first), (1, 30))
+        merged = counters.merge_pending(list(Article.objects.order_by('pk')))
+        self.assertEqual([(article.views, article.time_spent_on) for article in merged], [(1, 30), (1, 30), (2, 0)])
+
+        with mock.patch('articles.counters.write_counts', wraps=write_counts) as write:
+            self.assertEqual(counters.flush(), 3)
+            self.assertEqual(counters.flush(), 0)
+        write.assert_called_once()
+        self.assertEqual(self.stored(), [(1, 30), (1, 30), (2, 0)])
+        self.assertEqual(counters.pending(first), (0, 0))
+
+    def test_equal_increments_share_an_update(self, start):
+        first, second, third = self.ids
+        self.assertEqual(write_counts({first: (1, 30), second: (1, 30), third: (2, 0)}), 2)
+        self.assertEqual(self.stored(), [(1, 30), (1, 30), (2, 0)])
+
+    @override_settings(ARTICLE_COUNTERS={'SYNC': True})
+    def test_sync_writes_immediately(self, start):
+        counters = CounterAccumulator()
+        counters.add(self.ids[0], views=1, time_spent=12)
+        self.assertEqual(self.stored()[0], (1, 12))
+        self.assertEqual(counters.pending(self.ids[0]), (0, 0))
+        start.assert_not_called()
+
+    def test_article_detail_counts_one_view_per_request(self, start):
+        counters = CounterAccumulator()
+        article = self.articles[0]
+        request = RequestFactory().get('/')
+        with mock.patch('articles.views.article_counters', counters), \
+                mock.patch('articles.models.article_counters', counters), \
+                mock.patch('articles.views.get_related_articles', return_value=[]), \
+                mock.patch('articles.views.render') as render:
+            article_detail(request, article.pk)
+            self.assertEqual(render.call_args.args[2]['article'].views, 1)
+            article_detail(request, article.pk)
+            self.assertEqual(render.call_args.args[2]['article'].views, 2)
+            # Finished reads add their time without counting another view.
+            article.update_interaction_metrics(45)
+            article.update_interaction_metrics(15)
+        counters.flush()
+        self.assertEqual(self.stored()[0], (2, 60))
+
+
+class TrendingEngineTests(TestCase):
+
+    def setUp(self):
+        now = timezone.now()
+        self.articles = Article.objects.bulk_create(
+            Article(title=f'Article {i}', text='', labels=labels, date_added=now - timedelta(hours=hours))
+            for i, (labels, hours) in enumerate([('world', 1), ('world, sport', 2), ('sport', 3), ('', 0.5)])
+        )
+        self.ids = [article.pk for article in self.articles]
+        self.engine = TrendingEngine()
+        self.engine.sync()
+
+    def top_ids(self, k=4, **kwargs):
+        return [article_id for article_id, _ in self.engine.top(k, **kwargs)]
+
+    def test_top_follows_recorded_counts(self):
+        first, second, third, fourth = self.ids
+        # 180 seconds of reading count as three views at the default TIME_WEIGHT.
+        self.engine.record({first: (3, 0), second: (1, 0), third: (1, 180), fourth: (5, 0)})
+        self.assertEqual(self.top_ids(), [fourth, third, first, second])
+        self.assertEqual(self.top_ids(2), [fourth, third])
+        self.assertEqual(self.top_ids(label='sport'), [third, second])
+        self.assertEqual(self.top_ids(exclude_ids=[fourth, first]), [third, second])
+        self.assertEqual([label for label, _ in self.engine.top_labels(2)], ['sport', 'world'])
+
+        self.engine.record({second: (10, 0)})
+        self.assertEqual(self.top_ids(2), [second, fourth])
+
+    def test_rebase_keeps_order_and_scores(self):
+        first, second, third, fourth = self.ids
+        self.engine.record({first: (3, 0), second: (1, 0), third: (2, 0)})
+        before = self.engine.top(4)
+        self.engine._rebase(self.engine._landmark + 100 * 3600, self.engine._rate())
+        after = self.engine.top(4)
+        self.assertEqual([article_id for article_id, _ in after], [article_id for article_id, _ in before])
+        for (_, old), (_, new) in zip(before, after):
+            self.assertAlmostEqual(new, old, delta=old * 1e-6)
+
+        # Every record rebases when the threshold is crossed; the ranking still follows the counts.
+        with mock.patch('articles.trending.MAX_EXPONENT', -1.0):
+            self.engine.record({second: (3, 0)})
+        self.assertEqual(self.top_ids(3), [second, first, third])
+
+    def test_articles_leaving_the_window_are_excluded(self):
+        first, second, third, fourth = self.ids
+        self.engine.record({first: (1, 0), second: (2, 0), third: (3, 0), fourth: (4, 0)})
+        window_start = timezone.now() - timedelta(hours=2, minutes=30)
+        with mock.patch('articles.models.active_window_start', return_value=window_start):
+            self.assertEqual(self.top_ids(label='world'), [second, first])
+            self.assertEqual(self.top_ids(), [fourth, second, first])
+
+        Article.objects.filter(pk=fourth).update(date_added=timezone.now() - timedelta(days=4))
+        self.engine.sync()
+        self.assertEqual(self.top_ids(), [third, second, first])
+        self.engine.record({fourth: (10, 0)})
+        self.assertEqual(self.top_ids(), [third, second, first])
+
+
+class LabelIndexTests(SimpleTestCase):
+
+    def setUp(self):
+        self.index = LabelIndex()
+        for article_id, labels, views in [
+            (1, 'world, sport', 0), (2, 'world, sport', 10), (3, 'sport, world', 10),
+            (4, 'world, sport, science', 0), (5, 'world', 100), (6, 'arts', 50),
+        ]:
+            self.index.add(article_id, labels, views=views)
+
+    def test_overlap_counts_shared_labels(self):
+        ids, shared, views = self.index.overlap(['world', 'science', 'unknown'])
+        self.assertEqual(ids.tolist(), [1, 2, 3, 4, 5])
+        self.assertEqual(shared.tolist(), [1, 1, 1, 2, 1])
+        self.assertEqual(views.tolist(), [0, 10, 10, 0, 100])
+        self.assertEqual(self.index.overlap(['world'], exclude_ids={1, 5})[0].tolist(), [2, 3, 4])
+        self.assertEqual(self.index.overlap(['unknown'])[0].tolist(), [])
+
+    def test_top_breaks_ties_by_keyword_views_then_newest(self):
+        labels = ['world', 'sport', 'science']
+        full = self.index.top(labels, 10, keyword_scores={1: 0.5, 9: 1.0})
+        # Shared labels first (4), then keyword score (1), then views (3 is newer than 2), then 5.
+        self.assertEqual(full, [4, 1, 3, 2, 5])
+        # Cut by the partition shortcut; the same prefix of the full order.
+        for k in range(1, 5):
+            self.assertEqual(self.index.top(labels, k, keyword_scores={1: 0.5, 9: 1.0}), full[:k])
+        self.assertEqual(self.index.top(labels, 10, exclude_ids=[4, 3]), [2, 1, 5])
+        self.assertEqual(self.index.top(labels, 0), [])
+
+    def test_add_replaces_and_remove_drops(self):
+        self.index.add(4, 'arts')
+        self.assertEqual(self.index.article_ids('science').tolist(), [])
+        self.assertEqual(self.index.article_ids('arts').tolist(), [4, 6])
+        self.index.remove(6)
+        self.assertEqual(self.index.article_ids('arts').tolist(), [4])
+
+
+@override_settings(**SAVE_SETTINGS)
+class LinkLabelsTests(TestCase):
+
+    def names(self, article):
+        return sorted(article.normalized_labels.values_list('name', flat=True))
+
+    def test_label_edits_replace_links(self):
+        article, other = make_articles(2)
+        article.labels = ' world ,sport, world'
+        article.save(update_fields=['labels'])
+        other.labels = 'sport'
+        other.save()
+        self.assertEqual(self.names(article), ['sport', 'world'])
+
+        article.labels = 'science'
+        article.save(update_fields=['labels'])
+        self.assertEqual(self.names(article), ['science'])
+        self.assertEqual(self.names(other), ['sport'])
+        self.assertEqual(list(Article.objects.filter(normalized_labels__name='world')), [])
+
+        # Saves that leave `labels` alone keep the links.
+        article.views = 3
+        article.save(update_fields=['views'])
+        self.assertEqual(self.names(article), ['science'])
+
+
+class LinkExistingLabelsMigrationTests(MigrationTestCase):
+    """0010 creates `Label` rows and links for the labels already on articles."""
+
+    before = [('articles', '0009_article_indexes_drop_views_ordering')]
+    after = [('articles', '0010_labels')]
+
+    def test_link_existing_labels(self):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                'INSERT INTO articles_article (id, title, date_added, text, labels, views, featured, time_spent_on) '
+                'VALUES (%s, %s, %s, %s, %s, 0, 0, 0)',
+                [
+                    (1, 'First', timezone.now(), 'text', ' world , sport,world'),
+                    (2, 'Second', timezone.now(), 'text', 'sport'),
+                    (3, 'Third', timezone.now(), 'text', ''),
+                ],
+            )
+        self.migrate(self.after)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT al.article_id, l.name FROM articles_article_normalized_labels al '
+                'JOIN articles_label l ON l.id = al.label_id ORDER BY al.article_id, l.name'
+            )
+            links = cursor.fetchall()
+            cursor.execute('SELECT COUNT(*) FROM articles_label')
+            labels = cursor.fetchone()[0]
+        self.assertEqual(links, [(1, 'sport'), (1, 'world'), (2, 'sport')])
+        self.assertEqual(labels, 2)
+
+
+class BanditEngineTests(SimpleTestCase):
+
+    def engine(self, policy=None):
+        engine = BanditEngine(policy=policy, seed=7)
+        engine.set_arms({1: 'world', 2: 'world, sport', 3: 'sport', 4: '', 5: 'science'})
+        return engine
+
+    def test_exclusions_are_never_picked(self):
+        for name in ('epsilon_greedy', 'thompson', 'ucb'):
+            engine = self.engine(make_policy(name))
+            engine.update(1, impressions=20, clicks=15)
+            excluded = [[1, 2], [3], [5, 4, 1]] * 30
+            for exclude_ids, picked in zip(excluded, engine.select(excluded, 2)):
+                self.assertEqual(len(picked), 2)
+                self.assertFalse(set(picked) & set(exclude_ids), name)
+
+    def test_fewer_picks_when_arms_run_out(self):
+        engine = self.engine()
+        self.assertEqual(engine.select([[1, 2, 3, 5], [1, 2, 3, 4, 5]], 3), [[4], []])
+        self.assertEqual(sorted(engine.select([()], 10)[0]), [1, 2, 3, 4, 5])
+        self.assertEqual(engine.select([], 3), [])
+
+    def test_clicks_count_only_for_served_pairs(self):
+        engine = self.engine()
+        engine.record_impressions(7, [1, 2])
+        engine.record_clicks([(7, 1), (7, 3), (8, 2), (7, 1)])
+        self.assertEqual(engine._articles.counts(1), (1.0, 1.0))
+        self.assertEqual(engine._articles.counts(2), (1.0, 0.0))
+        self.assertEqual(engine._articles.counts(3), (0.0, 0.0))
+        # Label 'world' got both impressions and the one click.
+        self.assertEqual(engine._labels.counts('world'), (2.0, 1.0))
+
+    def test_label_priors_reach_new_arms(self):
+        engine = BanditEngine(policy=EpsilonGreedy(epsilon=0.0), seed=7)
+        engine.set_arms({1: 'world', 2: 'sport'})
+        engine.update(1, impressions=100, clicks=60)
+        engine.update(2, impressions=100, clicks=2)
+        engine.set_arms({1: 'world', 2: 'sport', 3: 'world', 4: 'sport', 5: ''})
+        self.assertEqual(engine._articles.counts(1), (100.0, 60.0))
+        successes, failures = engine._posterior(bandit_settings()['PRIOR_STRENGTH'])
+        means = dict(zip(engine._ids.tolist(), (successes / (successes + failures)).tolist()))
+        self.assertGreater(means[3], means[5])
+        self.assertGreater(means[5], means[4])
+        self.assertEqual(engine.select([[1, 2]], 3), [[3, 5, 4]])
+
+    def test_prior_strength_must_be_positive(self):
+        with override_settings(HOME_BANDIT={'PRIOR_STRENGTH': 0}):
+            with self.assertRaises(ImproperlyConfigured):
+                bandit_settings()
+
+
+class MetricsRegistryTests(SimpleTestCase):
+
+    def test_prometheus_histogram_format(self):
+        metrics = MetricsRegistry()
+        metrics.histogram('test_seconds', "Test durations.", buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 0.5, 3.0):
+            metrics.observe('test_seconds', value, view='say "hi"\\now\n')
+        metrics.add_collector(lambda: [('test_gauge', "A gauge.", [({'kind': 'a'}, 2.5)])])
+        self.assertEqual(metrics.render().splitlines(), [
+            '# HELP test_seconds Test durations.',
+            '# TYPE test_seconds histogram',
+            'test_seconds_bucket{view="say \\"hi\\"\\\\now\\n",le="0.1"} 1',
+            'test_seconds_bucket{view="say \\"hi\\"\\\\now\\n",le="1.0"} 3',
+            'test_seconds_bucket{view="say \\"hi\\"\\\\now\\n",le="+Inf"} 4',
+            'test_seconds_sum{view="say \\"hi\\"\\\\now\\n"} 4.05',
+            'test_seconds_count{view="say \\"hi\\"\\\\now\\n"} 4',
+            '# HELP test_gauge A gauge.',
+            '# TYPE test_gauge gauge',
+            'test_gauge{kind="a"} 2.5',
+        ])
+
+
+@override_settings(**SAVE_SETTINGS)
+class InstrumentationMiddlewareTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        search_index.update(make_articles(3))
+
+    def request_count(self, view):
+        series = registry._histograms['articles_request_queries'][2].get((('view', view),))
+        return series.count if series is not None else 0
+
+    def test_server_timing_reports_queries(self):
+        before = self.request_count('index')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/', {'q': 'article'})
+        self.assertEqual(response.status_code, 200)
+        timings = response['Server-Timing'].split(', ')
+        self.assertTrue(timings[0].startswith('total;dur='))
+        self.assertRegex(timings[1], rf'^db;dur=[0-9.]+;desc="{len(queries)} queries"$')
+        self.assertGreater(len(queries), 0)
+        self.assertIn('search', [timing.split(';')[0] for timing in timings[2:]])
+        self.assertEqual(self.request_count('index'), before + 1)
+
+    def test_metrics_only_for_allowed_addresses(self):
+        self.client.get('/')
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('articles_request_seconds_bucket{view="index",le="+Inf"}', response.content.decode())
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.5').status_code, 403)
+        with override_settings(INSTRUMENTATION={'METRICS_ALLOWED_IPS': ('10.0.0.5',)}):
+            self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.5').status_code, 200)
@@ -0,0 +1,277 @@
+"""
+Corpus-fitted TF-IDF over `Article.text`.
+
+Terms are mapped to stable ids by hashing them into `N_FEATURES` buckets, so
+ids never depend on the order documents arrive in. The vocabulary (id -> term),
+per-term document frequencies and the document count are persisted to one
+`.npz` file and updated incrementally as articles are added, edited,
+re-vectorized or deleted; nothing is ever refitted from scratch unless `fit`
+is called.
+
+Articles store only their sparse sublinear term frequencies. IDF weighting is
+applied when scoring, so IDF changes never require rewriting stored vectors.
+`tfidf_index` keeps the active window as one IDF-weighted, row-normalized CSR
+matrix and scores a document against all of it with one sparse mat-vec.
+"""
+import os
+import re
+import tempfile
+import threading
+import zlib
+from contextlib import contextmanager
+from functools import lru_cache
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+from scipy.sparse import csr_matrix
+
+from .fields import SparseVector
+from .instrumentation import span
+
+N_FEATURES = 1 << 20
+
+TOKEN_RE = re.compile(r"[a-z0-9]{2,}")
+
+STOP_WORDS = frozenset("""
+a about after all also an and any are as at be been but by can could did do does for from had has
+have he her his how i if in into is it its just more most no not of on one or our out over said she
+so some than that the their them then there these they this to up was we were what when which who
+will with would you your
+""".split())
+
+DEFAULTS = {
+    'PATH': None,
+    'SAVE_EVERY': 100,
+}
+
+
+def tfidf_settings():
+    config = {**DEFAULTS, **getattr(settings, 'TFIDF', {})}
+    if config['PATH'] is None:
+        config['PATH'] = os.path.join(settings.BASE_DIR, 'tfidf_vocabulary.npz')
+    return config
+
+
+def tokenize(text):
+    return [token for token in TOKEN_RE.findall((text or '').lower()) if token not in STOP_WORDS]
+
+
+@lru_cache(maxsize=1 << 18)
+def term_id(term):
+    return zlib.crc32(term.encode('utf-8')) % N_FEATURES
+
+
+def analyze(text):
+    """
+    Sparse sublinear term frequencies `1 + log(count)` of `text`, and the
+    `{term_id: term}` names of its terms. Needs no vocabulary state, so it can
+    run in worker processes.
+    """
+    tokens = tokenize(text)
+    if not tokens:
+        return SparseVector([], []), {}
+    ids = [term_id(token) for token in tokens]
+    terms = dict(zip(ids, tokens))
+    indices, counts = np.unique(np.array(ids, dtype=np.int32), return_counts=True)
+    return SparseVector(indices, 1 + np.log(counts)), terms
+
+
+class TfidfVocabulary:
+    """Hashed vocabulary with incrementally maintained document frequencies."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.terms = {}
+        self.doc_freq = np.zeros(N_FEATURES, dtype=np.int32)
+        self.n_docs = 0
+        self._unsaved = 0
+        self._batching = 0
+        self._lock = threading.RLock()
+
+    @classmethod
+    def load(cls, path):
+        vocabulary = cls(path)
+        if os.path.exists(path):
+            with np.load(path) as data:
+                vocabulary.terms = dict(zip(data['ids'].tolist(), data['terms'].tolist()))
+                vocabulary.doc_freq[data['df_ids']] = data['df_values']
+                vocabulary.n_docs = int(data['n_docs'])
+        return vocabulary
+
+    def save(self, path=None):
+        """Atomically write the vocabulary and document frequencies."""
+        path = path or self.path
+        with self._lock:
+            df_ids = np.flatnonzero(self.doc_freq).astype(np.int32)
+            directory = os.path.dirname(os.path.abspath(path))
+            with tempfile.NamedTemporaryFile(dir=directory, suffix='.npz', delete=False) as handle:
+                np.savez(
+                    handle,
+                    ids=np.fromiter(self.terms.keys(), dtype=np.int32, count=len(self.terms)),
+                    terms=np.array(list(self.terms.values()), dtype=str),
+                    df_ids=df_ids,
+                    df_values=self.doc_freq[df_ids],
+                    n_docs=np.int64(self.n_docs),
+                )
+            os.replace(handle.name, path)
+            self._unsaved = 0
+
+    def transform(self, text):
+        """Sparse sublinear term frequencies of `text`; the statistics are not changed."""
+        return analyze(text)[0]
+
+    def update(self, text, previous=None):
+        """
+        Vectorize a new or changed document and fold it into the document
+        frequencies, removing `previous` (its old vector) first.
+        """
+        return self.add(*analyze(text), previous=previous)
+
+    def add(self, vector, terms=None, previous=None):
+        """`update` for a document already passed through `analyze`."""
+        with self._lock:
+            if previous is not None:
+                self.doc_freq[previous.indices] -= 1
+                self.n_docs -= 1
+            if terms:
+                for token_id, token in terms.items():
+                    self.terms.setdefault(token_id, token)
+            self.doc_freq[vector.indices] += 1
+            self.n_docs += 1
+            self._changed()
+        return vector
+
+    def remove(self, vector):
+        """Take a deleted document's vector out of the document frequencies."""
+        if vector is None:
+            return
+        with self._lock:
+            self.doc_freq[vector.indices] -= 1
+            self.n_docs -= 1
+            self._changed()
+
+    def _changed(self):
+        self._unsaved += 1
+        if self.path and not self._batching and self._unsaved >= tfidf_settings()['SAVE_EVERY']:
+            self.save()
+
+    @contextmanager
+    def batch(self):
+        """Suspend the periodic `SAVE_EVERY` saves for a bulk job and save once at the end."""
+        with self._lock:
+            self._batching += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._batching -= 1
+                if self.path and not self._batching and self._unsaved:
+                    self.save()
+
+    def fit(self, texts):
+        """Reset and rebuild the statistics from `texts`; returns their vectors."""
+        with self._lock:
+            self.terms = {}
+            self.doc_freq[:] = 0
+            self.n_docs = 0
+            return [self.update(text) for text in texts]
+
+    def idf(self, indices=None):
+        """
+        Smoothed inverse document frequency `log((1 + n) / (1 + df)) + 1`, of
+        every feature or only of `indices`.
+        """
+        doc_freq = self.doc_freq if indices is None else self.doc_freq[indices]
+        return (np.log((1.0 + self.n_docs) / (1.0 + doc_freq)) + 1.0).astype(np.float32)
+
+    def weighted_matrix(self, vectors):
+        """CSR matrix of IDF-weighted, L2-normalized rows, one per sparse vector."""
+        lengths = np.array([v.nnz if v is not None else 0 for v in vectors], dtype=np.int64)
+        indptr = np.concatenate([[0], np.cumsum(lengths)])
+        present = [v for v in vectors if v is not None]
+        indices = np.concatenate([v.indices for v in present]) if present else np.empty(0, np.int32)
+        data = np.concatenate([v.values for v in present]) if present else np.empty(0, np.float32)
+        data = data * self.idf(indices)
+        row_of_entry = np.repeat(np.arange(len(vectors)), lengths)
+        norms = np.sqrt(np.bincount(row_of_entry, weights=data ** 2, minlength=len(vectors)))
+        norms[norms == 0] = 1.0
+        data /= norms[row_of_entry].astype(np.float32)
+        return csr_matrix((data, indices, indptr), shape=(len(vectors), N_FEATURES))
+
+
+@lru_cache(maxsize=1)
+def get_vocabulary():
+    """The process-wide vocabulary, loaded from `TFIDF['PATH']` on first use."""
+    return TfidfVocabulary.load(tfidf_settings()['PATH'])
+
+
+class TfidfIndex:
+    """Active-article TF-IDF matrix, rebuilt lazily after articles change."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._matrix = None
+        self._ids = np.empty(0, dtype=np.int64)
+        self._rows = {}
+        self._dirty = True
+        self._built_at = 0.0
+        self._refresh_interval = 0
+
+    def mark_dirty(self):
+        self._dirty = True
+
+    @span('tfidf_index.rebuild')
+    def rebuild(self):
+        from .ann import ann_settings
+        from .models import ActiveArticles
+
+        rows = list(
+            ActiveArticles.objects.exclude(tfidf_vector__isnull=True)
+            .values_list('id', 'tfidf_vector')
+        )
+        with self._lock:
+            self._ids = np.array([article_id for article_id, _ in rows], dtype=np.int64)
+            self._rows = {article_id: row for row, (article_id, _) in enumerate(rows)}
+            self._matrix = get_vocabulary().weighted_matrix([vector for _, vector in rows])
+            self._dirty = False
+            self._built_at = timezone.now().timestamp()
+            self._refresh_interval = ann_settings()['REFRESH_INTERVAL']
+
+    def ensure_fresh(self):
+        if self._dirty or self._matrix is None or (
+            timezone.now().timestamp() - self._built_at >= self._refresh_interval
+        ):
+            self.rebuild()
+
+    def scores(self, vector):
+        """Cosine similarity of `vector` with every indexed article, as `(ids, scores)`."""
+        with self._lock:
+            if vector is None or vector.nnz == 0 or self._matrix is None:
+                return self._ids[:0], np.empty(0, dtype=np.float32)
+            # A dense query vector is several times faster than a sparse product.
+            query = get_vocabulary().weighted_matrix([vector]).toarray().ravel()
+            return self._ids, self._matrix @ query
+
+    def score_matrix(self, vectors):
+        """Cosine similarities of several vectors at once, as `(ids, articles x vectors scores)`."""
+        with self._lock:
+            if self._matrix is None or not vectors:
+                return self._ids[:0], np.empty((0, len(vectors)), dtype=np.float32)
+            queries = get_vocabulary().weighted_matrix(vectors)
+            return self._ids, (self._matrix @ queries.T).toarray()
+
+    def search(self, vector, k=3, exclude_ids=()):
+        """Top-k `(article_id, score)` pairs with a positive TF-IDF similarity."""
+        from .ranking import top_k_indices
+
+        ids, scores = self.scores(vector)
+        if not ids.size:
+            return []
+        scores = np.where(scores > 0, scores, -np.inf)
+        excluded = [self._rows[i] for i in exclude_ids if i in self._rows]
+        scores[excluded] = -np.inf
+        return [(int(ids[row]), float(scores[row])) for row in top_k_indices(scores, k)]
+
+
+tfidf_index = TfidfIndex()
@@ -0,0 +1,229 @@
+"""
+In-memory trending rankings of active articles and labels.
+
+`home` used to list popular articles with `order_by('-views')`, a sort of the
+active window by all-time views on every cache miss. Articles are now ranked
+by a time-decayed score: every view adds 1 and every second read adds
+TIME_WEIGHT, and contributions halve every HALF_LIFE_HOURS. Labels are
+ranked by the sum of their articles' scores.
+
+Scores use forward decay: a contribution `w` made at time `t` is stored as
+`w * exp(rate * (t - landmark))`. Every stored score decays at the same rate,
+so the order never changes as time passes. A ranking only moves when an
+article gets new views, and it is kept in sorted lists, one for all articles
+and one per label. When stored values grow large, the landmark moves forward
+and every value is rescaled, which keeps the order.
+
+Counts come from the flushes of `counters.write_counts`, which call
+`record`. Counts flushed by other processes are picked up every
+REFRESH_INTERVAL seconds by comparing stored totals with the totals seen so
+far. Counts that existed before the engine was first loaded have no
+timestamps. They are treated as made at the midpoint of the article's age.
+"""
+import bisect
+import math
+import threading
+
+from django.conf import settings
+from django.utils import timezone
+
+from .instrumentation import span
+from .labels import parse_labels
+
+DEFAULTS = {
+    'HALF_LIFE_HOURS': 6.0,
+    'TIME_WEIGHT': 1 / 60,  # one minute of reading counts as much as a view
+    'REFRESH_INTERVAL': 300,
+}
+
+# Move the landmark once stored values have grown by about e^50.
+MAX_EXPONENT = 50.0
+
+
+def trending_settings():
+    return {**DEFAULTS, **getattr(settings, 'TRENDING', {})}
+
+
+class RankedSet:
+    """Scores by id, kept in a list sorted best first, with ties broken by newest id."""
+
+    def __init__(self):
+        self._scores = {}
+        self._order = []
+
+    def __len__(self):
+        return len(self._order)
+
+    def get(self, key, default=0.0):
+        return self._scores.get(key, default)
+
+    def update(self, key, score):
+        self.remove(key)
+        self._scores[key] = score
+        bisect.insort(self._order, (-score, -key))
+
+    def remove(self, key):
+        score = self._scores.pop(key, None)
+        if score is not None:
+            del self._order[bisect.bisect_left(self._order, (-score, -key))]
+
+    def scale(self, factor):
+        """Multiply every score by a positive `factor`; the order is unchanged."""
+        self._scores = {key: score * factor for key, score in self._scores.items()}
+        self._order = [(negated * factor, negated_key) for negated, negated_key in self._order]
+
+    def __iter__(self):
+        """Keys, best first."""
+        return (-key for _, key in self._order)
+
+
+class TrendingEngine:
+    """Per-process trending state; see the module docstring."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._reset()
+        self._loaded_at = None
+
+    def _reset(self):
+        self._landmark = timezone.now().timestamp()
+        self._articles = RankedSet()
+        self._by_label = {}
+        self._label_scores = {}
+        # article id -> [labels, date_added timestamp, views seen, time seen]
+        self._meta = {}
+
+    def _rate(self):
+        return math.log(2) / (trending_settings()['HALF_LIFE_HOURS'] * 3600)
+
+    def _weight(self, views, time_spent):
+        return views + trending_settings()['TIME_WEIGHT'] * time_spent
+
+    def _add(self, article_id, weight, at):
+        """Add `weight` made at timestamp `at` to an article and its labels."""
+        rate = self._rate()
+        if rate * (at - self._landmark) > MAX_EXPONENT:
+            self._rebase(at, rate)
+        value = weight * math.exp(rate * (at - self._landmark))
+        if value <= 0:
+            return
+        labels = self._meta[article_id][0]
+        score = self._articles.get(article_id) + value
+        self._articles.update(article_id, score)
+        for label in labels:
+            self._by_label.setdefault(label, RankedSet()).update(article_id, score)
+            self._label_scores[label] = self._label_scores.get(label, 0.0) + value
+
+    def _rebase(self, now, rate):
+        factor = math.exp(-rate * (now - self._landmark))
+        self._articles.scale(factor)
+        for ranked in self._by_label.values():
+            ranked.scale(factor)
+        self._label_scores = {label: score * factor for label, score in self._label_scores.items()}
+        self._landmark = now
+
+    def _forget(self, article_id):
+        meta = self._meta.pop(article_id, None)
+        if meta is None:
+            return
+        score = self._articles.get(article_id)
+        self._articles.remove(article_id)
+        for label in meta[0]:
+            ranked = self._by_label.get(label)
+            if ranked is not None:
+                ranked.remove(article_id)
+            if label in self._label_scores:
+                self._label_scores[label] = max(self._label_scores[label] - score, 0.0)
+
+    @span('trending.sync')
+    def sync(self):
+        """
+        Load the active window's counters on first use; afterwards add what
+        other processes flushed since the last sync and drop expired articles.
+        """
+        from .models import ActiveArticles
+
+        rows = ActiveArticles.objects.values_list('id', 'labels', 'date_added', 'views', 'time_spent_on')
+        now = timezone.now().timestamp()
+        with self._lock:
+            first_load = self._loaded_at is None
+            if first_load:
+                self._reset()
+            active = set()
+            for article_id, labels, date_added, views, time_spent in rows.iterator():
+                active.add(article_id)
+                meta = self._meta.get(article_id)
+                if meta is None:
+                    meta = self._meta[article_id] = [parse_labels(labels), date_added.timestamp(), 0, 0]
+                # Totals below what was seen are flushes this process recorded
+                # before the query saw them; they are not counted twice.
+                views_delta = max(views - meta[2], 0)
+                time_delta = max(time_spent - meta[3], 0)
+                if not views_delta and not time_delta:
+                    continue
+                meta[2] += views_delta
+                meta[3] += time_delta
+                at = (meta[1] + now) / 2 if first_load else now
+                self._add(article_id, self._weight(views_delta, time_delta), at)
+            for article_id in set(self._meta) - active:
+                self._forget(article_id)
+            self._loaded_at = now
+
+    def ensure_fresh(self):
+        """Sync on first use and every REFRESH_INTERVAL seconds."""
+        now = timezone.now().timestamp()
+        if self._loaded_at is None or now - self._loaded_at >= trending_settings()['REFRESH_INTERVAL']:
+            self.sync()
+
+    def record(self, deltas):
+        """
+        Add `{article_id: (views, time_spent)}` written by this process now.
+        Articles not loaded yet are picked up by the next sync instead.
+        """
+        now = timezone.now().timestamp()
+        with self._lock:
+            if self._loaded_at is None:
+                return
+            for article_id, (views, time_spent) in deltas.items():
+                meta = self._meta.get(article_id)
+                if meta is None:
+                    continue
+                meta[2] += views
+                meta[3] += time_spent
+                self._add(article_id, self._weight(views, time_spent), now)
+
+    def _decay(self):
+        return math.exp(-self._rate() * (timezone.now().timestamp() - self._landmark))
+
+    def top(self, k, label=None, exclude_ids=()):
+        """
+        Ids of the `k` highest-scoring active articles (within `label` if given),
+        with their current decayed scores, best first.
+        """
+        from .models import active_window_start
+
+        self.ensure_fresh()
+        window_start = active_window_start().timestamp()
+        exclude_ids = set(exclude_ids)
+        with self._lock:
+            ranked = self._articles if label is None else self._by_label.get(label, RankedSet())
+            decay = self._decay()
+            results = []
+            for article_id in ranked:
+                if len(results) == k:
+                    break
+                if article_id in exclude_ids or self._meta[article_id][1] < window_start:
+                    continue
+                results.append((article_id, ranked.get(article_id) * decay))
+            return results
+
+    def top_labels(self, k):
+        """The `k` labels with the highest summed decayed scores, as `(label, score)`."""
+        self.ensure_fresh()
+        with self._lock:
+            decay = self._decay()
+            labels = sorted(self._label_scores.items(), key=lambda item: -item[1])[:k]
+            return [(label, score * decay) for label, score in labels]
+
+
+trending_engine = TrendingEngine()
@@ -1,9 +1,11 @@
 # articles/urls.py
 from django.urls import path
 from . import views
+from .instrumentation import metrics
 
 urlpatterns = [
     path('', views.index, name='index'),
-    path('home', views.home, name="home")
+    path('home', views.home, name="home"),
+    path('metrics', metrics, name='metrics'),
     # Add other URL patterns here
 ]
@@ -0,0 +1,160 @@
+"""
+Content-addressed cache of article embeddings.
+
+Vectors are keyed by a SHA-256 of the embedder version and the normalized text
+(Unicode NFC, whitespace collapsed), so re-imports, edits that leave the text
+alone and duplicate wire stories all reuse the vector computed the first time.
+Entries live in a local sqlite file shared by every process on the host and
+are evicted least-recently-used once `MAX_ENTRIES` is exceeded. Hit, miss and
+eviction counts are kept per process (see `VectorCache.stats`).
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+import numpy as np
+from django.conf import settings
+
+DEFAULTS = {
+    'ENABLED': True,
+    'PATH': None,
+    'MAX_ENTRIES': 200000,
+    'EVICT_FRACTION': 0.05,
+}
+
+WHITESPACE_RE = re.compile(r"\s+")
+
+# sqlite caps the number of bound parameters per statement.
+LOOKUP_CHUNK = 500
+
+
+def vector_cache_settings():
+    config = {**DEFAULTS, **getattr(settings, 'VECTOR_CACHE', {})}
+    if config['PATH'] is None:
+        config['PATH'] = os.path.join(settings.BASE_DIR, 'vector_cache.sqlite3')
+    return config
+
+
+def normalize_text(text):
+    return WHITESPACE_RE.sub(' ', unicodedata.normalize('NFC', text or '')).strip()
+
+
+def content_key(text, version):
+    """Hex SHA-256 of `version` and the normalized `text`."""
+    digest = hashlib.sha256(version.encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(normalize_text(text).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class VectorCache:
+    """sqlite-backed LRU map from content keys to float32 vectors."""
+
+    def __init__(self, path, max_entries=200000, evict_fraction=0.05):
+        self.path = str(path)
+        self.max_entries = max_entries
+        self.evict_fraction = evict_fraction
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS vectors ('
+                'key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)'
+            )
+            connection.execute('CREATE INDEX IF NOT EXISTS vectors_last_used ON vectors (last_used)')
+            self._local.connection = connection
+        return connection
+
+    def get_many(self, keys):
+        """Return `{key: vector}` for the keys present, marking them recently used."""
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        connection = self._connection()
+        for start in range(0, len(keys), LOOKUP_CHUNK):
+            chunk = keys[start:start + LOOKUP_CHUNK]
+            placeholders = ','.join('?' * len(chunk))
+            rows = connection.execute(
+                f'SELECT key, vector FROM vectors WHERE key IN ({placeholders})', chunk
+            ).fetchall()
+            found.update((key, np.frombuffer(vector, dtype='<f4')) for key, vector in rows)
+        if found:
+            now = time.time()
+            connection.executemany(
+                'UPDATE vectors SET last_used = ? WHERE key = ?', [(now, key) for key in found]
+            )
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def set_many(self, items):
+        """Store `{key: vector}` and evict the least recently used overflow."""
+        if not items:
+            return
+        now = time.time()
+        connection = self._connection()
+        connection.executemany(
+            'INSERT OR REPLACE INTO vectors (key, vector, last_used) VALUES (?, ?, ?)',
+            [(key, np.asarray(vector, dtype='<f4').tobytes(), now) for key, vector in items.items()],
+        )
+        self._evict(connection)
+
+    def _evict(self, connection):
+        size = connection.execute('SELECT COUNT(*) FROM vectors').fetchone()[0]
+        if size <= self.max_entries:
+            return
+        # Evict a little below the cap so the COUNT/DELETE pair is not paid on every insert.
+        excess = size - self.max_entries + int(self.max_entries * self.evict_fraction)
+        connection.execute(
+            'DELETE FROM vectors WHERE key IN (SELECT key FROM vectors ORDER BY last_used LIMIT ?)',
+            (excess,),
+        )
+        with self._lock:
+            self.evictions += excess
+
+    def __len__(self):
+        return self._connection().execute('SELECT COUNT(*) FROM vectors').fetchone()[0]
+
+    def clear(self):
+        self._connection().execute('DELETE FROM vectors')
+
+    def stats(self):
+        """Per-process hit/miss/eviction counters and the current entry count."""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'entries': len(self),
+            'max_entries': self.max_entries,
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_vector_cache():
+    """The process-wide cache, or None when `VECTOR_CACHE['ENABLED']` is False."""
+    global _cache
+    config = vector_cache_settings()
+    if not config['ENABLED']:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = VectorCache(config['PATH'], config['MAX_ENTRIES'], config['EVICT_FRACTION'])
+    return _cache
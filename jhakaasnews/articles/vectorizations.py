@@ -1,5 +1,210 @@
-def make_tfidf():
-    return []
+"""
+Text vectorization for articles.
 
-def make_embedding():
-    return []
\ No newline at end of file
+Embeddings come from one embedder per process (see `get_embedder`): a local
+sentence-transformers model when `settings.EMBEDDINGS['MODEL']` is set, or a
+deterministic feature-hashing embedder otherwise, so everything runs CPU-only
+and offline. Texts are embedded in batches sorted by length to keep padding
+(and therefore wasted transformer compute) low, and texts whose vector is
+already in the content-hash cache (`vector_cache`) are never re-embedded.
+"""
+import re
+import time
+import zlib
+from functools import lru_cache
+
+import numpy as np
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from .instrumentation import span
+from .tfidf import get_vocabulary, tfidf_index
+from .vector_cache import content_key, get_vector_cache
+
+DEFAULTS = {
+    'MODEL': None,
+    'DIM': 1024,
+    'BATCH_SIZE': 32,
+    'THREADS': None,
+    'MAX_LENGTH': 512,
+}
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+def embedding_settings():
+    return {**DEFAULTS, **getattr(settings, 'EMBEDDINGS', {})}
+
+
+class HashingEmbedder:
+    """
+    Feature-hashing bag-of-words embedder.
+
+    Unigrams and bigrams are hashed with crc32 into `dim` signed buckets,
+    weighted with sublinear term frequency and L2-normalized.
+    """
+    version = 'hashing-v1'
+
+    def __init__(self, dim=1024):
+        self.dim = dim
+
+    def _features(self, text):
+        tokens = TOKEN_RE.findall(text.lower())
+        features = tokens + [f'{a} {b}' for a, b in zip(tokens, tokens[1:])]
+        hashes = np.array([zlib.crc32(f.encode('utf-8')) for f in features], dtype=np.int64)
+        return hashes % self.dim, np.where(hashes & (1 << 31), -1.0, 1.0)
+
+    def encode(self, texts):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            if not text:
+                continue
+            buckets, signs = self._features(text)
+            np.add.at(vectors[row], buckets, signs)
+        vectors = np.sign(vectors) * np.log1p(np.abs(vectors))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+
+def set_cpu_threads(threads):
+    """Cap the CPU threads used by the model runtime, if one is installed."""
+    try:
+        import torch
+    except ImportError:
+        return
+    torch.set_num_threads(threads)
+
+
+class SentenceTransformerEmbedder:
+    """Local sentence-transformers model pinned to the CPU."""
+
+    def __init__(self, model_name, max_length=512, threads=None):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise ImproperlyConfigured(
+                "settings.EMBEDDINGS['MODEL'] requires the sentence-transformers package."
+            ) from e
+        if threads:
+            set_cpu_threads(threads)
+        self.model = SentenceTransformer(model_name, device='cpu')
+        self.model.max_seq_length = max_length
+        self.version = f'st:{model_name}'
+        self.dim = self.model.get_sentence_embedding_dimension()
+
+    def encode(self, texts):
+        return self.model.encode(
+            list(texts),
+            batch_size=len(texts),
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False,
+        ).astype(np.float32)
+
+
+@lru_cache(maxsize=1)
+def get_embedder():
+    """The process-wide embedder, loaded on first use."""
+    config = embedding_settings()
+    if config['MODEL']:
+        return SentenceTransformerEmbedder(config['MODEL'], config['MAX_LENGTH'], config['THREADS'])
+    return HashingEmbedder(config['DIM'])
+
+
+@span('vectorize.embed')
+def embed_texts(texts, batch_size=None, use_cache=True):
+    """
+    Embed many texts, batching them longest-first to minimize padding.
+
+    Texts already in the content-hash vector cache (or repeated within `texts`)
+    are not sent to the model; new vectors are written back to the cache.
+
+    Returns:
+        np.ndarray: len(texts) x dim float32 matrix in the input order.
+    """
+    embedder = get_embedder()
+    batch_size = batch_size or embedding_settings()['BATCH_SIZE']
+    texts = [text or '' for text in texts]
+    vectors = np.zeros((len(texts), embedder.dim), dtype=np.float32)
+    cache = get_vector_cache() if use_cache else None
+
+    pending = list(range(len(texts)))
+    if cache is not None:
+        keys = [content_key(text, embedder.version) for text in texts]
+        cached = cache.get_many(keys)
+        first_row = {}
+        pending = []
+        for row, key in enumerate(keys):
+            if key in cached:
+                vectors[row] = cached[key]
+            elif key in first_row:
+                continue
+            else:
+                first_row[key] = row
+                pending.append(row)
+
+    order = sorted(pending, key=lambda row: -len(texts[row]))
+    for start in range(0, len(order), batch_size):
+        rows = order[start:start + batch_size]
+        vectors[rows] = embedder.encode([texts[row] for row in rows])
+
+    if cache is not None:
+        cache.set_many({keys[row]: vectors[row] for row in pending})
+        for row, key in enumerate(keys):
+            if key not in cached and first_row[key] != row:
+                vectors[row] = vectors[first_row[key]]
+    return vectors
+
+
+def make_tfidf(text, previous=None):
+    """
+    Sparse TF-IDF term frequencies of `text`, folded into the corpus statistics.
+    Pass the article's current vector as `previous` when its text changed.
+    """
+    return get_vocabulary().update(text, previous)
+
+
+def make_embedding(text):
+    return embed_texts([text])[0]
+
+
+def bulk_generate_vectors(queryset, batch_size=None):
+    """
+    Generate and store embedding and TF-IDF vectors for every article in `queryset`.
+
+    Articles are read `batch_size` at a time (only `id`, `text` and the current
+    TF-IDF vector), embedded as one batch and written back with a single
+    `bulk_update` per batch, which skips `Article.save`; the TF-IDF index and
+    related-article lists are told about each batch instead.
+
+    Returns:
+        tuple: `(articles_processed, seconds_elapsed)`.
+    """
+    batch_size = batch_size or embedding_settings()['BATCH_SIZE']
+    started = time.perf_counter()
+    processed = 0
+    batch = []
+    with get_vocabulary().batch():
+        for article in queryset.only('id', 'text', 'tfidf_vector').iterator(chunk_size=batch_size):
+            batch.append(article)
+            if len(batch) == batch_size:
+                processed += _store_vectors(queryset.model, batch, batch_size)
+                batch = []
+        if batch:
+            processed += _store_vectors(queryset.model, batch, batch_size)
+    return processed, time.perf_counter() - started
+
+
+def _store_vectors(model, articles, batch_size):
+    vectors = embed_texts([article.text for article in articles], batch_size)
+    for article, vector in zip(articles, vectors):
+        article.vector_embedding = vector
+        article.tfidf_vector = make_tfidf(article.text, previous=article.tfidf_vector)
+    model.objects.bulk_update(articles, ['vector_embedding', 'tfidf_vector'])
+    # bulk_update skips post_save, so the listeners are notified here.
+    from .related import related_refresher
+
+    tfidf_index.mark_dirty()
+    related_refresher.articles_changed([article.pk for article in articles])
+    return len(articles)
@@ -1,72 +1,89 @@
 from django.shortcuts import render, get_object_or_404
-from django.db.models import F
-from django.db import transaction
 from django.contrib.auth.decorators import login_required
-import numpy as np
 import json
-from scipy.spatial.distance import cosine
 from .models import *
+from .bandits import bandit_settings, home_bandit
+from .caching import cache_key, cached_page, cached_response, get_or_compute
+from .collaborative import collaborative_model
+from .counters import article_counters
+from .index import article_index
+from .instrumentation import span
+from .pipeline import query_for_article, recommendation_pipeline
+from .related import related_refresher
+from .search import SearchResults
+from .trending import trending_engine
+from .ingestion import InteractionEvent, interaction_pipeline
 from django.views.decorators.http import require_POST
 from django.http import JsonResponse
-from django.db import IntegrityError
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-from django.db.models import Q
+from django.utils import timezone
 
 def index(request):
     query = request.GET.get('q')
-    articles_all = ActiveArticles.objects.all() # Use ActiveArticles
+    label = request.GET.get('label') or None
+    articles_all = ActiveArticles.objects.listing() # Use ActiveArticles
 
-    if query:
-        articles_all = articles_all.filter(Q(title__icontains=query) | Q(text__icontains=query))
-
-    featured_articles = ActiveArticles.objects.filter(featured=True) # Use ActiveArticles
+    if label:
+        # An indexed join through the normalized labels; see articles/labels.py.
+        articles_all = articles_all.filter(normalized_labels__name=label)
 
-    if featured_articles:
-        articles_all = articles_all.exclude(pk__in=[article.pk for article in featured_articles])
-        articles_all = list(featured_articles) + list(articles_all)
+    if query:
+        # Featured articles are always listed, whether or not they match the query;
+        # matches follow, ranked by the full-text index (see articles/search.py).
+        articles_all = SearchResults(query, articles_all, since=active_window_start(), label=label)
+    else:
+        # Featured first, merged and paginated in the database so a page fetches 10 rows.
+        articles_all = articles_all.order_by('-featured', '-views', '-id')
 
-    paginator = Paginator(articles_all, 10)
+    # Cached per query, label and page until articles change; see articles/caching.py.
+    articles = cached_page('index', articles_all, 10, request.GET.get('page'), query, label)
 
-    page = request.GET.get('page')
-    try:
-        articles = paginator.page(page)
-    except PageNotAnInteger:
-        articles = paginator.page(1)
-    except EmptyPage:
-        articles = paginator.page(paginator.num_pages)
-
-    return render(request, 'articles/index.html', context={'articles': articles, 'query': query})
+    return render(request, 'articles/index.html', context={'articles': articles, 'query': query, 'label': label})
 
 @require_POST
 def update_interaction(request, article_id):
-    data = json.loads(request.body)
-    time_spent = data.get('time_spent')
-    final_update = data.get('final_update', False)
-
+    if not request.user.is_authenticated:
+        return JsonResponse({'status': 'error', 'message': 'Authentication required'}, status=401)
     try:
-        interaction, _ = UserInteractions.objects.get_or_create(
-            user=request.user,
-            article_id=article_id,
-            session_id=request.session.session_key
-        )
-    except (KeyError, IntegrityError):
-        return JsonResponse({'status': 'error', 'message': 'Invalid request data or interaction already exists'}, status=400)
-
-    interaction.time_spent = time_spent
-    interaction.clicked = final_update
-    interaction.save()
+        data = json.loads(request.body)
+        time_spent = int(data.get('time_spent') or 0)
+    except (ValueError, TypeError, AttributeError):
+        return JsonResponse({'status': 'error', 'message': 'Invalid request data'}, status=400)
+    final_update = bool(data.get('final_update', False))
+    if not ActiveArticles.objects.filter(pk=article_id).exists():
+        return JsonResponse({'status': 'error', 'message': 'Article not found'}, status=404)
+
+    # Applied in batches by the ingestion worker; see articles/ingestion.py.
+    interaction_pipeline.enqueue(InteractionEvent(
+        user_id=request.user.pk,
+        article_id=article_id,
+        session_id=request.session.session_key or '',
+        time_spent=time_spent,
+        final_update=final_update,
+        created_at=timezone.now(),
+    ))
 
     return JsonResponse({'status': 'success'})
 
 def home(request):
+    if not request.user.is_authenticated:
+        # Every anonymous visitor gets the same page.
+        return cached_response(request, 'home', lambda: render_home(request))
+    return render_home(request)
+
+def render_home(request):
     total_articles = 10
 
-    featured_articles = ActiveArticles.objects.filter(featured=True)[:total_articles] # Use ActiveArticles
+    featured_articles = get_or_compute(
+        cache_key('featured', total_articles),
+        lambda: list(
+            ActiveArticles.objects.listing().filter(featured=True).order_by('-views', '-id')[:total_articles]
+        ), # Use ActiveArticles
+    )
     featured_count = len(featured_articles)
 
     remaining_articles = total_articles - featured_count
 
-    most_popular_articles = ActiveArticles.objects.order_by('-views')[:3] # Use ActiveArticles
+    most_popular_articles = get_trending_articles(3)
 
     is_new_user = not request.user.is_authenticated or not hasattr(request.user, 'userprofile')
 
@@ -74,9 +91,16 @@ def home(request):
     if is_new_user:
         remaining_articles_list = most_popular_articles[:remaining_articles]
     else:
-        remaining_articles_list = get_personalized_recommendations(request.user, remaining_articles)
+        remaining_articles_list = get_or_compute(
+            cache_key('recommendations', remaining_articles, user_id=request.user.pk),
+            lambda: get_personalized_recommendations(request.user, remaining_articles),
+        )
+
+    remaining_articles_list = list(remaining_articles_list)
+    if request.user.is_authenticated and bandit_settings()['ENABLED']:
+        remaining_articles_list = explore_articles(request.user, featured_articles, remaining_articles_list, remaining_articles)
 
-    all_articles = list(featured_articles) + remaining_articles_list
+    all_articles = featured_articles + remaining_articles_list
 
     context = {
         'articles': all_articles,
@@ -85,95 +109,117 @@ def home(request):
         'is_new_user': is_new_user,
     }
 
-    return render(request, 'articles/home.html', context)
+    with span('render'):
+        return render(request, 'articles/home.html', context)
+
+@span('recommendations.explore')
+def explore_articles(user, featured_articles, articles, num_articles):
+    """
+    `articles` cut to leave the last EXPLORE_SLOTS of `num_articles` places
+    to articles picked by the home bandit (see articles/bandits.py), which
+    are recorded as shown to `user`.
+    """
+    slots = min(bandit_settings()['EXPLORE_SLOTS'], num_articles)
+    if slots <= 0:
+        return articles
+    kept = articles[:num_articles - slots]
+    explored_ids = home_bandit.explore(user.pk, {article.id for article in featured_articles + kept}, slots)
+    rows = ActiveArticles.objects.listing().in_bulk(explored_ids)
+    return kept + [rows[article_id] for article_id in explored_ids if article_id in rows]
 
 def article_detail(request, article_id):
     article = get_object_or_404(ActiveArticles, id=article_id) # Use ActiveArticles
 
-    with transaction.atomic():
-        Article.objects.filter(id=article_id).update(views=F('views') + 1)
-        article.refresh_from_db()
+    # Buffered and written in batches; the page shows the count including
+    # increments not flushed yet. See articles/counters.py.
+    article_counters.add(article.id, views=1)
+    article_counters.merge_pending([article])
 
-    recommended_articles = get_recommended_articles(article)
+    recommended_articles = get_related_articles(article)
 
     context = {
         'article': article,
         'recommended_articles': recommended_articles,
     }
 
-    return render(request, 'articles/article.html', context)
-
+    with span('render'):
+        return render(request, 'articles/article.html', context)
+
+@span('recommendations.trending')
+def get_trending_articles(num_articles=3, label=None):
+    """
+    Active articles with the highest time-decayed views and reading time, best
+    first, from the in-memory ranking (see articles/trending.py). Topped up
+    with the most viewed articles while few have been read recently.
+    """
+    ranked = [article_id for article_id, _ in trending_engine.top(num_articles, label)]
+    rows = ActiveArticles.objects.listing().in_bulk(ranked)
+    articles = [rows[article_id] for article_id in ranked if article_id in rows]
+    if len(articles) < num_articles:
+        fallback = ActiveArticles.objects.listing().exclude(id__in=ranked)
+        if label is not None:
+            fallback = fallback.filter(normalized_labels__name=label)
+        articles += fallback.order_by('-views', '-id')[:num_articles - len(articles)]
+    return articles
+
+@span('recommendations.personalized')
 def get_personalized_recommendations(user, num_recommendations=3):
-    try:
-        user_profile = user.userprofile
-    except UserProfile.DoesNotExist:
-        return []
-
-    normalized_profiles = user_profile.get_normalized_profiles()
-    if not normalized_profiles['normalized_embedding']: #or not normalized_profiles['normalized_tfidf']:
-        return []
-    potential_recommendations = ActiveArticles.objects.exclude(userinteractions__user=user).exclude(vector_embedding__isnull=True)
-    similarities = []
-    for potential_article in potential_recommendations:
-        similarity = 1 - cosine(
-            np.array(normalized_profiles['normalized_embedding']),
-            np.array(potential_article.vector_embedding)
-        )
-        similarities.append((potential_article, similarity))
-
-    similarities.sort(key=lambda x: x[1], reverse=True)
-    recommended_articles = [article for article, _ in similarities[:num_recommendations]]
+    seen_ids = list(
+        UserInteractions.objects.filter(user=user).values_list('article_id', flat=True)
+    )
+    # Collaborative factors first (see articles/collaborative.py); the content
+    # profile when no model is trained or the user has no usable reads.
+    ranked = collaborative_model.recommend(user.pk, num_recommendations, seen_ids)
+    if not ranked:
+        try:
+            user_profile = user.userprofile
+        except UserProfile.DoesNotExist:
+            return []
+
+        normalized_profiles = user_profile.get_normalized_profiles()
+        if normalized_profiles['normalized_embedding'] is None: #or normalized_profiles['normalized_tfidf'] is None:
+            return []
+        article_index.ensure_fresh()
+        ranked = article_index.rank(
+            normalized_profiles['normalized_embedding'], num_recommendations, seen_ids=[seen_ids]
+        )[0]
+    ranked_ids = [article_id for article_id, _ in ranked]
+    articles_by_id = ActiveArticles.objects.listing().in_bulk(ranked_ids)
+    recommended_articles = [
+        articles_by_id[article_id] for article_id in ranked_ids if article_id in articles_by_id
+    ]
     return recommended_articles
 
+@span('recommendations.related')
+def get_related_articles(article, num_recommendations=3):
+    """
+    Precomputed related articles (see articles/related.py), read with one
+    indexed query and topped up with recent articles when neighbours have
+    expired. Falls back to `get_recommended_articles` until the article's
+    list has been computed.
+    """
+    related_refresher.start()
+    related = list(
+        ActiveArticles.objects.listing()
+        .filter(related_from__article_id=article.id)
+        .order_by('related_from__rank')[:num_recommendations]
+    )
+    if not related:
+        related_refresher.articles_changed([article.id])
+        return get_recommended_articles(article, num_recommendations)
+    if len(related) < num_recommendations:
+        seen_ids = {article.id, *(related_article.id for related_article in related)}
+        related += list(
+            ActiveArticles.objects.listing().exclude(id__in=seen_ids)
+            .order_by('-date_added')[:num_recommendations - len(related)]
+        )
+    return related
+
+@span('recommendations.live')
 def get_recommended_articles(article, num_recommendations=3):
-    potential_recommendations = ActiveArticles.objects.exclude(id=article.id)
-
-    vector_recommendations = []
-    if article.vector_embedding is not None:
-        articles_with_vectors = potential_recommendations.exclude(vector_embedding__isnull=True)
-        similarities = []
-        for potential_article in articles_with_vectors:
-            similarity = 1 - cosine(
-                np.array(article.vector_embedding),
-                np.array(potential_article.vector_embedding)
-            )
-            similarities.append((potential_article, similarity))
-
-        similarities.sort(key=lambda x: x[1], reverse=True)
-        vector_recommendations = [article for article, _ in similarities[:num_recommendations]]
-
-    article_labels = set(article.get_labels_list())
-    label_recommendations = []
-
-    if article_labels:
-        for potential_article in potential_recommendations:
-            potential_labels = set(potential_article.get_labels_list())
-            common_labels = article_labels.intersection(potential_labels)
-            if common_labels:
-                label_recommendations.append(
-                    (potential_article, len(common_labels))
-                )
-
-        label_recommendations.sort(key=lambda x: x[1], reverse=True)
-        label_recommendations = [article for article, _ in label_recommendations[:num_recommendations]]
-
-    all_recommendations = []
-    seen_ids = set()
-
-    for article in vector_recommendations:
-        if article.id not in seen_ids:
-            all_recommendations.append(article)
-            seen_ids.add(article.id)
-
-    for article in label_recommendations:
-        if article.id not in seen_ids and len(all_recommendations) < num_recommendations:
-            all_recommendations.append(article)
-            seen_ids.add(article.id)
-    if len(all_recommendations) < num_recommendations:
-        recent_articles = potential_recommendations.order_by('-date_added')
-        for article in recent_articles:
-            if article.id not in seen_ids and len(all_recommendations) < num_recommendations:
-                all_recommendations.append(article)
-                seen_ids.add(article.id)
-
-    return all_recommendations
\ No newline at end of file
+    """
+    Articles related to `article`, ranked live: embedding, label, keyword,
+    popularity and recency candidates blended in one pass and loaded with a
+    single query (see articles/pipeline.py).
+    """
+    return recommendation_pipeline.recommend(query_for_article(article), num_recommendations)
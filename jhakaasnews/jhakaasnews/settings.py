@@ -52,6 +52,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'articles.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -103,6 +104,228 @@ DATABASES = {
 }
 
 
+# Cache
+# Local memory is per process, so with several worker processes each keeps its
+# own copies and only sees invalidations made in that process. Use the file
+# backend ('django.core.cache.backends.filebased.FileBasedCache' with a LOCATION
+# directory) or Redis to share one cache.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'jhakaasnews',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+}
+
+
+# Page cache
+# home / index data cached per content version (bumped when articles change) and
+# per user version (bumped when the user's interactions change) for TIMEOUT
+# seconds. On a miss one request recomputes while others wait up to LOCK_WAIT.
+
+PAGE_CACHE = {
+    'ENABLED': True,
+    'ALIAS': 'default',
+    'TIMEOUT': 300,
+    'LOCK_TIMEOUT': 30,
+    'LOCK_WAIT': 5.0,
+}
+
+
+# Article similarity search
+# 'exact' scans every active article; 'ivf' (IVF-flat) and 'hnsw' (needs hnswlib)
+# trade recall for latency once the window holds at least MIN_SIZE articles.
+# Raise IVF_NPROBE / HNSW_EF_SEARCH for higher recall, lower them for speed.
+# Backends are rebuilt in a background thread; set SYNC to build them inline.
+
+ARTICLE_ANN = {
+    'BACKEND': 'ivf',
+    'MIN_SIZE': 10000,
+    'REBUILD_FRACTION': 0.1,
+    'REFRESH_INTERVAL': 300,  # seconds; reloads vectors written by other processes
+    'IVF_NLIST': None,  # defaults to sqrt(number of articles)
+    'IVF_NPROBE': 8,
+    'HNSW_M': 16,
+    'HNSW_EF_CONSTRUCTION': 200,
+    'HNSW_EF_SEARCH': 64,
+    'SYNC': False,
+}
+
+
+# Interaction ingestion
+# update_interaction only enqueues events; a background worker applies them in
+# batches of up to BATCH_SIZE, at least every FLUSH_INTERVAL seconds. Set SYNC
+# to apply each event inline (e.g. in tests).
+
+INTERACTION_INGESTION = {
+    'BATCH_SIZE': 500,
+    'FLUSH_INTERVAL': 1.0,
+    'MAX_QUEUE_SIZE': 10000,
+    'SYNC': False,
+}
+
+
+# Article counters
+# views / time_spent_on increments are buffered in memory and written in batched
+# UPDATEs every FLUSH_INTERVAL seconds, or sooner once MAX_PENDING articles have
+# pending counts. Set SYNC to write each increment immediately (e.g. in tests).
+# Defaults are in articles/counters.py; only overrides go here.
+
+ARTICLE_COUNTERS = {}
+
+
+# Recommendation pipeline
+# Live related-article ranking: each generator proposes up to CANDIDATES
+# articles, scores are scaled to [0, 1] per generator and blended with WEIGHTS
+# (0 disables a generator).
+
+RECOMMENDATION_PIPELINE = {
+    'WEIGHTS': {
+        'embedding': 1.0,
+        'labels': 0.3,
+        'keywords': 0.3,
+        'popularity': 0.05,
+        'recency': 0.02,
+    },
+    'CANDIDATES': 50,
+}
+
+
+# Label index
+# In-memory label -> active articles posting lists used by the label tier of
+# the recommenders; reloaded every REFRESH_INTERVAL seconds to pick up labels
+# written by other processes. Defaults are in articles/labels.py; only
+# overrides go here.
+
+LABEL_INDEX = {}
+
+
+# Trending
+# home's popular list ranks active articles by views plus TIME_WEIGHT per second
+# read, decaying with a half-life of HALF_LIFE_HOURS. Kept in memory; counts
+# written by other processes are merged every REFRESH_INTERVAL seconds.
+# Defaults are in articles/trending.py; only overrides go here.
+
+TRENDING = {}
+
+
+# Instrumentation
+# Per-request duration, SQL count/time and span totals are recorded per view
+# and served in the Prometheus format at /metrics to METRICS_ALLOWED_IPS. A
+# PROFILE_SAMPLE_RATE fraction of requests runs under cProfile; profiles of
+# those slower than PROFILE_SLOW_SECONDS go to PROFILE_DIR (newest PROFILE_KEEP,
+# BASE_DIR/profiles when unset). Defaults are in articles/instrumentation.py;
+# only overrides go here.
+
+INSTRUMENTATION = {}
+
+
+# Collaborative filtering
+# Implicit-feedback ALS over UserInteractions, trained by the
+# train_collaborative command into PATH and picked up by running processes.
+# Reads count with confidence 1 + ALPHA * strength; FACTORS-long user and item
+# vectors are solved over THREADS threads for ITERATIONS rounds. Other
+# defaults are in articles/collaborative.py.
+
+COLLABORATIVE = {
+    'PATH': BASE_DIR / 'collaborative_factors.npz',
+}
+
+
+# Home bandit
+# The last EXPLORE_SLOTS places of a signed-in user's home feed are picked by a
+# bandit over active articles: POLICY is 'epsilon_greedy' (EPSILON), 'thompson'
+# or 'ucb' (UCB_C). New articles start from their labels' click rate, worth
+# PRIOR_STRENGTH impressions. Clicks are credited for the last MAX_TRACKED
+# (user, article) pairs shown. Defaults are in articles/bandits.py; only
+# overrides go here.
+
+HOME_BANDIT = {}
+
+
+# User profiles
+# Reads are weighted by time spent and fade with this half-life.
+
+USER_PROFILES = {
+    'HALF_LIFE_DAYS': 7.0,
+}
+
+
+# Embeddings
+# MODEL is a local sentence-transformers model path or name; None uses the
+# offline feature-hashing embedder with DIM dimensions.
+
+EMBEDDINGS = {
+    'MODEL': None,
+    'DIM': 1024,
+    'BATCH_SIZE': 32,
+    'THREADS': None,
+    'MAX_LENGTH': 512,
+}
+
+
+# TF-IDF
+# PATH is the persisted vocabulary and document frequencies (.npz); the file is
+# rewritten after every SAVE_EVERY new or changed articles.
+
+TFIDF = {
+    'PATH': BASE_DIR / 'tfidf_vocabulary.npz',
+    'SAVE_EVERY': 100,
+}
+
+
+# Content-hash vector cache
+# Embeddings keyed by sha256(model version + normalized text) in a local sqlite
+# file, evicted least-recently-used beyond MAX_ENTRIES.
+
+VECTOR_CACHE = {
+    'ENABLED': True,
+    'PATH': BASE_DIR / 'vector_cache.sqlite3',
+    'MAX_ENTRIES': 200000,
+}
+
+
+# Near-duplicate detection
+# Imported articles whose 64-bit SimHash is within MAX_DISTANCE bits of a stored
+# article are skipped before they are vectorized, and Article.save raises
+# ValidationError for them.
+
+NEAR_DUPLICATES = {
+    'ENABLED': True,
+    'MAX_DISTANCE': 5,
+    'SHINGLE_SIZE': 1,
+}
+
+
+# Related articles
+# article_detail reads the TOP_K precomputed neighbours of each article. A
+# background worker recomputes affected lists DEBOUNCE seconds after articles
+# change and drops expired neighbours every SWEEP_INTERVAL seconds. Set SYNC to
+# recompute inline (e.g. in tests).
+
+RELATED_ARTICLES = {
+    'ENABLED': True,
+    'TOP_K': 10,
+    'BATCH_SIZE': 256,
+    'DEBOUNCE': 2.0,
+    'SWEEP_INTERVAL': 300,
+    'SYNC': False,
+}
+
+
+# Full-text search
+# index's q= search uses SQLite FTS5 (BM25) or a Postgres tsvector column; title
+# matches weigh TITLE_WEIGHT times more than text matches. HYBRID_WEIGHT > 0
+# re-ranks the top HYBRID_CANDIDATES matches by blending in embedding similarity.
+
+SEARCH = {
+    'TITLE_WEIGHT': 5.0,
+    'HYBRID_WEIGHT': 0.0,
+    'HYBRID_CANDIDATES': 200,
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 